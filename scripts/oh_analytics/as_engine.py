@@ -0,0 +1,49 @@
+'''
+Runs the temperature, water flow and open door analytics in one process. All of them receive their item changes
+from a single oh_event_bus_async, i.e. one connection to the OpenHab event stream for every watched item, on one
+asyncio event loop.
+'''
+import asyncio
+import logging
+import as_open_doors
+import as_temperature
+import as_water_flow
+import oh_backend
+import oh_event_bus
+import oh_event_bus_async
+import oh_event_coalescer
+
+def main():
+    # Configure Logger
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    # Debug File Log
+    file = logging.FileHandler("debug_as_engine.log")
+    file.setLevel(logging.INFO)
+    fileformat = logging.Formatter("%(asctime)s:%(levelname)s:%(message)s")
+    file.setFormatter(fileformat)
+    logger.addHandler(file)
+    # Critical File Log
+    cric_file = logging.FileHandler("critical_as_engine.log")
+    cric_file.setLevel(logging.CRITICAL)
+    cric_file.setFormatter(fileformat)
+    logger.addHandler(cric_file)
+    # Every analytic subscribes before the bus connects, so all items are in its topic filter. Changes missed
+    # while the stream is down are replayed from the configured persistence backend.
+    analytics_conf = oh_event_bus.read_analytics_conf()
+    history = oh_backend.open_backend(logger, analytics_conf['persistence_backend'] or oh_backend.BACKEND_INFLUXDB)
+    event_bus = oh_event_bus_async.oh_event_bus_async(logger, analytics_conf, history=history)
+    # The temperature and water flow handlers block on database / REST calls; the bus runs them on worker threads.
+    # Their changes pass the configured coalescing first so bursts do not queue up analyze_data calls.
+    coalescer = oh_event_coalescer.oh_event_coalescer(logger, event_bus, analytics_conf['event_coalescing'])
+    as_temperature.as_temperature(logger).subscribe(coalescer)
+    as_water_flow.as_water_flow(logger).subscribe(coalescer)
+    door_monitors = as_open_doors.create_door_monitors(logger, event_bus)
+    asyncio.run(run_engine(event_bus, door_monitors))
+
+async def run_engine(event_bus, door_monitors):
+    await asyncio.gather(*[door_monitor.start() for door_monitor in door_monitors])
+    await event_bus.run()
+
+if __name__ == "__main__":
+    main()
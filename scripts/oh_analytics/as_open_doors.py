@@ -1,18 +1,14 @@
 import json
-import requests
-import re
-import math
-from datetime import datetime, date, time, timedelta
+from datetime import datetime
 import logging
 import sys
 from os.path import exists
-import time
-import threading
-import async_timer
 import asyncio
+import oh_event_bus_async
 
-# This analytics script monitors door states and sends an alarm if a door is open for an extended period of time.        
-class as_open_door_monitor(threading.Thread): 
+# This analytics script monitors door states and sends an alarm if a door is open for an extended period of time.
+# All door monitors, their timers and REST writes run on one asyncio event loop and share one event bus connection.
+class as_open_door_monitor(): 
     # Globals
     _logger = None
     _analytics_conf = dict()
@@ -29,8 +25,7 @@ class as_open_door_monitor(threading.Thread):
     TIMER_INTERVAL_SECS = 1.0
 
     # Init 
-    def __init__(self, logger, name, door_uid, door_timer_uid, security_msg_uid) -> None:
-        threading.Thread.__init__(self)
+    def __init__(self, logger, name, door_uid, door_timer_uid, security_msg_uid, event_bus) -> None:
         self._logger = logger
         self._name = name
         self._door_uid = door_uid
@@ -38,45 +33,53 @@ class as_open_door_monitor(threading.Thread):
         self._security_msg_uid = security_msg_uid
         self._init_analytics_conf()
         self._logger.info(f'{self._name}: door monitor object created')
-        # Create Timer
-        self._timer = async_timer.async_timer(self._logger, self.TIMER_INTERVAL_SECS, True, self._name, self, self._timer_event)
+        # Door state changes arrive on the event bus shared by all door monitors; REST calls go through its session
+        self._event_bus = event_bus
+        event_bus.subscribe(self._door_uid, self._on_door_state_changed)
 
-    def run(self):
-        asyncio.run(self._sync_wait_on_door_change())
+    # Get the door state and start the timer (on the running event loop)
+    async def start(self):
+        await self._get_door_state()
+        self._timer = asyncio.create_task(self._run_timer())
+
+    async def _run_timer(self):
+        self._logger.info(f'{self._name} timer init done')
+        while True:
+            await self._timer_event(self._name)
+            await asyncio.sleep(self.TIMER_INTERVAL_SECS)
 
     # Set door state
-    def _set_door_state(self, state):
+    async def _set_door_state(self, state):
         if state == 'OPEN':
             self._timer_start = datetime.now()
             self._door_is_open = True
         elif state == 'CLOSED':
             self._door_is_open = False       
-            self._set_door_timer_value_oh(0)
+            await self._set_door_timer_value_oh(0)
         else:
             self._logger.warning(f'{self._name}: Attempted to set unknown door state: {state}')  
         self._logger.info(f"{self._name}:state:{self._door_is_open}")      
 
-    def _timer_event(self, timer_name, context, timer):
+    async def _timer_event(self, timer_name):
         self._logger.info(f'{timer_name} event fired - Door State: {self._door_is_open}')
         if self._door_is_open == True:
             elapsed_time = datetime.now() - self._timer_start
             seconds = elapsed_time.seconds
-            self._report_security_mgs_to_OH(f'{self._name} open for {seconds} secs')
-            self._set_door_timer_value_oh(seconds)
+            # Both writes are sent concurrently
+            await asyncio.gather(self._report_security_mgs_to_OH(f'{self._name} open for {seconds} secs'),
+                                 self._set_door_timer_value_oh(seconds))
     
     # Send a security message to OpenHab
-    def _report_security_mgs_to_OH(self, message):
-        url = f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/items/{self._security_msg_uid}/state"
-        request = requests.put(url,  auth=(self._analytics_conf['oh_token'], ''), data=str(message), headers={ "Content-Type": "text/plain" })
-        self._logger.info(f"{self._name}:security_analytics_msg:Request:put:{request.status_code}")
+    async def _report_security_mgs_to_OH(self, message):
+        status = await self._event_bus.put_state(self._security_msg_uid, message)
+        self._logger.info(f"{self._name}:security_analytics_msg:Request:put:{status}")
         self._logger.info(f"{self._name}:security_analytics_msg:{message}")
     
     # Set the open door timer value
-    def _set_door_timer_value_oh(self, open_time_seconds):
+    async def _set_door_timer_value_oh(self, open_time_seconds):
         self._logger.info(f'Setting {self._name} open time to {open_time_seconds}')
-        url = f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/items/{self._door_timer_uid}/state"
-        request = requests.put(url,  auth=(self._analytics_conf['oh_token'], ''), data=str(open_time_seconds), headers={ "Content-Type": "text/plain" })
-        self._logger.info(f"{self._name}:_set_door_timer_value_oh:Request:put:{request.status_code}")
+        status = await self._event_bus.put_state(self._door_timer_uid, open_time_seconds)
+        self._logger.info(f"{self._name}:_set_door_timer_value_oh:Request:put:{status}")
         self._logger.info(f"{self._name}:_set_door_timer_value_oh:{open_time_seconds}")
                     
     # Open Hab Globals
@@ -115,38 +118,26 @@ class as_open_door_monitor(threading.Thread):
                 self._logger.info(f'{self._name}: Default conf file written: {json_file_name}\nPlease modify conf file for your system.\nExiting.')
                 sys.exit()
 
-    async def _sync_wait_on_door_change(self):
+    async def _get_door_state(self):
         # Get door state and update
         self._logger.info(f'{self._name}: Getting door state from OpenHab')
-        openhab_url = f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/items/{self._door_uid}/state"
-        request = requests.get(openhab_url, auth=(self._analytics_conf['oh_token'], ''))
-        if request.encoding is None:
-            request.encoding = 'utf-8'
-        self._set_door_state(request.text)
-
-        # Subscribe to OpenHab item state changes and process data
+        state = await self._event_bus.get_state(self._door_uid)
+        if state != None:
+            await self._set_door_state(state)
         self._logger.info(f'{self._name}: Waiting on status change from OpenHab')
-        openhab_url = f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/events?topics=openhab/items/{self._door_uid}/statechanged"
-        request = requests.get(openhab_url, stream=True, auth=(self._analytics_conf['oh_token'], ''))
-        if request.encoding is None:
-            request.encoding = 'utf-8'
-
-
-        # Regex Parse
-        data_header_pattern = re.compile(r'{"topic":.+"ItemStateChangedEvent"}$')
-
-        for line in request.iter_lines(decode_unicode=True):
-            # Search for 'data: ' string and convert to JSON
-            matches = data_header_pattern.findall(line)
-            self._logger.info(f'{line}')
-            for match in matches:
-                match = match.replace('\\','')
-                match = match.replace('"{','{')
-                match = match.replace('}"','}')
-                json_data = json.loads(match)
-                door_state = json_data["payload"]["value"]
-                self._logger.info(f'Request text: {request.text}')
-                self._set_door_state(door_state)
+
+    async def _on_door_state_changed(self, event):
+        self._logger.info(f'{self._name}: state changed to {event.value}')
+        await self._set_door_state(event.value)
+
+# Door monitors of the house, subscribed to the given event bus
+def create_door_monitors(logger, event_bus) -> list:
+    door_monitors = list()
+    security_msg_uid = "security_analytics_msg"
+    door_monitors.append(as_open_door_monitor(logger, 'Deck Door', 'DeckDoor', 'DeckDoorOpenTimer', security_msg_uid, event_bus))
+    door_monitors.append(as_open_door_monitor(logger, 'Garage Door', 'GarageDoor', 'GarageDoorOpenTimer', security_msg_uid, event_bus))
+    door_monitors.append(as_open_door_monitor(logger, 'Front Door', 'FrontDoor', 'FrontDoorOpenTimer', security_msg_uid, event_bus))
+    return door_monitors
 
 def main():
     # Configure Logger
@@ -163,17 +154,15 @@ def main():
     cric_file.setLevel(logging.CRITICAL)
     cric_file.setFormatter(fileformat)
     logger.addHandler(cric_file)
-    # Create list of doors
-    door_monitors = list()
-    security_msg_uid = "security_analytics_msg"
-    door_monitors.append(as_open_door_monitor(logger, 'Deck Door', 'DeckDoor', 'DeckDoorOpenTimer', security_msg_uid))
-    door_monitors.append(as_open_door_monitor(logger, 'Garage Door', 'GarageDoor', 'GarageDoorOpenTimer', security_msg_uid))
-    door_monitors.append(as_open_door_monitor(logger, 'Front Door', 'FrontDoor', 'FrontDoorOpenTimer', security_msg_uid))
+    asyncio.run(run_door_monitors(logger))
+
+async def run_door_monitors(logger):
+    # Create list of doors; all doors share one connection to the OpenHab event stream
+    event_bus = oh_event_bus_async.oh_event_bus_async(logger)
+    door_monitors = create_door_monitors(logger, event_bus)
     # Start door monitors
-    for door_monitor in door_monitors:
-        door_monitor.start()
-    loop = asyncio.get_event_loop()
-    loop.run_forever()
+    await asyncio.gather(*[door_monitor.start() for door_monitor in door_monitors])
+    await event_bus.run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,13 @@
 import json
 import requests
-import re
 import math
 from datetime import datetime, date, time
 import logging
 import sys
+import oh_backend
+import oh_event_bus
+import oh_event_coalescer
+import oh_query_stats
 import oh_sql_client
 from os.path import exists
 
@@ -28,6 +31,9 @@ class as_temperature():
         self._logger.info('Temperature Analytics object init')
         self._oh_client = oh_sql_client.oh_sql_client(None)
         self._init_analytics_conf()
+        # Persistence query stats for the node_exporter textfile collector, if configured
+        if self._analytics_conf.get('query_stats_textfile') != None:
+            oh_query_stats.shared().export_textfile(self._analytics_conf['query_stats_textfile'])
         self._backlog_data()
         pass
                 
@@ -50,8 +56,9 @@ class as_temperature():
             self._analytics_conf['oh_token'] = json_obj['oh_token']
             self._analytics_conf['host'] = json_obj['host']
             self._analytics_conf['port'] = json_obj['port']
+            self._analytics_conf['event_coalescing'] = json_obj.get('event_coalescing')
+            self._analytics_conf['query_stats_textfile'] = json_obj.get('query_stats_textfile')
             self._logger.info(f'JSON conf loaded:\n{self._analytics_conf}')
-            self._openhab_url = f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/events?topics=openhab/items/{self._item_uid}/statechanged"
         except:
             self._logger.error('Error occured while reading JSON conf file.')
             # Attempt to create default conf file
@@ -69,39 +76,44 @@ class as_temperature():
 
     # Obtain backlog data
     def _backlog_data(self):
-        # Get measurements for the day and assess min / max
-        self._logger.info(f"Retrieving today's data and processing")
-        
-        daily_values = self._oh_client.get_values_for_day(self._item_uid, datetime.now())
-        for key, val in daily_values.items():
-            self.analyze_data(val)
-        self._logger.info(f"Process {len(daily_values)} previous measurements from today")
+        # Get today's and this month's min / max from the SQL server (one row per bucket)
+        self._logger.info(f"Retrieving today's and this month's min / max")
+        today_start = datetime.combine(date.today(), time.min)
+        month_start = today_start.replace(day=1)
+        for bucket, bucket_start in (('day', today_start), ('month', month_start)):
+            aggregates = self._oh_client.get_aggregates(self._item_uid, bucket_start, None, bucket=bucket, fns=('min', 'max', 'count'))
+            if aggregates == None or bucket_start not in aggregates:
+                continue
+            extremes = aggregates[bucket_start]
+            self._logger.info(f"Process {extremes['count']} previous measurements from this {bucket}")
+            if bucket == 'day':
+                self.MinTempToday = min(self.MinTempToday, extremes['min'])
+                self.MaxTempToday = max(self.MaxTempToday, extremes['max'])
+            else:
+                self.MinTempMonth = min(self.MinTempMonth, extremes['min'])
+                self.MaxTempMonth = max(self.MaxTempMonth, extremes['max'])
+        # Backlog covers the current day / month; do not reset them on the next measurement
+        self._last_timestamp = datetime.now()
         self.report_to_OH()
 
-    def wait_for_item_status_change(self):
+    # Register for temperature changes on a (shared) OpenHab event bus
+    def subscribe(self, event_bus):
         self._logger.info(f'Waiting temperature status change from Open Hab: {self._item_uid} ')
-        # Subscribe to OpenHab item state changes and process data
-        request = requests.get(self._openhab_url, stream=True, auth=(self._analytics_conf['oh_token'], ''))
-
-        if request.encoding is None:
-            request.encoding = 'utf-8'
+        event_bus.subscribe(self._item_uid, self._on_item_state_changed)
 
-        # Regex Parse
-        data_header_pattern =re.compile(r'{"topic":.+"ItemStateChangedEvent"}$')
+    # Subscribe to OpenHab item state changes on an event bus of our own and process data. Temperatures persisted
+    # while the stream was down are replayed from the SQL server after it reconnects. Bursts of changes are
+    # coalesced as configured, so each analyze_data call sees the latest temperature.
+    def wait_for_item_status_change(self):
+        event_bus = oh_event_bus.oh_event_bus(self._logger, self._analytics_conf, history=oh_backend.oh_sql_backend(self._oh_client))
+        self.subscribe(oh_event_coalescer.oh_event_coalescer(self._logger, event_bus, self._analytics_conf.get('event_coalescing')))
+        event_bus.run()
 
-        for line in request.iter_lines(decode_unicode=True):
-            # Search for 'data: ' string and convert to JSON
-            matches = data_header_pattern.findall(line)
-            
-            for match in matches:
-                match = match.replace('\\','')
-                match = match.replace('"{','{')
-                match = match.replace('}"','}')
-                json_data = json.loads(match)
-                value = float(json_data["payload"]["value"])
-                self.analyze_data(value)
-                self.report_to_OH()
-                self.logger.info(f'Weather Station Temperture: {value} deg F')
+    def _on_item_state_changed(self, event):
+        value = float(event.value)
+        self.analyze_data(value)
+        self.report_to_OH()
+        self._logger.info(f'Weather Station Temperture: {value} deg F')
 
     def analyze_data(self, new_value):
         self._logger.info(f"Analyzing Data: {new_value}")
@@ -1,12 +1,17 @@
+import asyncio
 import json
 import requests
-import re
 import math
 from datetime import datetime
 import logging
 import sys
-#import oh_sql_client
-import oh_influxdb_client
+from time import monotonic
+import oh_backend
+import oh_event_bus
+import oh_event_coalescer
+import oh_history_cache
+import oh_query_memo
+import oh_query_stats
 from os.path import exists
 
 class as_water_flow(): 
@@ -19,17 +24,20 @@ class as_water_flow():
     _todays_usage = 0
     _months_usage = 0
     _analytics_conf = dict()
-    _openhab_url = None
 
     # Init
     def __init__(self, logger) -> None:
         self._logger = logger
         self._logger.info('Water Flow Analytics object init')
         self._init_analytics_conf()
-        #self._oh_db_client = oh_sql_client.oh_sql_client(None)
-        self._oh_db_client = oh_influxdb_client.oh_influxdb_client(None)
-        self._get_first_counter_reading_for_day()
-        self._get_first_counter_reading_for_month()
+        # Persistence query stats for the node_exporter textfile collector, if configured
+        if self._analytics_conf.get('query_stats_textfile') != None:
+            oh_query_stats.shared().export_textfile(self._analytics_conf['query_stats_textfile'])
+        # Persistence backend selected by the analytics conf. First-of-day / first-of-month readings are served from
+        # the history cache after the first lookup; identical lookups in flight at the same time (day / month
+        # rollover) share one query.
+        backend = oh_backend.open_backend(None, self._analytics_conf['persistence_backend'])
+        self._oh_db_client = oh_query_memo.oh_query_memo(self._logger, oh_history_cache.oh_history_cache(self._logger, backend))
         self._get_last_value_and_init()
         pass
                 
@@ -48,6 +56,7 @@ class as_water_flow():
         self._analytics_conf['oh_token'] = 'SQL User Name'
         self._analytics_conf['host'] = 'OH SQL Host Name'
         self._analytics_conf['port'] = '3306'
+        self._analytics_conf['persistence_backend'] = oh_backend.BACKEND_INFLUXDB
 
         # Read json conf
         try:
@@ -58,8 +67,10 @@ class as_water_flow():
             self._analytics_conf['oh_token'] = json_obj['oh_token']
             self._analytics_conf['host'] = json_obj['host']
             self._analytics_conf['port'] = json_obj['port']
+            self._analytics_conf['persistence_backend'] = json_obj.get('persistence_backend', oh_backend.BACKEND_INFLUXDB)
+            self._analytics_conf['event_coalescing'] = json_obj.get('event_coalescing')
+            self._analytics_conf['query_stats_textfile'] = json_obj.get('query_stats_textfile')
             self._logger.info(f'JSON conf loaded:\n{self._analytics_conf}')
-            self._openhab_url = f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/events?topics=openhab/items/{self._water_flow_counter_uid}/statechanged"
         except:
             self._logger.error('Error occured while reading JSON conf file.')
             # Attempt to create default conf file
@@ -75,50 +86,75 @@ class as_water_flow():
                 self._logger.info(f'Default conf file written: {json_file_name}\nPlease modify conf file for your system.\nExiting.')
                 sys.exit()
 
-    # Get the last value and update daily and monthly on init
+    # Get the first-of-day / first-of-month readings and the last value, then update daily and monthly on init
     def _get_last_value_and_init(self):
-        last_value = self._oh_db_client.get_last_value(self._water_flow_counter_uid)
-        self.process_new_data(last_value)
+        last_value = self._query_startup_readings()
+        if last_value == None:
+            self._logger.warning(f'No persisted value for {self._water_flow_counter_uid}')
+            return
+        self.process_new_data(last_value.value)
         self.report_to_OH()
 
+    # Run the three startup queries concurrently and report the startup latency
+    def _query_startup_readings(self):
+        start = monotonic()
+        last_value = asyncio.run(self._query_startup_readings_async())
+        self._logger.info(f'Startup queries completed in {monotonic() - start:.3f} s')
+        return last_value
+
+    # The startup queries on an asyncio backend of their own, closed on the loop that opened it
+    async def _query_startup_readings_async(self):
+        self._logger.info("Retrieving today's and this month's water flow counter values")
+        backend = oh_backend.open_backend_async(None, self._analytics_conf['persistence_backend'])
+        try:
+            now = datetime.now()
+            first_of_day, first_of_month, last_value = await asyncio.gather(backend.get_first_value_for_day(self._water_flow_counter_uid, now),
+                                                                            backend.get_first_value_for_month(self._water_flow_counter_uid, now),
+                                                                            backend.get_last_value(self._water_flow_counter_uid))
+        finally:
+            await backend.close()
+        self._set_first_counter_reading_for_day(first_of_day)
+        self._set_first_counter_reading_for_month(first_of_month)
+        return last_value
+
     # Get the first counter reading for the day
     def _get_first_counter_reading_for_day(self):
         # Get measurements for the day and assess min / max
         self._logger.info(f"Retrieving today's water flow counter value")
-        self._todays_absolute_value  = self._oh_db_client.get_first_value_for_day(self._water_flow_counter_uid, datetime.now())
+        self._set_first_counter_reading_for_day(self._oh_db_client.get_first_value_for_day(self._water_flow_counter_uid, datetime.now()))
+
+    def _set_first_counter_reading_for_day(self, first_value):
+        self._todays_absolute_value = first_value.value if first_value != None else None
         self._logger.info(f"Today's starting value: {self._todays_absolute_value} gallons")
 
     def _get_first_counter_reading_for_month(self):
         # Get the first counter reading for the month
         self._logger.info(f"Retrieving this month's water flow counter value")
-        self._months_absolute_value = self._oh_db_client.get_first_value_for_month(self._water_flow_counter_uid, datetime.now())
+        self._set_first_counter_reading_for_month(self._oh_db_client.get_first_value_for_month(self._water_flow_counter_uid, datetime.now()))
+
+    def _set_first_counter_reading_for_month(self, first_value):
+        self._months_absolute_value = first_value.value if first_value != None else None
         self._logger.info(f"Month's starting value: {self._months_absolute_value} gallons")
     
+    # Register for flow counter changes on a (shared) OpenHab event bus
+    def subscribe(self, event_bus):
+        self._logger.info(f'Waiting water flow counter change from Open Hab: {self._water_flow_counter_uid} ')
+        event_bus.subscribe(self._water_flow_counter_uid, self._on_item_state_changed)
+
     # Updates the daily and monthly water usage. Values updated based on flow counter change from OH3.
     def wait_for_item_status_change(self):
-        self._logger.info(f'Waiting water flow counter change from Open Hab: {self._water_flow_counter_uid} ')
-        # Subscribe to OpenHab item state changes and process data
-        request = requests.get(self._openhab_url, stream=True, auth=(self._analytics_conf['oh_token'], ''))
-
-        if request.encoding is None:
-            request.encoding = 'utf-8'
-
-        # Regex Parse
-        data_header_pattern =re.compile(r'{"topic":.+"ItemStateChangedEvent"}$')
-
-        for line in request.iter_lines(decode_unicode=True):
-            # Search for 'data: ' string and convert to JSON
-            matches = data_header_pattern.findall(line)
-            # Iterate through matches and clean up for JSON parse
-            for match in matches:
-                match = match.replace('\\','')
-                match = match.replace('"{','{')
-                match = match.replace('}"','}')
-                json_data = json.loads(match)
-                value = float(json_data["payload"]["value"])
-                self._logger.info(f'Water Flow Counter: {value} gallons')
-                self.process_new_data(value)
-                self.report_to_OH()
+        # Subscribe to OpenHab item state changes on an event bus of our own and process data. Counter changes
+        # persisted while the stream was down are replayed from the persistence backend after it reconnects. Bursts
+        # of counter changes are coalesced as configured.
+        event_bus = oh_event_bus.oh_event_bus(self._logger, self._analytics_conf, history=self._oh_db_client)
+        self.subscribe(oh_event_coalescer.oh_event_coalescer(self._logger, event_bus, self._analytics_conf.get('event_coalescing')))
+        event_bus.run()
+
+    def _on_item_state_changed(self, event):
+        value = float(event.value)
+        self._logger.info(f'Water Flow Counter: {value} gallons')
+        self.process_new_data(value)
+        self.report_to_OH()
 
     # Update Daily and Monthly Usage after Counter Change
     def process_new_data(self, new_value):
@@ -126,7 +162,7 @@ class as_water_flow():
         if self._LastTimeStamp is None:
             self._LastTimeStamp  = datetime.now()
 
-        # Check if min/max values should be reset
+        # Check if min/max values should be reset. The readings are plain backend calls on the calling (bus) thread.
         now = datetime.now()
         # Reset Day
         if now.day != self._LastTimeStamp.day:
@@ -0,0 +1,170 @@
+'''
+Cross-backend benchmark: runs the same oh_backend query mix against the SQL and the InfluxDB backends and reports
+latency and throughput per query. Both use local stand-ins holding the same data: the SQLite stand-in of
+bench_sql_client for SQL, and a small HTTP server that answers the Flux queries of oh_influxdb_client with
+annotated CSV for InfluxDB. No MariaDB or InfluxDB server is required.
+'''
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import median
+from time import perf_counter
+import bench_sql_client
+import oh_backend
+import oh_influxdb_client
+
+# Benchmark Globals
+ITEM_COUNT = 200
+ROWS_PER_ITEM = 600
+QUERY_COUNT = 300
+
+# Read the stand-in DB into { item name: [(time, value)] } so both backends serve identical data
+def load_series(db_path, item_names) -> dict:
+    connection = sqlite3.connect(db_path)
+    series = dict()
+    for (item_num, item_name) in enumerate(item_names, 1):
+        rows = connection.execute(f'SELECT time, value FROM item{item_num:04} ORDER BY time').fetchall()
+        series[item_name] = [(datetime.fromisoformat(time), value) for (time, value) in rows]
+    connection.close()
+    return series
+
+# Answers the Flux query shapes of oh_flux_query from an in-memory series. Times are naive UTC like the Flux params.
+class standin_influxdb_handler(BaseHTTPRequestHandler):
+
+    series = dict()
+
+    def log_message(self, format, *args):
+        pass
+
+    # /ping
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    # /api/v2/query
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        params = {statement['assignment']['id']['name']: self._literal(statement['assignment']['init'])
+                  for statement in body.get('extern', {}).get('body', [])}
+        (datatype, rows) = self._rows(body['query'], params)
+        lines = list()
+        if len(rows) > 0:
+            if len(body.get('dialect', {}).get('annotations', ['datatype'])) > 0:
+                lines += [f'#datatype,string,long,dateTime:RFC3339,{datatype},string', '#group,false,false,false,false,true',
+                          '#default,_result,,,,']
+            lines.append(',result,table,_time,_value,_measurement')
+            lines += [f',,0,{time.isoformat()}Z,{value},{name}' for (name, time, value) in rows]
+        payload = ('\r\n'.join(lines) + '\r\n').encode('utf-8') if len(lines) > 0 else b''
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _literal(self, node):
+        if node['type'] == 'DateTimeLiteral':
+            return datetime.fromisoformat(node['value'].rstrip('Z')[:26])
+        if node['type'] == 'ArrayExpression':
+            return [self._literal(element) for element in node['elements']]
+        if node['type'] == 'DurationLiteral':
+            return datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(microseconds=node['values'][0]['magnitude'])
+        if node['type'] == 'UnaryExpression':
+            return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(microseconds=node['argument']['values'][0]['magnitude'])
+        return node.get('value')
+
+    # (datatype of _value, [(measurement, time, value)])
+    def _rows(self, query, params) -> tuple:
+        if 'schema.measurements' in query:
+            return ('string', [(name, datetime(1970, 1, 1), name) for name in sorted(self.series)])
+        start = params.get('start', datetime.min)
+        stop = params.get('stop', datetime.max)
+        if 'params.items' in query:
+            names = params['items']
+        elif 'params.item' in query:
+            names = [params['item']]
+        else:
+            names = sorted(self.series)
+        rows = list()
+        for name in names:
+            window = [(time, value) for (time, value) in self.series.get(name, []) if start <= time < stop]
+            if 'count()' in query:
+                return ('long', [(name, start, len(window))])
+            if 'first()' in query:
+                window = window[:1]
+            elif 'last()' in query:
+                window = window[-1:]
+            rows += [(name, time, value) for (time, value) in window]
+        return ('double', rows)
+
+# oh_influxdb_client pointed at the stand-in server instead of reading influxdb_conf.json
+class standin_influxdb_client(oh_influxdb_client.oh_influxdb_client):
+
+    def __init__(self, logger, url) -> None:
+        self._url = url
+        super().__init__(logger)
+
+    def _init_server_conf(self):
+        self._connection_conf = {'url': self._url, 'token': 'bench', 'org': 'bench', 'bucket': 'bench'}
+
+# Start the stand-in InfluxDB server on a free local port with the series shifted to UTC
+def start_standin_influxdb(series) -> ThreadingHTTPServer:
+    utc_offset = datetime.now().astimezone().utcoffset()
+    standin_influxdb_handler.series = {name: [(time - utc_offset, value) for (time, value) in rows] for (name, rows) in series.items()}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), standin_influxdb_handler)
+    threading.Thread(target=server.serve_forever, name='standin_influxdb', daemon=True).start()
+    return server
+
+# The query mix: name -> fn(backend, item name). get_last_values is left out: its UNION of parenthesized
+# SELECTs is MariaDB syntax that the SQLite stand-in does not accept.
+def query_mix() -> dict:
+    now = datetime.now()
+    return {
+        'get_last_value': lambda backend, name: backend.get_last_value(name),
+        'get_first_value_for_day': lambda backend, name: backend.get_first_value_for_day(name, now),
+        'get_values_for_day': lambda backend, name: backend.get_values_for_day(name, now),
+        'get_values_between (1h)': lambda backend, name: backend.get_values_between(name, now - timedelta(hours=1), now),
+        'get_row_count': lambda backend, name: backend.get_row_count(name),
+    }
+
+# Run each query of the mix query_count times; returns { query: (median latency ms, queries/s, rows/s) }
+def bench_backend(backend, item_names, query_count=QUERY_COUNT) -> dict:
+    results = dict()
+    for (query, fn) in query_mix().items():
+        latencies = list()
+        rows = 0
+        start = perf_counter()
+        for n in range(query_count):
+            query_start = perf_counter()
+            result = fn(backend, item_names[n % len(item_names)])
+            latencies.append(perf_counter() - query_start)
+            rows += len(result) if isinstance(result, list) else 1
+        elapsed = perf_counter() - start
+        results[query] = (median(latencies) * 1000, query_count / elapsed, rows / elapsed)
+    return results
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'oh_bench.db')
+        item_names = bench_sql_client.create_stand_in_db(db_path, ITEM_COUNT, ROWS_PER_ITEM)
+        server = start_standin_influxdb(load_series(db_path, item_names))
+        backends = {
+            oh_backend.BACKEND_SQL: oh_backend.oh_sql_backend(bench_sql_client.sqlite_sql_client(logger, db_path)),
+            oh_backend.BACKEND_INFLUXDB: oh_backend.oh_influxdb_backend(standin_influxdb_client(logger, f'http://127.0.0.1:{server.server_port}')),
+        }
+        print(f'Stand-in data: {len(item_names)} items x {ROWS_PER_ITEM} rows, {QUERY_COUNT} queries per shape')
+        print(f'{"backend":10} {"query":26} {"median ms":>10} {"queries/s":>10} {"rows/s":>12}')
+        for (backend_name, backend) in backends.items():
+            for (query, (latency_ms, qps, rows_per_sec)) in bench_backend(backend, item_names).items():
+                print(f'{backend_name:10} {query:26} {latency_ms:10.3f} {qps:10.1f} {rows_per_sec:12.1f}')
+            backend.close()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+'''
+Benchmark for oh_sql_client against a local SQLite stand-in of the OpenHab JDBC persistence schema
+(an 'items' table plus one itemXXXX table per item). No MariaDB server is required.
+'''
+import logging
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+import oh_sql_client
+
+# Benchmark Globals
+ITEM_COUNT = 900
+ROWS_PER_ITEM = 200
+QUERY_COUNT = 2000
+
+# SQLite connection with the ping() used by the pool's liveness check
+class pingable_sqlite_connection(sqlite3.Connection):
+
+    def ping(self):
+        self.execute('SELECT 1')
+
+# oh_sql_client that reads a SQLite file instead of connecting to MariaDB
+class sqlite_sql_client(oh_sql_client.oh_sql_client):
+
+    # sqlite3 cursors stream rows already and take no options; sqlite3 prepares and caches statements by SQL text
+    STREAM_CURSOR_ARGS = {}
+    PREPARED_CURSOR_ARGS = {}
+
+    def __init__(self, logger, db_path, item_index_ttl_secs=oh_sql_client.oh_sql_client.ITEM_INDEX_TTL_SECS) -> None:
+        self._db_path = db_path
+        super().__init__(logger, item_index_ttl_secs)
+
+    def _init_server_conf(self):
+        pass
+
+    def _new_connection(self):
+        return sqlite3.connect(self._db_path, factory=pingable_sqlite_connection, check_same_thread=False)
+
+    # SQLite has no information_schema; the declared type of each table's value column comes from its schema
+    def get_value_types(self) -> dict:
+        with self._cursor('value_types') as cursor:
+            if cursor == None:
+                return None
+            cursor.execute("SELECT tables.name, columns.type FROM sqlite_master AS tables, pragma_table_info(tables.name) AS columns "
+                           "WHERE tables.type = 'table' AND columns.name = 'value'")
+            return {table_name.lower(): column_type.upper() for (table_name, column_type) in cursor}
+
+# Create the stand-in database and return the list of item names
+def create_stand_in_db(db_path, item_count=ITEM_COUNT, rows_per_item=ROWS_PER_ITEM) -> list:
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    cursor.execute('CREATE TABLE items (ItemId INTEGER PRIMARY KEY, ItemName TEXT)')
+    item_names = list()
+    start = datetime.now() - timedelta(minutes=rows_per_item)
+    for item_num in range(1, item_count + 1):
+        item_name = f'Bench_Item_{item_num}'
+        item_names.append(item_name)
+        cursor.execute('INSERT INTO items VALUES (?, ?)', (item_num, item_name))
+        cursor.execute(f'CREATE TABLE item{item_num:04} (time DATETIME PRIMARY KEY, value DOUBLE)')
+        rows = [(str(start + timedelta(minutes=n)), float(n)) for n in range(rows_per_item)]
+        cursor.executemany(f'INSERT INTO item{item_num:04} VALUES (?, ?)', rows)
+    connection.commit()
+    connection.close()
+    return item_names
+
+# Run get_last_value over the item list and return queries per second
+def bench_get_last_value(client, item_names, query_count=QUERY_COUNT) -> float:
+    start = perf_counter()
+    for n in range(query_count):
+        client.get_last_value(item_names[n % len(item_names)])
+    return query_count / (perf_counter() - start)
+
+# Day window bounds as the client builds them
+def day_bounds(day) -> tuple:
+    return (datetime(day.year, day.month, day.day, 0, 0, 0), datetime(day.year, day.month, day.day, 23, 59, 59))
+
+# Parse-cost micro-benchmark: literal f-string statements (a new statement text per table and day) against the
+# client's cached statements with the time bounds bound as parameters. Returns queries per second for each.
+def bench_statement_cache(client, item_names, query_count=QUERY_COUNT) -> dict:
+    tables = client.resolve_tables(item_names)
+    days = [datetime.now() - timedelta(days=n) for n in range(query_count)]
+    results = dict()
+    with client._get_pool().connection() as pooled:
+        # get_last_value
+        start = perf_counter()
+        for n in range(query_count):
+            cursor = pooled.cursor()
+            cursor.execute(f'SELECT * FROM {tables[item_names[n % len(item_names)]]} ORDER BY time DESC LIMIT 1')
+            cursor.fetchone()
+            cursor.close()
+        results['last literal'] = query_count / (perf_counter() - start)
+        start = perf_counter()
+        for n in range(query_count):
+            query = client._statement('last', tables[item_names[n % len(item_names)]])
+            cursor = pooled.prepared(query, **client.PREPARED_CURSOR_ARGS)
+            cursor.execute(query)
+            cursor.fetchone()
+        results['last prepared'] = query_count / (perf_counter() - start)
+        # Day window
+        start = perf_counter()
+        for n in range(query_count):
+            startDate, endDate = day_bounds(days[n])
+            cursor = pooled.cursor()
+            cursor.execute(f"SELECT * FROM {tables[item_names[n % len(item_names)]]} WHERE time >= '{startDate}' AND time < '{endDate}'")
+            cursor.fetchall()
+            cursor.close()
+        results['day literal'] = query_count / (perf_counter() - start)
+        start = perf_counter()
+        for n in range(query_count):
+            query = client._statement('range', tables[item_names[n % len(item_names)]])
+            cursor = pooled.prepared(query, **client.PREPARED_CURSOR_ARGS)
+            cursor.execute(query, day_bounds(days[n]))
+            cursor.fetchall()
+        results['day prepared'] = query_count / (perf_counter() - start)
+    return results
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'oh_bench.db')
+        item_names = create_stand_in_db(db_path)
+        print(f'Stand-in DB: {len(item_names)} items x {ROWS_PER_ITEM} rows')
+        # TTL of 0 re-reads the items table on every call (the behaviour before the index cache)
+        uncached_qps = bench_get_last_value(sqlite_sql_client(logger, db_path, item_index_ttl_secs=0), item_names)
+        print(f'get_last_value without item index: {uncached_qps:10.1f} queries/s')
+        cached_qps = bench_get_last_value(sqlite_sql_client(logger, db_path), item_names)
+        print(f'get_last_value with item index:    {cached_qps:10.1f} queries/s ({cached_qps / uncached_qps:.1f}x)')
+        client = sqlite_sql_client(logger, db_path)
+        start = perf_counter()
+        tables = client.resolve_tables(item_names)
+        print(f'resolve_tables({len(tables)} items): {(perf_counter() - start) * 1000:.2f} ms')
+        # Statement cache: same tables, literal vs parameterized statements
+        results = bench_statement_cache(client, item_names[:50])
+        for shape, label in (('last', 'get_last_value'), ('day', 'day window    ')):
+            literal_qps = results[f'{shape} literal']
+            prepared_qps = results[f'{shape} prepared']
+            print(f'{label} literal statements: {literal_qps:10.1f} queries/s')
+            print(f'{label} cached statements:  {prepared_qps:10.1f} queries/s ({prepared_qps / literal_qps:.1f}x)')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+'''
+Common storage-backend interface for the analytics. oh_sql_client and oh_influxdb_client answer the same questions with
+different return shapes (row tuples and dict < time, value > from SQL, scalars and record dicts from InfluxDB).
+The adapters here return the types of the oh_backend protocol for both, and open_backend() picks one by name
+(the 'persistence_backend' entry of oh_analytics_conf.json). open_backend_async() does the same on the asyncio
+clients (oh_sql_client_async, oh_influxdb_client_async); its adapters have the same methods as coroutines.
+Times are naive local datetimes, as stored by the OpenHab JDBC persistence.
+'''
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Protocol
+
+# Backend names accepted by open_backend
+BACKEND_SQL = 'sql'
+BACKEND_INFLUXDB = 'influxdb'
+
+# One persisted state of an item
+class oh_sample(NamedTuple):
+    time: datetime
+    value: float
+
+class oh_backend(Protocol):
+
+    def get_item_names(self) -> List[str]: ...
+
+    def get_last_value(self, oh_item_name) -> Optional[oh_sample]: ...
+
+    # Items without a persisted state are left out
+    def get_last_values(self, oh_item_names) -> Dict[str, oh_sample]: ...
+
+    def get_row_count(self, oh_item_name) -> Optional[int]: ...
+
+    def get_first_value_for_day(self, oh_item_name, day) -> Optional[oh_sample]: ...
+
+    def get_first_value_for_month(self, oh_item_name, month) -> Optional[oh_sample]: ...
+
+    # None if the backend cannot be reached (an empty list is a window without rows)
+    def get_values_for_day(self, oh_item_name, day) -> Optional[List[oh_sample]]: ...
+
+    def get_values_for_month(self, oh_item_name, month) -> Optional[List[oh_sample]]: ...
+
+    # start <= time < end, in time order; None if the backend cannot be reached
+    def get_values_between(self, oh_item_name, start, end) -> Optional[List[oh_sample]]: ...
+
+    # time > since, in time order; None if the backend cannot be reached
+    def get_values_since(self, oh_item_name, since) -> Optional[List[oh_sample]]: ...
+
+    def close(self): ...
+
+# Persisted values are numeric for the analytics; anything else (e.g. a String item) is passed through as stored
+def _value(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def _local_time(time) -> datetime:
+    if isinstance(time, datetime) and time.tzinfo != None:
+        return time.astimezone().replace(tzinfo=None)
+    return time
+
+def _sample(time, value) -> oh_sample:
+    return oh_sample(_local_time(time), _value(value))
+
+# dict < time, value > (oh_sql_client) to a list of samples; a failed query (None) stays None
+def _samples(measurements) -> Optional[List[oh_sample]]:
+    if measurements == None:
+        return None
+    return [_sample(time, value) for (time, value) in measurements.items()]
+
+# An InfluxDB client's day / month window taken as local time, like the SQL backend, as aware datetimes
+def _local_window(window) -> tuple:
+    start, stop = window
+    return (start.astimezone(), stop.astimezone())
+
+def _first_sample(measurements) -> Optional[oh_sample]:
+    samples = _samples(measurements)
+    return samples[0] if samples else None
+
+class oh_sql_backend():
+
+    def __init__(self, client) -> None:
+        self._client = client
+
+    def get_item_names(self) -> List[str]:
+        item_list = self._client.get_item_list()
+        return list(item_list.values()) if item_list != None else list()
+
+    def get_last_value(self, oh_item_name) -> Optional[oh_sample]:
+        row = self._client.get_last_value(oh_item_name)
+        return _sample(row[0], row[1]) if row != None else None
+
+    def get_last_values(self, oh_item_names) -> Dict[str, oh_sample]:
+        last_values = self._client.get_last_values(oh_item_names)
+        if last_values == None:
+            return dict()
+        return {oh_item_name: _sample(time, value) for (oh_item_name, (time, value)) in last_values.items()}
+
+    def get_row_count(self, oh_item_name) -> Optional[int]:
+        row = self._client.get_row_count(oh_item_name)
+        return int(row[0]) if row != None else None
+
+    def get_first_value_for_day(self, oh_item_name, day) -> Optional[oh_sample]:
+        return _first_sample(self._client.get_first_value_for_day(oh_item_name, day))
+
+    def get_first_value_for_month(self, oh_item_name, month) -> Optional[oh_sample]:
+        return _first_sample(self._client.get_first_value_for_month(oh_item_name, month))
+
+    def get_values_for_day(self, oh_item_name, day) -> Optional[List[oh_sample]]:
+        return _samples(self._client.get_values_for_day(oh_item_name, day))
+
+    def get_values_for_month(self, oh_item_name, month) -> Optional[List[oh_sample]]:
+        return _samples(self._client.get_values_for_month(oh_item_name, month))
+
+    # The multi-item query returns None when the database cannot be reached (a stream would just end); an unknown
+    # item has no rows
+    def get_values_between(self, oh_item_name, start, end) -> Optional[List[oh_sample]]:
+        values = self._client.get_values_between([oh_item_name], start, end)
+        return _samples(values.get(oh_item_name, dict())) if values != None else None
+
+    def get_values_since(self, oh_item_name, since) -> Optional[List[oh_sample]]:
+        return _samples(self._client.get_values_since(oh_item_name, since))
+
+    def close(self):
+        self._client.close()
+
+class oh_influxdb_backend():
+
+    def __init__(self, client) -> None:
+        self._client = client
+
+    def get_item_names(self) -> List[str]:
+        item_list = self._client.get_item_list()
+        return list(item_list.values()) if item_list != None else list()
+
+    # get_last_value only returns the value; the snapshot query carries the time as well
+    def get_last_value(self, oh_item_name) -> Optional[oh_sample]:
+        return self.get_last_values([oh_item_name]).get(oh_item_name)
+
+    def get_last_values(self, oh_item_names) -> Dict[str, oh_sample]:
+        last_values = self._client.get_last_values(oh_item_names)
+        if last_values == None:
+            return dict()
+        return {oh_item_name: _sample(time, value) for (oh_item_name, (time, value)) in last_values.items()}
+
+    def get_row_count(self, oh_item_name) -> Optional[int]:
+        count = self._client.get_row_count(oh_item_name)
+        return int(count) if count != None else None
+
+    # First (time, value) of a window; the server returns only that point
+    def _first_in_window(self, oh_item_name, window) -> Optional[oh_sample]:
+        start, stop = _local_window(window)
+        first = self._client.get_first_sample(oh_item_name, start, stop)
+        return _sample(*first) if first != None else None
+
+    def get_first_value_for_day(self, oh_item_name, day) -> Optional[oh_sample]:
+        return self._first_in_window(oh_item_name, self._client._day_window(day))
+
+    def get_first_value_for_month(self, oh_item_name, month) -> Optional[oh_sample]:
+        return self._first_in_window(oh_item_name, self._client._month_window(month))
+
+    def get_values_for_day(self, oh_item_name, day) -> Optional[List[oh_sample]]:
+        return self.get_values_between(oh_item_name, *_local_window(self._client._day_window(day)))
+
+    def get_values_for_month(self, oh_item_name, month) -> Optional[List[oh_sample]]:
+        return self.get_values_between(oh_item_name, *_local_window(self._client._month_window(month)))
+
+    # Local time (naive or aware) to an aware datetime, which the client sends as UTC. The stream just ends when the
+    # server cannot be reached, so the connection is checked first.
+    def get_values_between(self, oh_item_name, start, end) -> Optional[List[oh_sample]]:
+        if not self._client._connect():
+            return None
+        return [_sample(time, value) for (time, value) in self._client.iter_values(oh_item_name, start.astimezone(), end.astimezone())]
+
+    # Local time to an aware datetime, which the client sends as UTC
+    def get_values_since(self, oh_item_name, since) -> Optional[List[oh_sample]]:
+        return _samples(self._client.get_values_since(oh_item_name, since.astimezone()))
+
+    def close(self):
+        self._client.close()
+
+# oh_sql_backend on oh_sql_client_async
+class oh_sql_backend_async():
+
+    def __init__(self, client) -> None:
+        self._client = client
+
+    async def get_item_names(self) -> List[str]:
+        item_list = await self._client.get_item_list()
+        return list(item_list.values()) if item_list != None else list()
+
+    async def get_last_value(self, oh_item_name) -> Optional[oh_sample]:
+        row = await self._client.get_last_value(oh_item_name)
+        return _sample(row[0], row[1]) if row != None else None
+
+    async def get_last_values(self, oh_item_names) -> Dict[str, oh_sample]:
+        last_values = await self._client.get_last_values(oh_item_names)
+        if last_values == None:
+            return dict()
+        return {oh_item_name: _sample(time, value) for (oh_item_name, (time, value)) in last_values.items()}
+
+    async def get_row_count(self, oh_item_name) -> Optional[int]:
+        row = await self._client.get_row_count(oh_item_name)
+        return int(row[0]) if row != None else None
+
+    async def get_first_value_for_day(self, oh_item_name, day) -> Optional[oh_sample]:
+        return _first_sample(await self._client.get_first_value_for_day(oh_item_name, day))
+
+    async def get_first_value_for_month(self, oh_item_name, month) -> Optional[oh_sample]:
+        return _first_sample(await self._client.get_first_value_for_month(oh_item_name, month))
+
+    async def get_values_for_day(self, oh_item_name, day) -> Optional[List[oh_sample]]:
+        return _samples(await self._client.get_values_for_day(oh_item_name, day))
+
+    async def get_values_for_month(self, oh_item_name, month) -> Optional[List[oh_sample]]:
+        return _samples(await self._client.get_values_for_month(oh_item_name, month))
+
+    async def get_values_between(self, oh_item_name, start, end) -> Optional[List[oh_sample]]:
+        values = await self._client.get_values_between([oh_item_name], start, end)
+        return _samples(values.get(oh_item_name, dict())) if values != None else None
+
+    async def get_values_since(self, oh_item_name, since) -> Optional[List[oh_sample]]:
+        return _samples(await self._client.get_values_since(oh_item_name, since))
+
+    async def close(self):
+        self._client.close()
+
+# oh_influxdb_backend on oh_influxdb_client_async
+class oh_influxdb_backend_async():
+
+    def __init__(self, client) -> None:
+        self._client = client
+
+    async def get_item_names(self) -> List[str]:
+        item_list = await self._client.get_item_list()
+        return list(item_list.values()) if item_list != None else list()
+
+    async def get_last_value(self, oh_item_name) -> Optional[oh_sample]:
+        return (await self.get_last_values([oh_item_name])).get(oh_item_name)
+
+    async def get_last_values(self, oh_item_names) -> Dict[str, oh_sample]:
+        last_values = await self._client.get_last_values(oh_item_names)
+        if last_values == None:
+            return dict()
+        return {oh_item_name: _sample(time, value) for (oh_item_name, (time, value)) in last_values.items()}
+
+    async def get_row_count(self, oh_item_name) -> Optional[int]:
+        count = await self._client.get_row_count(oh_item_name)
+        return int(count) if count != None else None
+
+    async def _first_in_window(self, oh_item_name, window) -> Optional[oh_sample]:
+        start, stop = _local_window(window)
+        first = await self._client.get_first_sample(oh_item_name, start, stop)
+        return _sample(*first) if first != None else None
+
+    async def get_first_value_for_day(self, oh_item_name, day) -> Optional[oh_sample]:
+        return await self._first_in_window(oh_item_name, self._client._sync_client._day_window(day))
+
+    async def get_first_value_for_month(self, oh_item_name, month) -> Optional[oh_sample]:
+        return await self._first_in_window(oh_item_name, self._client._sync_client._month_window(month))
+
+    async def get_values_for_day(self, oh_item_name, day) -> Optional[List[oh_sample]]:
+        return await self.get_values_between(oh_item_name, *_local_window(self._client._sync_client._day_window(day)))
+
+    async def get_values_for_month(self, oh_item_name, month) -> Optional[List[oh_sample]]:
+        return await self.get_values_between(oh_item_name, *_local_window(self._client._sync_client._month_window(month)))
+
+    async def get_values_between(self, oh_item_name, start, end) -> Optional[List[oh_sample]]:
+        if not await self._client._connect():
+            return None
+        return [_sample(time, value) async for (time, value) in self._client.iter_values(oh_item_name, start.astimezone(), end.astimezone())]
+
+    async def get_values_since(self, oh_item_name, since) -> Optional[List[oh_sample]]:
+        return _samples(await self._client.get_values_since(oh_item_name, since.astimezone()))
+
+    async def close(self):
+        await self._client.close()
+
+# Open the backend named in the analytics conf ('sql' or 'influxdb'). Clients are imported here so a deployment
+# only needs the driver of the backend it uses.
+def open_backend(logger, backend_name) -> oh_backend:
+    if backend_name == BACKEND_SQL:
+        import oh_sql_client
+        return oh_sql_backend(oh_sql_client.oh_sql_client(logger))
+    if backend_name == BACKEND_INFLUXDB:
+        import oh_influxdb_client
+        return oh_influxdb_backend(oh_influxdb_client.oh_influxdb_client(logger))
+    raise ValueError(f'Unknown persistence backend: {backend_name}')
+
+# open_backend on the asyncio clients; the InfluxDB client's HTTP session belongs to the running event loop, so the
+# backend is used and closed on one loop
+def open_backend_async(logger, backend_name):
+    if backend_name == BACKEND_SQL:
+        import oh_sql_client_async
+        return oh_sql_backend_async(oh_sql_client_async.oh_sql_client_async(logger))
+    if backend_name == BACKEND_INFLUXDB:
+        import oh_influxdb_client_async
+        return oh_influxdb_backend_async(oh_influxdb_client_async.oh_influxdb_client_async(logger))
+    raise ValueError(f'Unknown persistence backend: {backend_name}')
@@ -0,0 +1,195 @@
+'''
+Columnar (NumPy) result type for historical queries. A series holds a datetime64[ns] timestamp array and a
+float64 value array - 16 bytes per sample - so analytics can use vectorised min / max / sum / diff / resampling
+instead of iterating over {time: value} dicts.
+Timestamps are naive local time, like the SQL rows and the oh_backend interface; InfluxDB's UTC times are converted.
+Non-numeric states map ON / OPEN to 1, OFF / CLOSED to 0 and anything else to NaN.
+'''
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Result modes accepted by the clients' range queries
+RESULT_RECORDS = 'records'
+RESULT_COLUMNAR = 'columnar'
+# pandas DataFrame / Arrow table with a UTC time index (column) and a float64 'value' column
+RESULT_DATAFRAME = 'dataframe'
+RESULT_ARROW = 'arrow'
+
+# Rows converted per NumPy chunk when filling from a cursor or CSV stream
+FILL_CHUNK_SIZE = 5000
+
+# Numeric value of the OpenHab states of Switch / Contact items
+STATE_VALUES = {'ON': 1.0, 'OFF': 0.0, 'OPEN': 1.0, 'CLOSED': 0.0}
+
+# Samples of one item in time order
+class oh_columnar_series():
+
+    def __init__(self, times, values) -> None:
+        self.times = times
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return f'oh_columnar_series({len(self)} samples)'
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.values.nbytes
+
+    def min(self) -> float:
+        return float(self.values.min()) if len(self) > 0 else None
+
+    def max(self) -> float:
+        return float(self.values.max()) if len(self) > 0 else None
+
+    def sum(self) -> float:
+        return float(self.values.sum())
+
+    # Value change between consecutive samples
+    def diff(self) -> np.ndarray:
+        return np.diff(self.values)
+
+    # Reduce the series to one sample per 'every' interval (aligned to the epoch).
+    # fn: 'mean', 'min', 'max', 'sum', 'first', 'last' or 'count'
+    def resample(self, every, fn='mean'):
+        if len(self) == 0:
+            return self
+        step = np.timedelta64(every if isinstance(every, timedelta) else timedelta(seconds=every)).astype('timedelta64[ns]').astype(np.int64)
+        bins = self.times.astype(np.int64) // step
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        ends = np.r_[starts[1:], len(self)]
+        counts = ends - starts
+        if fn == 'mean':
+            values = np.add.reduceat(self.values, starts) / counts
+        elif fn == 'sum':
+            values = np.add.reduceat(self.values, starts)
+        elif fn == 'min':
+            values = np.minimum.reduceat(self.values, starts)
+        elif fn == 'max':
+            values = np.maximum.reduceat(self.values, starts)
+        elif fn == 'first':
+            values = self.values[starts]
+        elif fn == 'last':
+            values = self.values[ends - 1]
+        elif fn == 'count':
+            values = counts.astype(np.float64)
+        else:
+            raise ValueError(f'Unknown resample function: {fn}')
+        return oh_columnar_series((bins[starts] * step).astype('datetime64[ns]'), values)
+
+# float64 array of a sequence of values; values that are not numbers fall back to STATE_VALUES, else NaN
+def to_float_array(values) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(value) for value in values), dtype=np.float64, count=len(values))
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return STATE_VALUES.get(str(value).strip().upper(), np.nan)
+
+# Naive UTC datetime64[ns] array to naive local time. The UTC offset is looked up once per distinct hour, which
+# follows DST changes without a per-sample conversion.
+def utc_to_local(times) -> np.ndarray:
+    if len(times) == 0:
+        return times
+    (hours, inverse) = np.unique(times.astype('datetime64[h]'), return_inverse=True)
+    offsets = np.array([_utc_offset_ns(hour) for hour in hours.astype(np.int64)], dtype=np.int64)
+    return (times.astype(np.int64) + offsets[inverse.reshape(-1)]).astype('datetime64[ns]')
+
+def _utc_offset_ns(hours_since_epoch) -> int:
+    offset = datetime.fromtimestamp(int(hours_since_epoch) * 3600, timezone.utc).astimezone().utcoffset()
+    return int(offset.total_seconds()) * 1000000000
+
+def empty_series() -> oh_columnar_series:
+    return oh_columnar_series(np.empty(0, dtype='datetime64[ns]'), np.empty(0, dtype=np.float64))
+
+def _concatenate(time_chunks, value_chunks) -> oh_columnar_series:
+    if len(time_chunks) == 0:
+        return empty_series()
+    return oh_columnar_series(np.concatenate(time_chunks), np.concatenate(value_chunks))
+
+# Fill a series from a DB-API cursor returning (time, value) rows. Rows are pulled chunk_size at a time.
+def from_cursor(cursor, chunk_size=FILL_CHUNK_SIZE) -> oh_columnar_series:
+    time_chunks = list()
+    value_chunks = list()
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if len(rows) == 0:
+            break
+        time_chunks.append(np.array([row[0] for row in rows], dtype='datetime64[ns]'))
+        value_chunks.append(to_float_array([row[1] for row in rows]))
+    return _concatenate(time_chunks, value_chunks)
+
+# Fill a series from an InfluxDB annotated CSV stream (rows as lists of strings, e.g. QueryApi.query_csv).
+# Annotation rows are skipped and every header row re-maps the _time / _value columns. Times are converted to local time.
+def from_flux_csv(csv_rows, chunk_size=FILL_CHUNK_SIZE) -> oh_columnar_series:
+    time_chunks = list()
+    value_chunks = list()
+    time_strings = list()
+    value_strings = list()
+    time_column = None
+    value_column = None
+    for row in csv_rows:
+        if len(row) == 0 or row[0].startswith('#'):
+            continue
+        if '_time' in row and '_value' in row:
+            time_column = row.index('_time')
+            value_column = row.index('_value')
+            continue
+        if time_column == None:
+            continue
+        # RFC3339 UTC timestamps; drop the 'Z' so NumPy parses them as naive UTC
+        time_strings.append(row[time_column].rstrip('Z'))
+        value_strings.append(row[value_column])
+        if len(time_strings) >= chunk_size:
+            time_chunks.append(utc_to_local(np.array(time_strings, dtype='datetime64[ns]')))
+            value_chunks.append(to_float_array(value_strings))
+            time_strings = list()
+            value_strings = list()
+    if len(time_strings) > 0:
+        time_chunks.append(utc_to_local(np.array(time_strings, dtype='datetime64[ns]')))
+        value_chunks.append(to_float_array(value_strings))
+    return _concatenate(time_chunks, value_chunks)
+
+# Normalize the result of QueryApi.query_data_frame (a DataFrame or a list of them, indexed by _time) to a
+# DataFrame with a UTC DatetimeIndex named 'time' and a float64 'value' column (non-numeric states as in to_float_array).
+# pandas is only needed for this result mode, so it is imported here.
+def frame_from_flux(data_frames):
+    import pandas as pd
+    if isinstance(data_frames, list):
+        data_frames = pd.concat(data_frames) if len(data_frames) > 0 else pd.DataFrame()
+    if '_value' not in data_frames.columns:
+        return pd.DataFrame({'value': pd.Series(dtype=np.float64)}, index=pd.DatetimeIndex([], tz='UTC', name='time'))
+    frame = pd.DataFrame({'value': to_float_array(data_frames['_value'].to_numpy())}, index=data_frames.index)
+    frame.index = pd.DatetimeIndex(frame.index, name='time').as_unit('ns')
+    return frame.sort_index()
+
+# Read a header-only (no annotations) Flux CSV stream with _time / _value columns into an Arrow table
+# (time: timestamp[ns, UTC], value: float64). The stream is parsed by Arrow's CSV reader without Python rows;
+# only non-numeric values (as in to_float_array) go through Python. pyarrow is only needed for this result mode,
+# so it is imported here.
+def arrow_from_flux_csv(stream):
+    import pyarrow as pa
+    from pyarrow import csv
+    schema = pa.schema([('time', pa.timestamp('ns', tz='UTC')), ('value', pa.float64())])
+    convert_options = csv.ConvertOptions(column_types={'_time': schema.field('time').type},
+                                         include_columns=['_time', '_value'])
+    try:
+        table = csv.read_csv(stream, convert_options=convert_options)
+    except pa.ArrowInvalid:
+        # An empty result has no header row
+        return schema.empty_table()
+    table = table.rename_columns(['time', 'value'])
+    if table.schema.field('value').type != pa.float64():
+        values = table.column('value')
+        try:
+            values = values.cast(pa.float64())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            values = pa.array(to_float_array(values.to_pylist()), type=pa.float64())
+        table = table.set_column(1, 'value', values)
+    return table
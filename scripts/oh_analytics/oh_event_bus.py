@@ -0,0 +1,290 @@
+'''
+One connection to the OpenHab event stream (/rest/events) shared by every analytic of a process. Analytics register
+a handler per item; the bus subscribes with a single multi-topic filter (or the openhab/items/*/statechanged
+wildcard) and hands each ItemStateChangedEvent to the handlers of its item, so the number of connections to the
+OpenHab server stays at one however many items are watched.
+When the stream drops the bus reconnects with exponential backoff. Changes persisted while it was disconnected are
+read from the persistence backend (an oh_backend) and replayed in time order before live events resume; without a
+backend the current item states are read from the REST API instead.
+'''
+import json
+import logging
+import random
+import threading
+from datetime import datetime
+from time import monotonic
+import oh_sse
+
+# OpenHab host / port / token, persistence backend and event coalescing settings of the analytics conf file
+def read_analytics_conf(json_file_name='oh_analytics_conf.json') -> dict:
+    with open(json_file_name, 'r') as json_conf_file:
+        json_obj = json.load(json_conf_file)
+    return {'oh_token': json_obj['oh_token'], 'host': json_obj['host'], 'port': json_obj['port'],
+            'persistence_backend': json_obj.get('persistence_backend'), 'event_coalescing': json_obj.get('event_coalescing')}
+
+# Subscriptions of an event bus and the state both oh_event_bus and oh_event_bus_async keep about them: handlers per
+# item, the topic filter of the connection, the last state handed over per item, counters and the backfill queries
+class oh_event_subscriptions():
+
+    # Topic filters
+    ITEM_TOPIC = 'openhab/items/{}/statechanged'
+    ALL_ITEMS_TOPIC = 'openhab/items/*/statechanged'
+
+    def __init__(self, logger, analytics_conf, wildcard=False, history=None) -> None:
+        self._logger = logger
+        self._analytics_conf = analytics_conf
+        self._wildcard = wildcard
+        # Persistence backend (oh_backend) the changes missed while disconnected are read from
+        self._history = history
+        self._lock = threading.Lock()
+        # item name -> [handler(event)]
+        self._handlers = dict()
+        # Items of the topic filter of the open connection (None = not connected)
+        self._topic_items = None
+        self._event_count = 0
+        self._replayed_count = 0
+        self._reconnect_count = 0
+        # Last state handed to the handlers per item; replayed and live copies of a change are handed over once
+        self._last_values = dict()
+        # Time of the item's latest known state: the persisted time of a replayed change, the arrival time of a live
+        # one. Replayed changes that are not newer would move the state backwards.
+        self._last_times = dict()
+
+    def subscribe(self, oh_item_name, handler):
+        with self._lock:
+            self._handlers.setdefault(oh_item_name, list()).append(handler)
+            if self._topic_items != None and not self._wildcard and oh_item_name not in self._topic_items:
+                self._logger.warning(f'{oh_item_name} subscribed after the event bus connected; its events are not received')
+
+    def unsubscribe(self, oh_item_name, handler):
+        with self._lock:
+            handlers = self._handlers.get(oh_item_name, list())
+            if handler in handlers:
+                handlers.remove(handler)
+            if len(handlers) == 0:
+                self._handlers.pop(oh_item_name, None)
+
+    def handlers_of(self, oh_item_name) -> list:
+        with self._lock:
+            return list(self._handlers.get(oh_item_name, list()))
+
+    def subscribed_items(self) -> list:
+        with self._lock:
+            return sorted(self._handlers)
+
+    # Events handed to the handlers (live and replayed), replayed events and reconnects since the bus started
+    def stats(self) -> dict:
+        return {'events': self._event_count, 'replayed': self._replayed_count, 'reconnects': self._reconnect_count}
+
+    def count_reconnect(self):
+        self._reconnect_count += 1
+
+    # Fix the topic filter to the items subscribed now; returns the event stream URL, None if there is nothing to listen to
+    def topic_url(self) -> str:
+        with self._lock:
+            self._topic_items = set(self._handlers)
+        if len(self._topic_items) == 0 and not self._wildcard:
+            self._logger.warning('No items subscribed to the event bus')
+            return None
+        if self._wildcard:
+            topics = self.ALL_ITEMS_TOPIC
+        else:
+            topics = ','.join(self.ITEM_TOPIC.format(oh_item_name) for oh_item_name in sorted(self._topic_items))
+        return f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/events?topics={topics}"
+
+    # Number of items in the topic filter (0 before the bus connected)
+    def topic_count(self) -> int:
+        return len(self._topic_items) if self._topic_items != None else 0
+
+    def state_url(self, oh_item_name) -> str:
+        return f"http://{self._analytics_conf['host']}:{self._analytics_conf['port']}/rest/items/{oh_item_name}/state"
+
+    # Last state handed to the handlers of an item, None before its first change
+    def last_value(self, oh_item_name):
+        return self._last_values.get(oh_item_name)
+
+    # Numeric states compare as numbers ('5' from the stream, 5.0 from the database), anything else as text
+    def _same_state(self, value, other) -> bool:
+        try:
+            return float(value) == float(other)
+        except (TypeError, ValueError):
+            return str(value) == str(other)
+
+    # Whether a change goes to the handlers: not when it is a replayed change older than the item's latest known state
+    # (e.g. persisted before a newer change arrived live), nor when it repeats the item's last state (e.g. a replayed
+    # change also received live). Counts the accepted change.
+    def accept(self, event) -> bool:
+        last_time = self._last_times.get(event.item)
+        if event.time != None and last_time != None and event.time <= last_time:
+            return False
+        self._last_times[event.item] = event.time if event.time != None else datetime.now()
+        last_value = self._last_values.get(event.item)
+        if last_value != None and self._same_state(last_value, event.value):
+            return False
+        self._last_values[event.item] = event.value
+        self._event_count += 1
+        if event.time != None:
+            self._replayed_count += 1
+        return True
+
+    # Typed item state changes of a stream of SSE messages; messages that are not OpenHab events are logged and skipped
+    def item_state_changes(self, messages):
+        for message in messages:
+            try:
+                event = oh_sse.parse_event(message)
+            except ValueError as e:
+                self._logger.warning(f'Skipping event stream message: {e}')
+                continue
+            if isinstance(event, oh_sse.oh_item_state_changed):
+                yield event
+
+    # Changes persisted after since as replay events, all items merged in time order
+    def backfill_events(self, since) -> list:
+        changes = list()
+        for oh_item_name in self.subscribed_items():
+            samples = self._history.get_values_since(oh_item_name, since)
+            if samples == None:
+                self._logger.warning(f'Backfill of {oh_item_name} since {since} failed; changes while disconnected are lost')
+                continue
+            changes += [(sample.time, oh_item_name, sample.value) for sample in samples]
+        changes.sort(key=lambda change: change[0])
+        self._logger.info(f'Replaying {len(changes)} changes persisted since {since}')
+        return [oh_sse.oh_item_state_changed(oh_item_name, str(value), None, None, None, None, time) for (time, oh_item_name, value) in changes]
+
+class oh_event_bus(threading.Thread):
+
+    # Reconnect backoff: doubles from the min to the max delay; a connection that stayed up for the max delay resets it
+    RECONNECT_MIN_SECS = 1.0
+    RECONNECT_MAX_SECS = 60.0
+    CONNECT_TIMEOUT_SECS = 10.0
+
+    def __init__(self, logger, analytics_conf=None, wildcard=False, history=None) -> None:
+        threading.Thread.__init__(self, name='oh_event_bus', daemon=True)
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        # OpenHab host / port / token; read from the analytics conf file unless an analytic passes its own
+        if analytics_conf == None:
+            analytics_conf = read_analytics_conf()
+        self._analytics_conf = analytics_conf
+        self._history = history
+        self._subscriptions = oh_event_subscriptions(self._logger, analytics_conf, wildcard, history)
+        self._request = None
+        self._stopped = threading.Event()
+        # Local time up to which the stream is known to have delivered every change (None before the first connection)
+        self._alive_time = None
+
+    # Call handler(event) with the oh_sse.oh_item_state_changed of every state change of the item.
+    # Items must be subscribed before the bus connects unless it listens on the wildcard topic.
+    def subscribe(self, oh_item_name, handler):
+        self._subscriptions.subscribe(oh_item_name, handler)
+
+    def unsubscribe(self, oh_item_name, handler):
+        self._subscriptions.unsubscribe(oh_item_name, handler)
+
+    # Events handed to the handlers (live and replayed), replayed events and reconnects since the bus started
+    def stats(self) -> dict:
+        return self._subscriptions.stats()
+
+    def _deliver(self, event):
+        if self._subscriptions.accept(event):
+            self._dispatch(event)
+
+    # Hand an item state change to the handlers of its item; a failing handler does not stop the bus or the other handlers
+    def _dispatch(self, event):
+        for handler in self._subscriptions.handlers_of(event.item):
+            try:
+                handler(event)
+            except Exception as e:
+                self._logger.error(f'Event handler for {event.item} failed: {e}')
+
+    # Replay the changes persisted after since
+    def _backfill(self, since):
+        for event in self._subscriptions.backfill_events(since):
+            self._deliver(event._replace(old_value=self._subscriptions.last_value(event.item)))
+
+    # Without a persistence backend: hand over the current state of items that changed while disconnected
+    def _resync_states(self):
+        # requests is imported where it is used, so a process that only runs oh_event_bus_async does not load it
+        import requests
+        for oh_item_name in self._subscriptions.subscribed_items():
+            try:
+                request = requests.get(self._subscriptions.state_url(oh_item_name), auth=(self._analytics_conf['oh_token'], ''), timeout=self.CONNECT_TIMEOUT_SECS)
+                request.raise_for_status()
+            except requests.RequestException as e:
+                self._logger.warning(f'Cannot read the state of {oh_item_name}: {e}')
+                continue
+            self._deliver(oh_sse.oh_item_state_changed(oh_item_name, request.text, None, self._subscriptions.last_value(oh_item_name), None, None))
+
+    # One connection: catch up on the changes missed since the last one, then dispatch live events until it drops
+    def _listen(self, url):
+        import requests
+        try:
+            self._request = requests.get(url, stream=True, auth=(self._analytics_conf['oh_token'], ''),
+                                         timeout=(self.CONNECT_TIMEOUT_SECS, None))
+            self._request.raise_for_status()
+        except requests.RequestException as e:
+            self._logger.error(f'Cannot connect to the event stream: {e}')
+            return
+        # Changes from here on arrive on the stream (a change may arrive both ways; _deliver drops the repeat)
+        connected_time = datetime.now()
+        if self._alive_time != None:
+            if self._history != None:
+                self._backfill(self._alive_time)
+            else:
+                self._resync_states()
+        self._alive_time = connected_time
+        if self._request.encoding is None:
+            self._request.encoding = 'utf-8'
+        parser = oh_sse.oh_sse_parser()
+        try:
+            # Chunks as they arrive; the parser splits them into lines and messages
+            for chunk in self._request.iter_content(chunk_size=None, decode_unicode=True):
+                self._alive_time = datetime.now()
+                for event in self._subscriptions.item_state_changes(parser.feed(chunk)):
+                    self._deliver(event)
+        except Exception as e:
+            if not self._stopped.is_set():
+                self._logger.error(f'Event stream failed: {e}')
+        finally:
+            self._request.close()
+
+    # Listen on the event stream and dispatch events until stop() is called, reconnecting when the stream drops
+    def run(self):
+        url = self._subscriptions.topic_url()
+        if url == None:
+            return
+        delay = self.RECONNECT_MIN_SECS
+        while not self._stopped.is_set():
+            self._logger.info(f'Event bus connecting for {self._subscriptions.topic_count()} items: {url}')
+            connect_start = monotonic()
+            self._listen(url)
+            if self._stopped.is_set():
+                break
+            if monotonic() - connect_start >= self.RECONNECT_MAX_SECS:
+                delay = self.RECONNECT_MIN_SECS
+            # Jitter keeps several analytics hosts from reconnecting in lockstep after a server restart
+            wait_secs = delay * random.uniform(0.5, 1.0)
+            self._logger.warning(f'Event stream lost; reconnecting in {wait_secs:.1f} s')
+            self._stopped.wait(wait_secs)
+            delay = min(delay * 2, self.RECONNECT_MAX_SECS)
+            self._subscriptions.count_reconnect()
+
+    def stop(self):
+        self._stopped.set()
+        if self._request != None:
+            self._request.close()
+
+def main():
+    # Configure Logger
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    # Log the state changes of the analytics items, received on one connection
+    event_bus = oh_event_bus(logger)
+    for oh_item_name in ('WS_Temperature', 'Water_Mains_Water_Mains_Count_Scale_Gallons', 'DeckDoor', 'GarageDoor', 'FrontDoor'):
+        event_bus.subscribe(oh_item_name, lambda event: logger.info(f'TEST - {event.item}: {event.old_value} -> {event.value}'))
+    event_bus.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+'''
+asyncio twin of oh_event_bus built on aiohttp. Subscriptions, duplicate suppression and the backfill queries come
+from an oh_event_bus.oh_event_subscriptions like those of the threaded bus. The event stream, REST reads / writes and
+coroutine handlers run on the event loop, so the items, timers and REST writes of an analytic share the loop's thread
+instead of taking one thread each. Plain functions run on a worker thread so a blocking handler (e.g. a database
+query) does not stall the loop.
+'''
+import asyncio
+import codecs
+import inspect
+import logging
+import random
+from datetime import datetime
+from time import monotonic
+import aiohttp
+import oh_event_bus
+import oh_sse
+
+class oh_event_bus_async():
+
+    # Same reconnect backoff and connect timeout as oh_event_bus
+    RECONNECT_MIN_SECS = oh_event_bus.oh_event_bus.RECONNECT_MIN_SECS
+    RECONNECT_MAX_SECS = oh_event_bus.oh_event_bus.RECONNECT_MAX_SECS
+    CONNECT_TIMEOUT_SECS = oh_event_bus.oh_event_bus.CONNECT_TIMEOUT_SECS
+
+    def __init__(self, logger, analytics_conf=None, wildcard=False, history=None) -> None:
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        # OpenHab host / port / token; read from the analytics conf file unless an analytic passes its own
+        if analytics_conf == None:
+            analytics_conf = oh_event_bus.read_analytics_conf()
+        self._analytics_conf = analytics_conf
+        self._history = history
+        # Subscriptions, last states, counters and backfill queries
+        self._subscriptions = oh_event_bus.oh_event_subscriptions(self._logger, analytics_conf, wildcard, history)
+        self._session = None
+        self._response = None
+        self._stopped = False
+        self._stop_event = None
+        self._alive_time = None
+
+    # Call handler(event) with the oh_sse.oh_item_state_changed of every state change of the item; the handler may be
+    # a coroutine function. Items must be subscribed before the bus connects unless it listens on the wildcard topic.
+    def subscribe(self, oh_item_name, handler):
+        self._subscriptions.subscribe(oh_item_name, handler)
+
+    def unsubscribe(self, oh_item_name, handler):
+        self._subscriptions.unsubscribe(oh_item_name, handler)
+
+    # Events handed to the handlers (live and replayed), replayed events and reconnects since the bus started
+    def stats(self) -> dict:
+        return self._subscriptions.stats()
+
+    # HTTP session of the bus. REST calls of the analytics share it (and its connection pool) with the event stream.
+    def session(self) -> aiohttp.ClientSession:
+        if self._session == None:
+            self._session = aiohttp.ClientSession(auth=aiohttp.BasicAuth(self._analytics_conf['oh_token'], ''))
+        return self._session
+
+    # Current state of an item (REST API), None if it cannot be read
+    async def get_state(self, oh_item_name) -> str:
+        try:
+            async with self.session().get(self._subscriptions.state_url(oh_item_name),
+                                          timeout=aiohttp.ClientTimeout(total=self.CONNECT_TIMEOUT_SECS)) as response:
+                response.raise_for_status()
+                return await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._logger.warning(f'Cannot read the state of {oh_item_name}: {e}')
+            return None
+
+    # Set the state of an item (REST API); returns the HTTP status, None if the server cannot be reached
+    async def put_state(self, oh_item_name, value) -> int:
+        try:
+            async with self.session().put(self._subscriptions.state_url(oh_item_name), data=str(value), headers={"Content-Type": "text/plain"},
+                                          timeout=aiohttp.ClientTimeout(total=self.CONNECT_TIMEOUT_SECS)) as response:
+                return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._logger.warning(f'Cannot set the state of {oh_item_name}: {e}')
+            return None
+
+    # Hand an item state change to the handlers of its item; a failing handler does not stop the bus or the other handlers
+    async def _dispatch(self, event):
+        for handler in self._subscriptions.handlers_of(event.item):
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    await handler(event)
+                else:
+                    await asyncio.to_thread(handler, event)
+            except Exception as e:
+                self._logger.error(f'Event handler for {event.item} failed: {e}')
+
+    async def _deliver(self, event):
+        if self._subscriptions.accept(event):
+            await self._dispatch(event)
+
+    # Replay the changes persisted after since; the backend queries run on a worker thread
+    async def _backfill(self, since):
+        for event in await asyncio.to_thread(self._subscriptions.backfill_events, since):
+            await self._deliver(event._replace(old_value=self._subscriptions.last_value(event.item)))
+
+    # Without a persistence backend: hand over the current state of items that changed while disconnected
+    async def _resync_states(self):
+        oh_item_names = self._subscriptions.subscribed_items()
+        states = await asyncio.gather(*[self.get_state(oh_item_name) for oh_item_name in oh_item_names])
+        for (oh_item_name, state) in zip(oh_item_names, states):
+            if state != None:
+                await self._deliver(oh_sse.oh_item_state_changed(oh_item_name, state, None, self._subscriptions.last_value(oh_item_name), None, None))
+
+    # One connection: catch up on the changes missed since the last one, then dispatch live events until it drops
+    async def _listen(self, url):
+        try:
+            self._response = await self.session().get(url, timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.CONNECT_TIMEOUT_SECS))
+            self._response.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._logger.error(f'Cannot connect to the event stream: {e}')
+            return
+        # Changes from here on arrive on the stream (a change may arrive both ways; accept() drops the repeat)
+        connected_time = datetime.now()
+        if self._alive_time != None:
+            if self._history != None:
+                await self._backfill(self._alive_time)
+            else:
+                await self._resync_states()
+        self._alive_time = connected_time
+        decoder = codecs.getincrementaldecoder(self._response.charset or 'utf-8')()
+        parser = oh_sse.oh_sse_parser()
+        try:
+            # Chunks as they arrive; the parser splits them into lines and messages
+            async for chunk in self._response.content.iter_any():
+                self._alive_time = datetime.now()
+                for event in self._subscriptions.item_state_changes(parser.feed(decoder.decode(chunk))):
+                    await self._deliver(event)
+        except Exception as e:
+            if not self._stopped:
+                self._logger.error(f'Event stream failed: {e}')
+        finally:
+            self._response.close()
+
+    # Listen on the event stream and dispatch events until stop() is called, reconnecting when the stream drops
+    async def run(self):
+        self._stop_event = asyncio.Event()
+        url = self._subscriptions.topic_url()
+        if url == None or self._stopped:
+            await self.close()
+            return
+        delay = self.RECONNECT_MIN_SECS
+        try:
+            while not self._stopped:
+                self._logger.info(f'Event bus connecting for {self._subscriptions.topic_count()} items: {url}')
+                connect_start = monotonic()
+                await self._listen(url)
+                if self._stopped:
+                    break
+                if monotonic() - connect_start >= self.RECONNECT_MAX_SECS:
+                    delay = self.RECONNECT_MIN_SECS
+                wait_secs = delay * random.uniform(0.5, 1.0)
+                self._logger.warning(f'Event stream lost; reconnecting in {wait_secs:.1f} s')
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), wait_secs)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.RECONNECT_MAX_SECS)
+                self._subscriptions.count_reconnect()
+        finally:
+            await self.close()
+
+    # Stop from the event loop thread
+    def stop(self):
+        self._stopped = True
+        if self._stop_event != None:
+            self._stop_event.set()
+        if self._response != None:
+            self._response.close()
+
+    async def close(self):
+        if self._session != None:
+            await self._session.close()
+            self._session = None
+
+async def run_tests(logger):
+    event_bus = oh_event_bus_async(logger)
+    async def log_event(event):
+        logger.info(f'TEST - {event.item}: {event.old_value} -> {event.value}')
+    for oh_item_name in ('WS_Temperature', 'Water_Mains_Water_Mains_Count_Scale_Gallons', 'DeckDoor', 'GarageDoor', 'FrontDoor'):
+        event_bus.subscribe(oh_item_name, log_event)
+    await event_bus.run()
+
+def main():
+    # Configure Logger
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    asyncio.run(run_tests(logger))
+
+if __name__ == "__main__":
+    main()
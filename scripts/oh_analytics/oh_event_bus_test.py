@@ -0,0 +1,117 @@
+'''
+Tests of oh_event_bus without an OpenHab server: the subscriptions of every analytic share one topic filter, the
+events of a stream are handed to the handlers of their item only, and changes persisted while the stream was down
+are replayed in time order without repeating or undoing the changes received live.
+Run with: python -m unittest oh_event_bus_test
+'''
+import logging
+import unittest
+from datetime import datetime, timedelta
+import oh_backend
+import oh_event_bus
+import oh_sse
+
+ANALYTICS_CONF = {'oh_token': 'token', 'host': 'openhab', 'port': '8080'}
+
+# SSE text of OpenHab state changes as the event stream sends them
+def stream_text(changes) -> str:
+    return ''.join('event: message\ndata: {"topic":"openhab/items/' + item + '/statechanged","payload":"{\\"type\\":\\"Decimal\\",'
+                   '\\"value\\":\\"' + value + '\\",\\"oldType\\":\\"Decimal\\",\\"oldValue\\":\\"0\\"}","type":"ItemStateChangedEvent"}\n\n'
+                   for (item, value) in changes)
+
+# Persistence backend stand-in: the changes of each item as oh_samples, None for an item whose query fails
+class standin_history():
+
+    def __init__(self, samples) -> None:
+        self.samples = samples
+
+    def get_values_since(self, oh_item_name, since):
+        samples = self.samples.get(oh_item_name)
+        if samples == None:
+            return None
+        return [sample for sample in samples if sample.time > since]
+
+class oh_event_bus_test(unittest.TestCase):
+
+    def _bus(self, wildcard=False, history=None) -> oh_event_bus.oh_event_bus:
+        return oh_event_bus.oh_event_bus(logging.getLogger(__name__), ANALYTICS_CONF, wildcard, history)
+
+    # Hand the events of a stream to the bus as its connection would
+    def _receive(self, event_bus, changes):
+        parser = oh_sse.oh_sse_parser()
+        for event in event_bus._subscriptions.item_state_changes(parser.feed(stream_text(changes))):
+            event_bus._deliver(event)
+
+    def test_one_topic_filter_for_all_items(self):
+        event_bus = self._bus()
+        event_bus.subscribe('Water_Counter', print)
+        event_bus.subscribe('Front_Door', print)
+        event_bus.subscribe('Front_Door', repr)
+        self.assertEqual(event_bus._subscriptions.topic_url(), 'http://openhab:8080/rest/events?topics='
+                         'openhab/items/Front_Door/statechanged,openhab/items/Water_Counter/statechanged')
+        self.assertEqual(event_bus._subscriptions.topic_count(), 2)
+        wildcard_bus = self._bus(wildcard=True)
+        self.assertEqual(wildcard_bus._subscriptions.topic_url(), 'http://openhab:8080/rest/events?topics=openhab/items/*/statechanged')
+        self.assertIsNone(self._bus()._subscriptions.topic_url())
+
+    def test_events_go_to_their_item(self):
+        event_bus = self._bus()
+        received = list()
+        event_bus.subscribe('Water_Counter', lambda event: received.append(('water', event.item, event.value)))
+        event_bus.subscribe('Front_Door', lambda event: received.append(('door', event.item, event.value)))
+        event_bus.subscribe('Front_Door', lambda event: received.append(('alarm', event.item, event.value)))
+        self._receive(event_bus, [('Water_Counter', '10'), ('Front_Door', '1'), ('Back_Door', '1')])
+        self.assertEqual(received, [('water', 'Water_Counter', '10'), ('door', 'Front_Door', '1'), ('alarm', 'Front_Door', '1')])
+
+    def test_failing_handler_does_not_stop_the_others(self):
+        event_bus = self._bus()
+        received = list()
+        def failing(event):
+            raise RuntimeError('handler failed')
+        event_bus.subscribe('Front_Door', failing)
+        event_bus.subscribe('Front_Door', lambda event: received.append(event.value))
+        with self.assertLogs(__name__, logging.ERROR):
+            self._receive(event_bus, [('Front_Door', '1'), ('Front_Door', '0')])
+        self.assertEqual(received, ['1', '0'])
+        event_bus.unsubscribe('Front_Door', failing)
+        self.assertEqual(len(event_bus._subscriptions.handlers_of('Front_Door')), 1)
+        self.assertEqual(event_bus.stats(), {'events': 2, 'replayed': 0, 'reconnects': 0})
+
+    def test_backfill_replays_in_time_order(self):
+        since = datetime.now() - timedelta(minutes=10)
+        history = standin_history({'Water_Counter': [oh_backend.oh_sample(since - timedelta(minutes=1), 5.0),
+                                                     oh_backend.oh_sample(since + timedelta(minutes=1), 10.0),
+                                                     oh_backend.oh_sample(since + timedelta(minutes=3), 12.0)],
+                                   'Front_Door': [oh_backend.oh_sample(since + timedelta(minutes=2), 1.0)]})
+        event_bus = self._bus(history=history)
+        received = list()
+        event_bus.subscribe('Water_Counter', lambda event: received.append((event.item, event.old_value, event.value)))
+        event_bus.subscribe('Front_Door', lambda event: received.append((event.item, event.old_value, event.value)))
+        event_bus._backfill(since)
+        self.assertEqual(received, [('Water_Counter', None, '10.0'), ('Front_Door', None, '1.0'), ('Water_Counter', '10.0', '12.0')])
+        self.assertEqual(event_bus.stats(), {'events': 3, 'replayed': 3, 'reconnects': 0})
+
+    def test_replay_does_not_repeat_or_undo_live_changes(self):
+        since = datetime.now() - timedelta(minutes=10)
+        # The counter's 8 was persisted before the live change to 11; the door's 1 was received live and persisted
+        # just after it arrived
+        history = standin_history({'Water_Counter': [oh_backend.oh_sample(since + timedelta(minutes=1), 8.0)],
+                                   'Front_Door': [oh_backend.oh_sample(datetime.now() + timedelta(seconds=1), 1.0)]})
+        event_bus = self._bus(history=history)
+        received = list()
+        event_bus.subscribe('Water_Counter', lambda event: received.append((event.item, event.value)))
+        event_bus.subscribe('Front_Door', lambda event: received.append((event.item, event.value)))
+        self._receive(event_bus, [('Water_Counter', '11'), ('Front_Door', '1')])
+        event_bus._backfill(since)
+        self.assertEqual(received, [('Water_Counter', '11'), ('Front_Door', '1')])
+        self.assertEqual(event_bus.stats(), {'events': 2, 'replayed': 0, 'reconnects': 0})
+
+    def test_failed_backfill_is_logged(self):
+        event_bus = self._bus(history=standin_history({}))
+        event_bus.subscribe('Water_Counter', print)
+        with self.assertLogs(__name__, logging.WARNING) as logs:
+            event_bus._backfill(datetime.now())
+        self.assertIn('Backfill of Water_Counter', logs.output[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+'''
+Per item coalescing between an event bus (oh_event_bus or oh_event_bus_async) and the analytics. Changes of an item
+that arrive within its window are merged, latest value wins, and handed over once at the end of the window; a
+minimum interval further throttles how often an item reaches its handlers. Items without settings pass straight
+through. An item is handed over once at a time: changes that arrive while its handlers run wait for them to finish. Analytics subscribe to the coalescer as they would to the bus; merged changes are counted per item.
+Settings come from the "event_coalescing" entry of the analytics conf file, e.g.
+    "event_coalescing": {"window_secs": 0.0, "min_interval_secs": 0.0,
+                         "items": {"AtticFanEntranceMotorCurrent": {"window_secs": 1.0, "min_interval_secs": 5.0}}}
+'''
+import asyncio
+import inspect
+import logging
+import threading
+from time import monotonic
+import oh_event_bus
+
+class oh_event_coalescer():
+
+    def __init__(self, logger, event_bus, coalescing_conf=None) -> None:
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._event_bus = event_bus
+        # Handlers are awaited on the event loop of an oh_event_bus_async; flushes of an oh_event_bus run on timer threads
+        self._async = inspect.iscoroutinefunction(event_bus.run)
+        if coalescing_conf == None:
+            coalescing_conf = dict()
+        self._window_secs = float(coalescing_conf.get('window_secs', 0.0))
+        self._min_interval_secs = float(coalescing_conf.get('min_interval_secs', 0.0))
+        self._item_conf = coalescing_conf.get('items', dict())
+        self._lock = threading.Lock()
+        # item name -> [handler(event)]
+        self._handlers = dict()
+        # Per item: change waiting for the end of its window and the time it arrived, its scheduled flush, whether its
+        # handlers are running, time and value of the last hand over
+        self._pending = dict()
+        self._pending_times = dict()
+        self._flushes = dict()
+        self._delivering = set()
+        self._last_delivery = dict()
+        self._last_values = dict()
+        self._received_count = 0
+        self._delivered_count = 0
+        self._coalesced_counts = dict()
+
+    # Call handler(event) with the coalesced state changes of the item; the handler may be a coroutine function
+    # when the bus is an oh_event_bus_async
+    def subscribe(self, oh_item_name, handler):
+        with self._lock:
+            first = oh_item_name not in self._handlers
+            self._handlers.setdefault(oh_item_name, list()).append(handler)
+        if first:
+            (window_secs, min_interval_secs) = self._settings(oh_item_name)
+            if window_secs > 0 or min_interval_secs > 0:
+                self._logger.info(f'Coalescing {oh_item_name}: window {window_secs} s, min interval {min_interval_secs} s')
+            self._event_bus.subscribe(oh_item_name, self._on_event_async if self._async else self._on_event)
+
+    def unsubscribe(self, oh_item_name, handler):
+        with self._lock:
+            handlers = self._handlers.get(oh_item_name, list())
+            if handler in handlers:
+                handlers.remove(handler)
+            if len(handlers) > 0:
+                return
+            self._handlers.pop(oh_item_name, None)
+        self._event_bus.unsubscribe(oh_item_name, self._on_event_async if self._async else self._on_event)
+
+    # Changes received from the bus, handed to the handlers and merged into a later change (in total and per item)
+    def stats(self) -> dict:
+        with self._lock:
+            return {'received': self._received_count, 'delivered': self._delivered_count,
+                    'coalesced': sum(self._coalesced_counts.values()), 'coalesced_by_item': dict(self._coalesced_counts)}
+
+    # (window, min interval) of an item in seconds
+    def _settings(self, oh_item_name) -> tuple:
+        item_conf = self._item_conf.get(oh_item_name, dict())
+        return (float(item_conf.get('window_secs', self._window_secs)), float(item_conf.get('min_interval_secs', self._min_interval_secs)))
+
+    # Clock of the windows and intervals (tests run the coalescer on a clock of their own)
+    def _now(self) -> float:
+        return monotonic()
+
+    # When a change of an item received at the given time is due: at the end of its window, and no sooner than the
+    # min interval after the last hand over
+    def _due(self, oh_item_name, received) -> float:
+        (window_secs, min_interval_secs) = self._settings(oh_item_name)
+        due = received + window_secs
+        last_delivery = self._last_delivery.get(oh_item_name)
+        if last_delivery != None:
+            due = max(due, last_delivery + min_interval_secs)
+        return due
+
+    # Take in a change: returns the delay in seconds before the item's pending change is due, 0 to hand this change
+    # over now, None when it was merged into a change that is already waiting or waits for the running hand over
+    def _offer(self, event) -> float:
+        now = self._now()
+        with self._lock:
+            self._received_count += 1
+            pending = self._pending.get(event.item)
+            if pending != None:
+                # Latest value wins
+                self._pending[event.item] = event
+                self._coalesced_counts[event.item] = self._coalesced_counts.get(event.item, 0) + 1
+                return None
+            if event.item in self._delivering:
+                # Scheduled once the running hand over finished
+                self._pending[event.item] = event
+                self._pending_times[event.item] = now
+                return None
+            due = self._due(event.item, now)
+            if due <= now:
+                self._delivering.add(event.item)
+                self._last_delivery[event.item] = now
+                self._last_values[event.item] = event.value
+                self._delivered_count += 1
+                return 0
+            self._pending[event.item] = event
+            self._pending_times[event.item] = now
+            return due - now
+
+    # The pending change of an item, now due; its old value is the one the handlers last saw
+    def _take(self, oh_item_name):
+        with self._lock:
+            self._flushes.pop(oh_item_name, None)
+            event = self._pending.pop(oh_item_name, None)
+            self._pending_times.pop(oh_item_name, None)
+            if event == None:
+                return None
+            if oh_item_name in self._last_values:
+                event = event._replace(old_value=self._last_values[oh_item_name])
+            self._delivering.add(oh_item_name)
+            self._last_delivery[oh_item_name] = self._now()
+            self._last_values[oh_item_name] = event.value
+            self._delivered_count += 1
+            return event
+
+    # The handlers of an item finished: returns the delay before the change that arrived meanwhile is due, None when
+    # nothing is waiting
+    def _finish(self, oh_item_name) -> float:
+        with self._lock:
+            self._delivering.discard(oh_item_name)
+            if oh_item_name not in self._pending:
+                return None
+            return max(0.0, self._due(oh_item_name, self._pending_times[oh_item_name]) - self._now())
+
+    def _handlers_of(self, oh_item_name) -> list:
+        with self._lock:
+            return list(self._handlers.get(oh_item_name, list()))
+
+    # oh_event_bus: on the bus thread, or on a timer thread for a change that waited
+    def _on_event(self, event):
+        delay = self._offer(event)
+        if delay == 0:
+            self._deliver(event)
+        elif delay != None:
+            self._schedule(event.item, delay)
+
+    def _schedule(self, oh_item_name, delay):
+        flush = threading.Timer(delay, self._flush, (oh_item_name,))
+        flush.daemon = True
+        with self._lock:
+            self._flushes[oh_item_name] = flush
+        flush.start()
+
+    def _flush(self, oh_item_name):
+        event = self._take(oh_item_name)
+        if event != None:
+            self._deliver(event)
+
+    # Hand a change over, then schedule the change of the item that arrived while its handlers ran
+    def _deliver(self, event):
+        try:
+            self._dispatch(event)
+        finally:
+            delay = self._finish(event.item)
+            if delay != None:
+                self._schedule(event.item, delay)
+
+    def _dispatch(self, event):
+        for handler in self._handlers_of(event.item):
+            try:
+                handler(event)
+            except Exception as e:
+                self._logger.error(f'Event handler for {event.item} failed: {e}')
+
+    # oh_event_bus_async: on the event loop
+    async def _on_event_async(self, event):
+        delay = self._offer(event)
+        if delay == 0:
+            await self._deliver_async(event)
+        elif delay != None:
+            self._schedule_async(event.item, delay)
+
+    def _schedule_async(self, oh_item_name, delay):
+        with self._lock:
+            self._flushes[oh_item_name] = asyncio.create_task(self._flush_async(oh_item_name, delay))
+
+    async def _flush_async(self, oh_item_name, delay):
+        await asyncio.sleep(delay)
+        event = self._take(oh_item_name)
+        if event != None:
+            await self._deliver_async(event)
+
+    async def _deliver_async(self, event):
+        try:
+            await self._dispatch_async(event)
+        finally:
+            delay = self._finish(event.item)
+            if delay != None:
+                self._schedule_async(event.item, delay)
+
+    # Same as oh_event_bus_async: coroutine handlers are awaited, others run on a worker thread
+    async def _dispatch_async(self, event):
+        for handler in self._handlers_of(event.item):
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    await handler(event)
+                else:
+                    await asyncio.to_thread(handler, event)
+            except Exception as e:
+                self._logger.error(f'Event handler for {event.item} failed: {e}')
+
+def main():
+    # Configure Logger
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    # Log the changes of a fast changing item, at most one per 5 s, with the number of changes merged so far
+    analytics_conf = oh_event_bus.read_analytics_conf()
+    event_bus = oh_event_bus.oh_event_bus(logger, analytics_conf)
+    coalescing_conf = analytics_conf['event_coalescing'] or {'items': {'AtticFanEntranceMotorCurrent': {'window_secs': 1.0, 'min_interval_secs': 5.0}}}
+    coalescer = oh_event_coalescer(logger, event_bus, coalescing_conf)
+    coalescer.subscribe('AtticFanEntranceMotorCurrent', lambda event: logger.info(f'TEST - {event.item}: {event.old_value} -> {event.value} {coalescer.stats()}'))
+    event_bus.run()
+
+if __name__ == "__main__":
+    main()
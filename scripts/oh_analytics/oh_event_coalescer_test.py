@@ -0,0 +1,182 @@
+'''
+Tests of oh_event_coalescer against a stand-in event bus (no OpenHab server): changes within a window are merged,
+the min interval throttles hand overs, an item is handed over once at a time, and the counters add up. Both the
+oh_event_bus (timer threads) and the oh_event_bus_async (event loop) paths are covered. The timer thread tests run
+the coalescer on a clock they advance themselves, and the event loop test waits on events, so nothing sleeps.
+Run with: python -m unittest oh_event_coalescer_test
+'''
+import asyncio
+import logging
+import unittest
+import oh_event_coalescer
+import oh_sse
+
+# Event bus stand-in: remembers the coalescer's handler per item so the tests can publish changes
+class standin_event_bus():
+
+    def __init__(self) -> None:
+        self.handlers = dict()
+
+    def subscribe(self, oh_item_name, handler):
+        self.handlers[oh_item_name] = handler
+
+    def unsubscribe(self, oh_item_name, handler):
+        self.handlers.pop(oh_item_name, None)
+
+    def publish(self, oh_item_name, value):
+        return self.handlers[oh_item_name](oh_sse.oh_item_state_changed(oh_item_name, value, None, None, None, None))
+
+    def run(self):
+        pass
+
+class standin_event_bus_async(standin_event_bus):
+
+    async def run(self):
+        pass
+
+# Coalescer on a clock the test advances; due flushes run in time order on the test's thread instead of timer threads
+class manual_clock_coalescer(oh_event_coalescer.oh_event_coalescer):
+
+    def __init__(self, logger, event_bus, coalescing_conf=None) -> None:
+        super().__init__(logger, event_bus, coalescing_conf)
+        self.now = 0.0
+        # (due time, item name) of the scheduled flushes
+        self.flushes = list()
+
+    def _now(self) -> float:
+        return self.now
+
+    def _schedule(self, oh_item_name, delay):
+        self.flushes.append((self.now + delay, oh_item_name))
+
+    def advance(self, secs):
+        end = self.now + secs
+        while True:
+            due = [flush for flush in self.flushes if flush[0] <= end]
+            if len(due) == 0:
+                break
+            flush = min(due)
+            self.flushes.remove(flush)
+            self.now = max(self.now, flush[0])
+            self._flush(flush[1])
+        self.now = end
+
+# Handler that records (time, old value, value) of each hand over and how many ran at once. on_call(event) runs
+# while the hand over is in progress.
+class recording_handler():
+
+    def __init__(self, clock=None, on_call=None) -> None:
+        self.clock = clock
+        self.on_call = on_call
+        self.calls = list()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, event):
+        self.calls.append((self.clock() if self.clock != None else None, event.old_value, event.value))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        if self.on_call != None:
+            self.on_call(event)
+        self.running -= 1
+
+    def values(self) -> list:
+        return [value for (time, old_value, value) in self.calls]
+
+class oh_event_coalescer_test(unittest.TestCase):
+
+    def _coalescer(self, event_bus, item_conf) -> manual_clock_coalescer:
+        return manual_clock_coalescer(logging.getLogger(__name__), event_bus, {'items': {'Item': item_conf}})
+
+    def test_window_merges_changes(self):
+        event_bus = standin_event_bus()
+        coalescer = self._coalescer(event_bus, {'window_secs': 0.2})
+        handler = recording_handler()
+        coalescer.subscribe('Item', handler)
+        for value in ('1', '2', '3', '4', '5'):
+            event_bus.publish('Item', value)
+        coalescer.advance(0.19)
+        self.assertEqual(handler.values(), [])
+        coalescer.advance(0.01)
+        self.assertEqual(handler.values(), ['5'])
+        self.assertEqual(coalescer.stats(), {'received': 5, 'delivered': 1, 'coalesced': 4, 'coalesced_by_item': {'Item': 4}})
+
+    def test_min_interval_throttles(self):
+        event_bus = standin_event_bus()
+        coalescer = self._coalescer(event_bus, {'min_interval_secs': 0.3})
+        handler = recording_handler(clock=lambda: coalescer.now)
+        coalescer.subscribe('Item', handler)
+        event_bus.publish('Item', '1')
+        event_bus.publish('Item', '2')
+        event_bus.publish('Item', '3')
+        coalescer.advance(0.29)
+        self.assertEqual(handler.values(), ['1'])
+        coalescer.advance(0.01)
+        self.assertEqual(handler.values(), ['1', '3'])
+        # The merged change waited for the min interval and carries the value the handler saw before
+        self.assertEqual(handler.calls, [(0.0, None, '1'), (0.3, '1', '3')])
+        self.assertEqual(coalescer.stats()['coalesced'], 1)
+
+    def test_item_without_settings_passes_through(self):
+        event_bus = standin_event_bus()
+        coalescer = oh_event_coalescer.oh_event_coalescer(logging.getLogger(__name__), event_bus)
+        handler = recording_handler()
+        coalescer.subscribe('Other', handler)
+        for value in ('1', '2', '3'):
+            event_bus.publish('Other', value)
+        self.assertEqual(handler.values(), ['1', '2', '3'])
+        self.assertEqual(coalescer.stats(), {'received': 3, 'delivered': 3, 'coalesced': 0, 'coalesced_by_item': {}})
+
+    def test_one_hand_over_at_a_time(self):
+        event_bus = standin_event_bus()
+        coalescer = self._coalescer(event_bus, {})
+        # Changes 2 and 3 arrive while the handler of change 1 runs
+        def publish_during_first_call(event):
+            if event.value == '1':
+                event_bus.publish('Item', '2')
+                event_bus.publish('Item', '3')
+        handler = recording_handler(on_call=publish_during_first_call)
+        coalescer.subscribe('Item', handler)
+        event_bus.publish('Item', '1')
+        self.assertEqual(handler.values(), ['1'])
+        coalescer.advance(0.0)
+        self.assertEqual(handler.max_running, 1)
+        self.assertEqual(handler.calls, [(None, None, '1'), (None, '1', '3')])
+        self.assertEqual(coalescer.stats(), {'received': 3, 'delivered': 2, 'coalesced': 1, 'coalesced_by_item': {'Item': 1}})
+
+    def test_async_bus(self):
+        async def run():
+            event_bus = standin_event_bus_async()
+            coalescer = oh_event_coalescer.oh_event_coalescer(logging.getLogger(__name__), event_bus, {'items': {'Item': {}}})
+            calls = list()
+            running = [0, 0]
+            started = asyncio.Event()
+            release = asyncio.Event()
+            delivered = asyncio.Event()
+            async def handler(event):
+                calls.append((event.old_value, event.value))
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+                started.set()
+                await release.wait()
+                running[0] -= 1
+                if event.value == '4':
+                    delivered.set()
+            coalescer.subscribe('Item', handler)
+            # The first change is handed over at once and holds its hand over until released
+            first = asyncio.create_task(event_bus.publish('Item', '1'))
+            await started.wait()
+            for value in ('2', '3', '4'):
+                await event_bus.publish('Item', value)
+            self.assertEqual(calls, [(None, '1')])
+            release.set()
+            await first
+            await asyncio.wait_for(delivered.wait(), 5.0)
+            return (coalescer, calls, running[1])
+        (coalescer, calls, max_running) = asyncio.run(run())
+        self.assertEqual(max_running, 1)
+        self.assertEqual(calls, [(None, '1'), ('1', '4')])
+        self.assertEqual(coalescer.stats(), {'received': 4, 'delivered': 2, 'coalesced': 2, 'coalesced_by_item': {'Item': 2}})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+'''
+Flux query builder for oh_influxdb_client. Each query shape is compiled once into a parameterized template
+(bucket, item and time bounds are read from Flux 'params'), so values are never interpolated into the query
+text and every item shares the same query text.
+'''
+import threading
+
+class oh_flux_query():
+
+    # Filter on the OpenHab item (one measurement per item)
+    ITEM_FILTER = 'filter(fn: (r) => r["_measurement"] == params.item)'
+
+    # Latest point of every series, reduced to one row per measurement
+    LAST_PER_MEASUREMENT = ['filter(fn: (r) => r["_field"] == "value")', 'last()', 'group(columns: ["_measurement"])',
+                            'sort(columns: ["_time"])', 'last()', 'keep(columns: ["_measurement", "_time", "_value"])']
+
+    # Pipeline stages after range() for each query shape. '{name}' placeholders are filled from the template variant.
+    SHAPE_STAGES = {
+        'values': [ITEM_FILTER],
+        'stream': [ITEM_FILTER, 'keep(columns: ["_time", "_value"])'],
+        'since': [ITEM_FILTER, 'filter(fn: (r) => r["_time"] > params.start)', 'keep(columns: ["_time", "_value"])'],
+        'first': [ITEM_FILTER, 'first()'],
+        'first_sample': [ITEM_FILTER, 'filter(fn: (r) => r["_field"] == "value")', 'first()', 'keep(columns: ["_time", "_value"])'],
+        'last': [ITEM_FILTER, 'filter(fn: (r) => r["_field"] == "value")', 'filter(fn: (r) => r["item"] == params.item)', 'last()'],
+        'count': [ITEM_FILTER, 'count()', 'yield(name: "count")'],
+        'windowed': [ITEM_FILTER, 'filter(fn: (r) => r["_field"] == "value")',
+                     'aggregateWindow(every: params.every, fn: {fn}, timeSrc: "_start", createEmpty: false)',
+                     'keep(columns: ["_time", "_value"])'],
+        'last_all': LAST_PER_MEASUREMENT,
+        'last_in_set': ['filter(fn: (r) => contains(value: r["_measurement"], set: params.items))'] + LAST_PER_MEASUREMENT,
+        'last_matching': ['filter(fn: (r) => r["_measurement"] =~ pattern)'] + LAST_PER_MEASUREMENT,
+        'measurements': [],
+    }
+
+    # Shapes that read from a schema function instead of from() |> range(); '{stop}' is filled when bounded
+    SHAPE_SOURCES = {
+        'measurements': 'schema.measurements(bucket: params.bucket, start: params.start{stop})',
+    }
+
+    # Flux packages imported by a shape
+    SHAPE_IMPORTS = {
+        'measurements': ['influxdata/influxdb/schema'],
+        'last_matching': ['regexp'],
+    }
+
+    # Statements placed before from() by a shape (compiled once per query rather than per row)
+    SHAPE_DEFINITIONS = {
+        'last_matching': ['pattern = regexp.compile(v: params.pattern)'],
+    }
+
+    def __init__(self, bucket) -> None:
+        self._bucket = bucket
+        self._templates = dict()
+        # Query text -> shape, to label query statistics
+        self._shapes = dict()
+        self._lock = threading.Lock()
+
+    # Get the compiled template for a shape, bounded (range with stop) or open ended (stop is now())
+    def template(self, shape, bounded=True, variant=None) -> str:
+        variant_key = tuple(sorted(variant.items())) if variant != None else tuple()
+        key = (shape, bounded, variant_key)
+        with self._lock:
+            query = self._templates.get(key)
+            if query == None:
+                query = self._compile(shape, bounded, variant if variant != None else dict())
+                self._templates[key] = query
+                self._shapes[query] = shape
+        return query
+
+    # Shape a query text was compiled from ('adhoc' for queries not built here)
+    def shape_of(self, query) -> str:
+        return self._shapes.get(query, 'adhoc')
+
+    def _compile(self, shape, bounded, variant) -> str:
+        if shape not in self.SHAPE_STAGES:
+            raise ValueError(f'Unknown Flux query shape: {shape}')
+        lines = [f'import "{package}"' for package in self.SHAPE_IMPORTS.get(shape, [])]
+        lines += self.SHAPE_DEFINITIONS.get(shape, [])
+        if shape in self.SHAPE_SOURCES:
+            stages = [self.SHAPE_SOURCES[shape].format(stop=', stop: params.stop' if bounded else '')]
+        else:
+            stages = ['from(bucket: params.bucket)']
+            if bounded:
+                stages.append('range(start: params.start, stop: params.stop)')
+            else:
+                stages.append('range(start: params.start)')
+        stages += [stage.format(**variant) for stage in self.SHAPE_STAGES[shape]]
+        lines.append('\n  |> '.join(stages))
+        return '\n'.join(lines)
+
+    # Build (query, params) for a shape. start / stop are datetimes (naive = UTC) or timedeltas relative to now.
+    # Extra keyword arguments become Flux params (e.g. item).
+    def build(self, shape, start, stop=None, variant=None, **params) -> tuple:
+        query = self.template(shape, stop != None, variant)
+        flux_params = {'bucket': self._bucket, 'start': start}
+        if stop != None:
+            flux_params['stop'] = stop
+        flux_params.update(params)
+        return (query, flux_params)
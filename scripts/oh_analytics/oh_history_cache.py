@@ -0,0 +1,182 @@
+'''
+Read-through cache for day / month window queries of oh_sql_client or oh_influxdb_client.
+OpenHab persistence only appends, so a window that has closed never changes: closed windows are kept in an
+on-disk SQLite store (LRU evicted by size) and survive restarts. The still-open window is only kept in memory
+for a short TTL. Methods that are not cached are passed straight through to the wrapped client.
+Windows are in the client's time zone: its WINDOW_TIMEZONE (UTC for oh_influxdb_client), local time otherwise.
+An async client (e.g. oh_influxdb_client_async) can be wrapped as well; the cached methods are then awaitable.
+'''
+import inspect
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import monotonic, time
+import jsonpickle
+import oh_columnar
+
+class oh_history_cache():
+
+    # Cache Defaults
+    DEFAULT_DB_PATH = 'oh_history_cache.db'
+    OPEN_WINDOW_TTL_SECS = 60
+    MAX_MEMORY_ENTRIES = 256
+    MAX_DISK_BYTES = 64 * 1024 * 1024
+    # Rows may be persisted shortly after their timestamp; a window is closed this long after it ends
+    CLOSED_GRACE_SECS = 300
+
+    def __init__(self, logger, client, db_path=DEFAULT_DB_PATH, open_ttl_secs=OPEN_WINDOW_TTL_SECS,
+                 max_memory_entries=MAX_MEMORY_ENTRIES, max_disk_bytes=MAX_DISK_BYTES) -> None:
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._client = client
+        self._namespace = type(client).__name__
+        # Time zone the client's naive window bounds are in (None = local time)
+        self._window_timezone = getattr(client, 'WINDOW_TIMEZONE', None)
+        self._open_ttl_secs = open_ttl_secs
+        self._max_memory_entries = max_memory_entries
+        self._max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        # key -> (value, expiry); expiry None for closed windows
+        self._memory = OrderedDict()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS history (key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL)')
+        self._db.commit()
+        self._logger.info(f'History cache: {db_path}')
+
+    # Anything not cached goes to the wrapped client
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    # Window bounds [start, end) for a day and a month
+    def _day_window(self, day) -> tuple:
+        start = datetime(day.year, day.month, day.day)
+        return (start, start + timedelta(days=1))
+
+    def _month_window(self, month) -> tuple:
+        start = datetime(month.year, month.month, 1)
+        if month.month == 12:
+            return (start, datetime(month.year + 1, 1, 1))
+        return (start, datetime(month.year, month.month + 1, 1))
+
+    def get_values_for_day(self, oh_item_name, day, result=oh_columnar.RESULT_RECORDS):
+        if result != oh_columnar.RESULT_RECORDS:
+            return self._client.get_values_for_day(oh_item_name, day, result)
+        return self._read_through('values', oh_item_name, self._day_window(day), self._client.get_values_for_day, day)
+
+    def get_first_value_for_day(self, oh_item_name, day):
+        return self._read_through('first', oh_item_name, self._day_window(day), self._client.get_first_value_for_day, day)
+
+    def get_values_for_month(self, oh_item_name, month, result=oh_columnar.RESULT_RECORDS):
+        if result != oh_columnar.RESULT_RECORDS:
+            return self._client.get_values_for_month(oh_item_name, month, result)
+        return self._read_through('values', oh_item_name, self._month_window(month), self._client.get_values_for_month, month)
+
+    def get_first_value_for_month(self, oh_item_name, month):
+        return self._read_through('first', oh_item_name, self._month_window(month), self._client.get_first_value_for_month, month)
+
+    # Serve a window query from memory, then disk, then the wrapped client
+    def _read_through(self, kind, oh_item_name, window, query_fn, window_arg):
+        window_start, window_end = window
+        key = f'{self._namespace}|{kind}|{oh_item_name}|{window_start.isoformat()}|{window_end.isoformat()}'
+        if inspect.iscoroutinefunction(query_fn):
+            return self._read_through_async(key, kind, oh_item_name, window_end, query_fn, window_arg)
+        found, value = self._lookup(key)
+        if found:
+            return value
+        self._count_miss()
+        return self._keep(key, kind, window_end, query_fn(oh_item_name, window_arg))
+
+    async def _read_through_async(self, key, kind, oh_item_name, window_end, query_fn, window_arg):
+        found, value = self._lookup(key)
+        if found:
+            return value
+        self._count_miss()
+        return self._keep(key, kind, window_end, await query_fn(oh_item_name, window_arg))
+
+    def _count_miss(self):
+        with self._lock:
+            self._counters['misses'] += 1
+
+    # Cache a freshly queried window: closed windows on disk, open windows in memory for the TTL
+    def _keep(self, key, kind, window_end, value):
+        # Failed queries return None and are not cached (a first lookup of InfluxDB also returns None for no rows)
+        if value == None:
+            return value
+        closed = self._now() >= window_end + timedelta(seconds=self.CLOSED_GRACE_SECS)
+        # Only rows after the first one are appended to an open window, so a first value found is final;
+        # an empty one is not
+        if closed or (kind == 'first' and not self._is_empty(value)):
+            self._store(key, value)
+        else:
+            self._remember(key, value, monotonic() + self._open_ttl_secs)
+        return value
+
+    # Current time as a naive datetime in the client's window time zone
+    def _now(self) -> datetime:
+        if self._window_timezone == None:
+            return datetime.now()
+        return datetime.now(self._window_timezone).replace(tzinfo=None)
+
+    def _is_empty(self, value) -> bool:
+        return hasattr(value, '__len__') and len(value) == 0
+
+    def _lookup(self, key) -> tuple:
+        with self._lock:
+            if key in self._memory:
+                value, expiry = self._memory[key]
+                if expiry == None or monotonic() < expiry:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return (True, value)
+                del self._memory[key]
+            row = self._db.execute('SELECT value FROM history WHERE key = ?', (key,)).fetchone()
+            if row == None:
+                return (False, None)
+            self._db.execute('UPDATE history SET last_access = ? WHERE key = ?', (time(), key))
+            self._db.commit()
+            self._counters['disk_hits'] += 1
+        value = jsonpickle.decode(row[0], keys=True)
+        self._remember(key, value, None)
+        return (True, value)
+
+    # Keep a value in the in-memory LRU (expiry None = closed window)
+    def _remember(self, key, value, expiry):
+        with self._lock:
+            self._memory[key] = (value, expiry)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._max_memory_entries:
+                self._memory.popitem(last=False)
+
+    # Persist a closed window and evict the least recently used windows past the size limit
+    def _store(self, key, value):
+        encoded = jsonpickle.encode(value, keys=True)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?)', (key, encoded, len(encoded), time()))
+            total_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM history').fetchone()[0]
+            while total_bytes > self._max_disk_bytes:
+                oldest = self._db.execute('SELECT key, size FROM history ORDER BY last_access LIMIT 1').fetchone()
+                if oldest == None or oldest[0] == key:
+                    break
+                self._db.execute('DELETE FROM history WHERE key = ?', (oldest[0],))
+                self._memory.pop(oldest[0], None)
+                total_bytes -= oldest[1]
+                self._counters['evictions'] += 1
+            self._db.commit()
+        self._remember(key, value, None)
+
+    # Hit / miss counters plus current sizes
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters['memory_entries'] = len(self._memory)
+            counters['disk_entries'], counters['disk_bytes'] = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM history').fetchone()
+        return counters
+
+    def close(self):
+        with self._lock:
+            self._db.close()
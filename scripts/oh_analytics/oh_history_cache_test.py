@@ -0,0 +1,97 @@
+'''
+Tests of oh_history_cache around a stand-in client (no database server): closed windows are read once and survive a
+restart, the open window is only kept for its TTL, failed queries are not cached and async clients are awaited.
+Run with: python -m unittest oh_history_cache_test
+'''
+import asyncio
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import oh_history_cache
+
+# Client stand-in that counts its queries and answers one row per day, or None while it is unreachable
+class standin_client():
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.reachable = True
+
+    def get_values_for_day(self, oh_item_name, day, result=None):
+        self.queries += 1
+        if not self.reachable:
+            return None
+        return {datetime(day.year, day.month, day.day, 12): 1.5}
+
+    def get_item_list(self) -> dict:
+        return {1: 'Item'}
+
+class standin_client_async(standin_client):
+
+    async def get_values_for_day(self, oh_item_name, day, result=None):
+        return standin_client.get_values_for_day(self, oh_item_name, day, result)
+
+class oh_history_cache_test(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._db_path = os.path.join(self._tmp_dir.name, 'oh_history_cache.db')
+        self._caches = list()
+
+    def tearDown(self):
+        for cache in self._caches:
+            cache.close()
+        self._tmp_dir.cleanup()
+
+    def _cache(self, client, open_ttl_secs=oh_history_cache.oh_history_cache.OPEN_WINDOW_TTL_SECS) -> oh_history_cache.oh_history_cache:
+        cache = oh_history_cache.oh_history_cache(logging.getLogger(__name__), client, self._db_path, open_ttl_secs)
+        self._caches.append(cache)
+        return cache
+
+    def test_closed_window_is_read_once(self):
+        client = standin_client()
+        day = datetime.now() - timedelta(days=3)
+        values = self._cache(client).get_values_for_day('Item', day)
+        self.assertEqual(values, {datetime(day.year, day.month, day.day, 12): 1.5})
+        # A new cache on the same file (e.g. after a restart) reads the window from disk
+        restarted = self._cache(client)
+        self.assertEqual(restarted.get_values_for_day('Item', day), values)
+        self.assertEqual(client.queries, 1)
+        self.assertEqual(restarted.stats()['disk_hits'], 1)
+
+    def test_open_window_expires(self):
+        client = standin_client()
+        cache = self._cache(client)
+        cache.get_values_for_day('Item', datetime.now())
+        cache.get_values_for_day('Item', datetime.now())
+        self.assertEqual(client.queries, 1)
+        self.assertEqual(cache.stats()['disk_entries'], 0)
+        uncached = self._cache(client, open_ttl_secs=0)
+        uncached.get_values_for_day('Item', datetime.now())
+        uncached.get_values_for_day('Item', datetime.now())
+        self.assertEqual(client.queries, 3)
+
+    def test_failed_query_is_not_cached(self):
+        client = standin_client()
+        cache = self._cache(client)
+        day = datetime.now() - timedelta(days=3)
+        client.reachable = False
+        self.assertIsNone(cache.get_values_for_day('Item', day))
+        client.reachable = True
+        self.assertEqual(cache.get_values_for_day('Item', day), {datetime(day.year, day.month, day.day, 12): 1.5})
+        self.assertEqual(client.queries, 2)
+
+    def test_async_client(self):
+        client = standin_client_async()
+        cache = self._cache(client)
+        day = datetime.now() - timedelta(days=3)
+        async def run():
+            return [await cache.get_values_for_day('Item', day) for n in range(3)]
+        self.assertEqual(asyncio.run(run()), [{datetime(day.year, day.month, day.day, 12): 1.5}] * 3)
+        self.assertEqual(client.queries, 1)
+        # Methods that are not cached go to the client
+        self.assertEqual(cache.get_item_list(), {1: 'Item'})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,20 @@
 
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import logging
+import warnings
+import threading
+from time import monotonic
 
-
-from influxdb_client import InfluxDBClient
+from influxdb_client import InfluxDBClient, Dialect
 from influxdb_client.rest import ApiException
+from influxdb_client.client.warnings import MissingPivotFunction
 
 import jsonpickle
 from os.path import exists
+import oh_columnar
+import oh_flux_query
+import oh_query_stats
 
 class oh_influxdb_client():
 
@@ -23,7 +29,24 @@ class oh_influxdb_client():
     _port = 3306
     _database = None
 
-    def __init__(self, logger) -> None:
+    # Start of the persisted history
+    HISTORY_START = datetime(2021, 1, 1)
+    # Naive datetimes (and so the day / month windows) are UTC
+    WINDOW_TIMEZONE = timezone.utc
+
+    # Measurement catalog: refreshed in the background once older than the TTL (None = never). After a failed
+    # refresh the next attempt waits, doubling from the min to the max retry delay.
+    CATALOG_TTL_SECS = 3600
+    CATALOG_LOOKBACK = timedelta(days=-365)
+    CATALOG_RETRY_MIN_SECS = 5.0
+    CATALOG_RETRY_MAX_SECS = 300.0
+
+    # Server side window aggregates (Flux function names) and the units accepted in 'every' strings
+    WINDOW_FUNCTIONS = ('mean', 'max', 'min', 'sum', 'last')
+    WINDOW_UNITS = {'s': timedelta(seconds=1), 'm': timedelta(minutes=1), 'h': timedelta(hours=1),
+                    'd': timedelta(days=1), 'w': timedelta(weeks=1)}
+
+    def __init__(self, logger, catalog_ttl_secs=CATALOG_TTL_SECS) -> None:
         if logger == None:
             # Configure Logger
             logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
@@ -34,6 +57,16 @@ class oh_influxdb_client():
         self._connection = None
         self._init_server_conf()
         self._client = None
+        # Queries run on several threads (startup, event bus, coalescer timers); one of them connects at a time
+        self._connect_lock = threading.Lock()
+        self._flux = oh_flux_query.oh_flux_query(self._connection_conf['bucket'])
+        self._catalog = None
+        self._catalog_time = None
+        self._catalog_ttl_secs = catalog_ttl_secs
+        self._catalog_lock = threading.Lock()
+        self._catalog_refreshing = False
+        self._catalog_retry_time = None
+        self._catalog_retry_secs = self.CATALOG_RETRY_MIN_SECS
         pass
     
     # Read / Create the server config file including the connection info
@@ -65,19 +98,24 @@ class oh_influxdb_client():
 
     # Connect to the InfluxDB Server
     def _connect(self) -> bool:
-        if self._client == None:
-            try:
-                self._logger.info('Connecting to InfluxDB Server...')
-                self._client = InfluxDBClient(url=self._connection_conf['url'], 
-                                              token=self._connection_conf['token'], 
-                                              org=self._connection_conf['org'])
-
-                self._logger.info('Connected to InfluxDB Server.')
-                self._check_connection()
-                self._check_query()
-            except Exception as e:
-                self._logger.warn(f"Error connecting to InfluxDB Server: {e}")               
-        return (self._client is not None)
+        with self._connect_lock:
+            if self._client == None:
+                try:
+                    self._logger.info('Connecting to InfluxDB Server...')
+                    self._client = InfluxDBClient(url=self._connection_conf['url'], 
+                                                  token=self._connection_conf['token'], 
+                                                  org=self._connection_conf['org'])
+
+                    self._logger.info('Connected to InfluxDB Server.')
+                    self._check_connection()
+                    self._check_query()
+                except Exception as e:
+                    self._logger.warn(f"Error connecting to InfluxDB Server: {e}")               
+                    # A server that failed the checks is not connected; the next query tries again
+                    if self._client != None:
+                        self._client.close()
+                        self._client = None
+            return (self._client is not None)
     
     def _check_connection(self):
         """Check that the InfluxDB is running."""
@@ -90,7 +128,8 @@ class oh_influxdb_client():
         """Check that the credentials has permission to query from the Bucket"""
         self._logger.info("> Checking credentials for query ...")
         try:
-            self._client.query_api().query(f"from(bucket:\"{self._connection_conf['bucket']}\") |> range(start: -1m) |> limit(n:1)", self._connection_conf['org'])
+            self._client.query_api().query('from(bucket: params.bucket) |> range(start: -1m) |> limit(n:1)', self._connection_conf['org'],
+                                           params={'bucket': self._connection_conf['bucket']})
         except ApiException as e:
             # missing credentials
             if e.status == 404:
@@ -99,181 +138,313 @@ class oh_influxdb_client():
             raise
         self._logger.info("ok")
 
-    # Get the list of items from the OpenHab Database
-    # < --- INCOMPLETE - NEEDS TO BE IMPLEMENTED --- >
+    # Get the list of items from the OpenHab Database: {n: item name}, numbered in name order. Return None on failure.
     def get_item_list(self) -> dict:
-        # Get the last value over the last 30 days
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: -1y)
-        |> keep(columns: ["_measurement"])
-        |> distinct(column: "_measurement")
-        '''
-        result = self._basic_query(query)
-        
-        # Process the result
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            records = [record.values for table in result for record in table.records]
-            return records
-        else:
+        catalog = self.get_item_catalog()
+        if catalog == None:
             return None
+        return {item_num: oh_item_name for (item_num, oh_item_name) in enumerate(catalog, 1)}
+
+    # Get the measurement catalog: {item name: last write time} in name order. The last write time is None for items
+    # without a measurement in the last 30 days or when it could not be read. The first call loads the catalog; once
+    # it is older than the TTL the cached catalog is returned while a background thread refreshes it.
+    # Return None while no catalog could be loaded.
+    def get_item_catalog(self) -> dict:
+        with self._catalog_lock:
+            if self._catalog == None:
+                if self._catalog_retry_due():
+                    self._try_refresh_catalog()
+            elif self._catalog_expired() and not self._catalog_refreshing and self._catalog_retry_due():
+                self._catalog_refreshing = True
+                threading.Thread(target=self._background_refresh, name='oh_influx_catalog', daemon=True).start()
+            return self._catalog
 
-    # Provides the basic query interface to the InfluxDB Server
-    def _basic_query(self, query) -> dict:
+    def _catalog_expired(self) -> bool:
+        if self._catalog_time == None:
+            return True
+        if self._catalog_ttl_secs == None:
+            return False
+        return (monotonic() - self._catalog_time) >= self._catalog_ttl_secs
+
+    def _catalog_retry_due(self) -> bool:
+        return self._catalog_retry_time == None or monotonic() >= self._catalog_retry_time
+
+    def _background_refresh(self):
+        try:
+            self._try_refresh_catalog()
+        finally:
+            self._catalog_refreshing = False
+
+    # Refresh the catalog; after a failure the next attempt is held off with exponential backoff
+    def _try_refresh_catalog(self):
+        try:
+            refreshed = self._refresh_catalog()
+        except Exception as e:
+            self._logger.warning(f'Error refreshing the InfluxDB measurement catalog: {e}')
+            refreshed = False
+        if refreshed:
+            self._catalog_retry_time = None
+            self._catalog_retry_secs = self.CATALOG_RETRY_MIN_SECS
+        else:
+            self._catalog_retry_time = monotonic() + self._catalog_retry_secs
+            self._logger.warning(f'InfluxDB measurement catalog not refreshed; retrying in {self._catalog_retry_secs:.0f} s')
+            self._catalog_retry_secs = min(self._catalog_retry_secs * 2, self.CATALOG_RETRY_MAX_SECS)
+
+    # Measurement names from the schema API (index only, no raw data scan) with the last write of each measurement
+    # where available; the catalog does not depend on the last write query succeeding
+    def _refresh_catalog(self) -> bool:
+        result = self._basic_query(*self._flux.build('measurements', self.CATALOG_LOOKBACK))
+        if result == None:
+            return False
+        names = sorted(record.get_value() for table in result for record in table.records)
+        last_values = self.get_last_values()
+        if last_values == None:
+            self._logger.warning('InfluxDB last write times not read; catalog refreshed without them')
+            last_values = dict()
+        self._catalog = {oh_item_name: last_values[oh_item_name][0] if oh_item_name in last_values else None for oh_item_name in names}
+        self._catalog_time = monotonic()
+        self._logger.info(f'InfluxDB measurement catalog refreshed: {len(self._catalog)} items')
+        return True
+
+    # Provides the basic query interface to the InfluxDB Server. Values are passed as Flux params.
+    def _basic_query(self, query, params=None) -> dict:
         # (Re-)Connect to OH Database
         if not self._connect():
             return None
         # Execute Flux Query
         query_api = self._client.query_api()
-        result = query_api.query(org=self._connection_conf['org'], query=query)
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            result = query_api.query(org=self._connection_conf['org'], query=query, params=params)
+            sample.add_result(result)
         return result
         
+    # Run a range query and fill an oh_columnar_series straight from the annotated CSV stream
+    def _columnar_query(self, query, params=None) -> oh_columnar.oh_columnar_series:
+        # (Re-)Connect to OH Database
+        if not self._connect():
+            return None
+        # Execute Flux Query
+        query_api = self._client.query_api()
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            csv_rows = query_api.query_csv(org=self._connection_conf['org'], query=query, params=params)
+            series = oh_columnar.from_flux_csv(csv_rows)
+            sample.add_result(series)
+        return series
+
+    # Run a (_time, _value) query into a pandas DataFrame (time index, float values)
+    def _data_frame_query(self, query, params=None):
+        # (Re-)Connect to OH Database
+        if not self._connect():
+            return None
+        # Execute Flux Query
+        query_api = self._client.query_api()
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            with warnings.catch_warnings():
+                # The query already keeps only _time / _value, so there is nothing to pivot
+                warnings.simplefilter('ignore', MissingPivotFunction)
+                data_frames = query_api.query_data_frame(org=self._connection_conf['org'], query=query, params=params, data_frame_index=['_time'])
+            frame = oh_columnar.frame_from_flux(data_frames)
+            sample.add_result(frame)
+        return frame
+
+    # Run a (_time, _value) query into an Arrow table, reading the raw CSV response without annotations
+    def _arrow_query(self, query, params=None):
+        # (Re-)Connect to OH Database
+        if not self._connect():
+            return None
+        # Execute Flux Query
+        query_api = self._client.query_api()
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            response = query_api.query_raw(org=self._connection_conf['org'], query=query, params=params,
+                                           dialect=Dialect(header=True, annotations=[], date_time_format='RFC3339'))
+            try:
+                table = oh_columnar.arrow_from_flux_csv(response)
+            finally:
+                response.release_conn()
+            sample.add_result(table)
+        return table
+
+    # Day window [00:00:00, 23:59:59] and month window [1st, 1st of next month). Naive datetimes are UTC.
+    def _day_window(self, day) -> tuple:
+        return (datetime(day.year, day.month, day.day, 0, 0, 0), datetime(day.year, day.month, day.day, 23, 59, 59))
+
+    def _month_window(self, month) -> tuple:
+        startDate = datetime(month.year, month.month, 1, 0, 0, 0)
+        if (month.month == 12):
+            # Change to the next year / January
+            endDate = datetime(month.year+1, 1, 1, 0, 0, 0)
+        else:
+            endDate = datetime(month.year, month.month+1, 1, 0, 0, 0)
+        return (startDate, endDate)
+
+    # Value of the first record of the first table, or None
+    def _first_record_value(self, result):
+        if result and len(result) > 0 and len(result[0].records) > 0:
+            return result[0].records[0].values['_value']
+        else:
+            return None
+
+    # All records as value dicts ([] when there are none), or None if not connected
+    def _record_values(self, result) -> list:
+        if result == None:
+            return None
+        return [record.values for table in result for record in table.records]
+
+    # Run a range query for start <= time < stop (stop None = now) in the requested result mode.
+    # Records are full record dicts; the other modes only fetch _time / _value.
+    def _range_query(self, oh_item_name, start, stop, result):
+        if result == oh_columnar.RESULT_RECORDS:
+            return self._record_values(self._basic_query(*self._flux.build('values', start, stop, item=oh_item_name)))
+        query, params = self._flux.build('stream', start, stop, item=oh_item_name)
+        return self._series_query(query, params, result)
+
+    # Run a (_time, _value) query as an oh_columnar_series, a DataFrame or an Arrow table
+    def _series_query(self, query, params, result):
+        if result == oh_columnar.RESULT_COLUMNAR:
+            return self._columnar_query(query, params)
+        if result == oh_columnar.RESULT_DATAFRAME:
+            return self._data_frame_query(query, params)
+        if result == oh_columnar.RESULT_ARROW:
+            return self._arrow_query(query, params)
+        raise ValueError(f'Unknown result mode: {result}')
+
     # Get the last value for a given OpenHab item name. Return None if not found.
     def get_last_value(self, oh_item_name) -> dict:
         # Get the last value over the last 30 days
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: -30d)
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        |> filter(fn: (r) => r["_field"] == "value")
-        |> filter(fn: (r) => r["item"] == "{oh_item_name}")
-        |> last()
-        '''
-        result = self._basic_query(query)
+        result = self._basic_query(*self._flux.build('last', timedelta(days=-30), item=oh_item_name))
+        return self._first_record_value(result)
         
-        # Process the result
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            last_value = result[0].records[0].values['_value']
-            return last_value
-        else:
+    # Get the last (time, value) of many items in a single query over the last 30 days: {item: (time, value)}.
+    # oh_item_names limits the snapshot to a set of items, pattern to items matching a regular expression; by default
+    # every item is included. Items without a measurement in the last 30 days are omitted. Return None on failure.
+    def get_last_values(self, oh_item_names=None, pattern=None) -> dict:
+        if oh_item_names != None and len(oh_item_names) == 0:
+            return dict()
+        return self._last_values(self._basic_query(*self._last_values_query(oh_item_names, pattern)))
+
+    def _last_values_query(self, oh_item_names, pattern) -> tuple:
+        if oh_item_names != None:
+            return self._flux.build('last_in_set', timedelta(days=-30), items=sorted(set(oh_item_names)))
+        if pattern != None:
+            return self._flux.build('last_matching', timedelta(days=-30), pattern=pattern)
+        return self._flux.build('last_all', timedelta(days=-30))
+
+    # {measurement: (time, value)} from a last-values result, or None
+    def _last_values(self, result) -> dict:
+        if result == None:
             return None
-        
-    # Get the number of rows (measurement points) for a given OpenHab item name. Return None if not found.
-    def get_row_count(self, oh_item_name) -> int:
-        # Get the row count
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: 2021-01-01T00:00:00Z, stop: now())
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        |> count()
-        |> yield(name: "count")
-        '''
-        
-        result = self._basic_query(query)
+        return {record.get_measurement(): (record.get_time(), record.get_value()) for table in result for record in table.records}
 
-        # Process the result - the result is the 'count' and _not_ all of the rows
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            row_count = result[0].records[0].values['_value']
-            return row_count
-        else:
+    # Get the values of an OpenHab item newer than last_ts (time > last_ts) as dict < time, value > in time order.
+    # Return None if not connected.
+    def get_values_since(self, oh_item_name, last_ts) -> dict:
+        result = self._basic_query(*self._flux.build('since', last_ts, item=oh_item_name))
+        if result == None:
             return None
+        return {record.get_time(): record.get_value() for table in result for record in table.records}
+
+    # Get the number of rows (measurement points) for a given OpenHab item name. Return None if not found.
+    def get_row_count(self, oh_item_name) -> int:
+        # Get the row count - the result is the 'count' and _not_ all of the rows
+        result = self._basic_query(*self._flux.build('count', self.HISTORY_START, item=oh_item_name))
+        return self._first_record_value(result)
 
     # < --- INCOMPLETE - NEEDS TO BE IMPLEMENTED --- >    
-    def get_values_for_day(self, oh_item_name, day) -> dict:
-        # Set start and end times for the day
-        startDate = datetime(day.year, day.month, day.day, 0, 0, 0).isoformat() + "Z"
-        endDate = datetime(day.year, day.month, day.day, 23, 59, 59).isoformat() + "Z"
+    def get_values_for_day(self, oh_item_name, day, result=oh_columnar.RESULT_RECORDS) -> dict:
         # Flux query for all records for the given day
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: {startDate}, stop: {endDate})
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        '''
-        # Run it.
-        result = self._basic_query(query)
-        # Process the result - the result is the 'count' and _not_ all of the rows
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            records = [record.values for table in result for record in table.records]
-            return records
-        else:
-            return None
+        startDate, endDate = self._day_window(day)
+        return self._range_query(oh_item_name, startDate, endDate, result)
 
     # Gets the first value for a given OpenHab item name for a given day. Return None if not found.
     def get_first_value_for_day(self, oh_item_name, day) -> dict:
-        # Set start and end times for the day
-        startDate = datetime(day.year, day.month, day.day, 0, 0, 0).isoformat() + "Z"
-        endDate = datetime(day.year, day.month, day.day, 23, 59, 59).isoformat() + "Z"
-        # Flux query for all records for the given day
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: {startDate}, stop: {endDate})
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        |> first()
-        '''
-        # Run it.
-        result = self._basic_query(query)
-        # Process the result - the result is the 'count' and _not_ all of the rows
+        startDate, endDate = self._day_window(day)
+        result = self._basic_query(*self._flux.build('first', startDate, endDate, item=oh_item_name))
+        return self._first_record_value(result)
+
+    # Gets the first (time, value) for start <= time < stop; the server reduces the window to that one point.
+    # Return None if not found or not connected.
+    def get_first_sample(self, oh_item_name, start, stop) -> tuple:
+        result = self._basic_query(*self._flux.build('first_sample', start, stop, item=oh_item_name))
         if result and len(result) > 0 and len(result[0].records) > 0:
-            first_value = result[0].records[0].values['_value']
-            return first_value
-        else:
-            return None
+            record = result[0].records[0]
+            return (record.get_time(), record.get_value())
+        return None
 
     # Gets all the records for a given OpenHab item name for a given month. Return None if not found.
-    def get_values_for_month(self, oh_item_name, month) -> dict:
-        startDate = month
-        startDate = datetime(month.year, month.month, 1, 0, 0, 0).isoformat() + "Z"
-        if (month.month == 12):
-            # Change to the next year / January
-            endDate = datetime(month.year+1, 1, 1, 0, 0, 0).isoformat() + "Z"
-        else:
-            endDate = datetime(month.year, month.month+1, 1, 0, 0, 0).isoformat() + "Z"
+    # result: oh_columnar.RESULT_RECORDS for record dicts, oh_columnar.RESULT_COLUMNAR for an oh_columnar_series,
+    # oh_columnar.RESULT_DATAFRAME for a pandas DataFrame, oh_columnar.RESULT_ARROW for an Arrow table
+    def get_values_for_month(self, oh_item_name, month, result=oh_columnar.RESULT_RECORDS) -> dict:
         # Flux query for all records for the given month
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: {startDate}, stop: {endDate})
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        '''
-        # Run it.
-        result = self._basic_query(query)
-        # Process the result - the result is the all of the records
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            records = [record.values for table in result for record in table.records]
-            return records
-        else:
-            return None
+        startDate, endDate = self._month_window(month)
+        return self._range_query(oh_item_name, startDate, endDate, result)
 
     # Gets the first value for the given month
     def get_first_value_for_month(self, oh_item_name, month) -> dict:
-        startDate = month
-        startDate = datetime(month.year, month.month, 1, 0, 0, 0).isoformat() + "Z"
-        if (month.month == 12):
-            # Change to the next year / January
-            endDate = datetime(month.year+1, 1, 1, 0, 0, 0).isoformat() + "Z"
-        else:
-            endDate = datetime(month.year, month.month+1, 1, 0, 0, 0).isoformat() + "Z"
-        # Flux query for all records for the given month
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: {startDate}, stop: {endDate})
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        |> first()
-        '''
-        # Run it.
-        result = self._basic_query(query)
-        # Process the result - the result is the all of the records
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            first_value = result[0].records[0].values['_value']
-            return first_value
-        else:
-            return None
+        startDate, endDate = self._month_window(month)
+        result = self._basic_query(*self._flux.build('first', startDate, endDate, item=oh_item_name))
+        return self._first_record_value(result)
     
     # < --- INCOMPLETE - NEEDS TO BE IMPLEMENTED --- >
-    def get_all_values(self, oh_item_name) -> dict:
-        # Flux query for all records for the given month
-        query = f'''
-        from(bucket: "{self._connection_conf['bucket']}")
-        |> range(start: 2021-01-01T00:00:00Z, stop: now())
-        |> filter(fn: (r) => r["_measurement"] == "{oh_item_name}")
-        '''
-        # Run it.
-        result = self._basic_query(query)
-        # Process the result
-        if result and len(result) > 0:
-            records = [record.values for table in result for record in table.records]
-            return records
-        else:
-            return None
+    def get_all_values(self, oh_item_name, result=oh_columnar.RESULT_RECORDS) -> dict:
+        # Flux query for all records since 2021
+        return self._range_query(oh_item_name, self.HISTORY_START, None, result)
+
+    # Stream (time, value) tuples for start <= time < stop (stop None = now) without building FluxTables.
+    # Records are parsed lazily from the response; with batch_size, lists of up to batch_size tuples are yielded instead.
+    def iter_values(self, oh_item_name, start=HISTORY_START, stop=None, batch_size=None):
+        # (Re-)Connect to OH Database
+        if not self._connect():
+            return
+        query, params = self._flux.build('stream', start, stop, item=oh_item_name)
+        # Recorded as one query timed up to the server's response; rows are counted until the generator finishes
+        with oh_query_stats.shared().measure('influxdb', 'stream') as sample:
+            records = self._client.query_api().query_stream(org=self._connection_conf['org'], query=query, params=params)
+            sample.stop_timing()
+            try:
+                if batch_size == None:
+                    for record in records:
+                        sample.rows += 1
+                        yield (record.get_time(), record.get_value())
+                else:
+                    batch = list()
+                    for record in records:
+                        batch.append((record.get_time(), record.get_value()))
+                        if len(batch) >= batch_size:
+                            sample.rows += len(batch)
+                            yield batch
+                            batch = list()
+                    if len(batch) > 0:
+                        sample.rows += len(batch)
+                        yield batch
+            finally:
+                # Closes the HTTP response when the caller stops early
+                records.close()
+
+    # Convert an 'every' argument ('15m', '1h', '1d' or a timedelta) to a timedelta
+    def _window_duration(self, every) -> timedelta:
+        if isinstance(every, timedelta):
+            return every
+        unit = self.WINDOW_UNITS.get(every[-1:])
+        if unit == None or not every[:-1].isdigit():
+            raise ValueError(f'Unsupported window duration: {every}')
+        return int(every[:-1]) * unit
+
+    # Downsample start <= time < stop into 'every' windows on the server (aggregateWindow) and return an oh_columnar_series
+    # of (window start, fn(values)), or another result mode. Windows without measurements are skipped.
+    def get_windowed(self, oh_item_name, start, stop, every='1h', fn='mean', result=oh_columnar.RESULT_COLUMNAR):
+        query, params = self._windowed_query(oh_item_name, start, stop, every, fn)
+        return self._series_query(query, params, result)
+
+    def _windowed_query(self, oh_item_name, start, stop, every, fn) -> tuple:
+        if fn not in self.WINDOW_FUNCTIONS:
+            raise ValueError(f'Unsupported window function: {fn}')
+        return self._flux.build('windowed', start, stop, variant={'fn': fn}, item=oh_item_name,
+                                every=self._window_duration(every))
+
+    def close(self):
+        if self._client != None:
+            self._client.close()
+            self._client = None
 
 def main():
     # Configure Logger
@@ -301,6 +472,11 @@ def main():
     logger.info(f'TEST #6 - Get First Measurements of Water_Mains_Water_Mains_Count_Scale_Gallons for a given day: ' + str(osc.get_first_value_for_day('Water_Mains_Water_Mains_Count_Scale_Gallons', datetime.now())))
     logger.info(f'TEST #7 - Get First Measurements of Water_Mains_Water_Mains_Count_Scale_Gallons for a given month: ' + str(osc.get_first_value_for_month('Water_Mains_Water_Mains_Count_Scale_Gallons', datetime.now())))
     logger.info(f'TEST #8 - Get All Measurements of Water_Mains_Water_Mains_Count_Scale_Gallons: ' + str(len(osc.get_all_values('Water_Mains_Water_Mains_Count_Scale_Gallons'))) + ' measurements')
+    logger.info(f'TEST #9 - Stream All Measurements of Water_Mains_Water_Mains_Count_Scale_Gallons: ' + str(sum(len(batch) for batch in osc.iter_values('Water_Mains_Water_Mains_Count_Scale_Gallons', batch_size=10000))) + ' measurements')
+    logger.info(f'TEST #10 - Get Hourly Maximum of Water_Mains_Water_Mains_Count_Scale_Gallons for the last week: ' + str(len(osc.get_windowed('Water_Mains_Water_Mains_Count_Scale_Gallons', datetime.now() - timedelta(days=7), datetime.now(), '1h', 'max'))) + ' windows')
+    logger.info(f'TEST #11 - Get Last Values of all Water_Mains items: ' + str(osc.get_last_values(pattern='^Water_Mains_')))
+    logger.info(f'TEST #12 - Get Values of Water_Mains_Water_Mains_Count_Scale_Gallons for the last hour: ' + str(osc.get_values_since('Water_Mains_Water_Mains_Count_Scale_Gallons', datetime.now() - timedelta(hours=1))))
+    oh_query_stats.shared().log_summary()
     
 if __name__ == "__main__":
     main()
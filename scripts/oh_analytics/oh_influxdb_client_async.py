@@ -0,0 +1,235 @@
+'''
+asyncio twin of oh_influxdb_client built on InfluxDBClientAsync. The configuration, the Flux query builder and the
+result helpers are shared with a synchronous oh_influxdb_client; only the HTTP round-trips are awaited, so independent
+queries can run concurrently with asyncio.gather instead of one after the other.
+'''
+import asyncio
+import csv
+import io
+import logging
+import warnings
+from datetime import datetime, timedelta
+from influxdb_client import Dialect
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+from influxdb_client.client.warnings import MissingPivotFunction
+import oh_columnar
+import oh_influxdb_client
+import oh_query_stats
+
+class oh_influxdb_client_async():
+
+    # Same windows as the synchronous client
+    WINDOW_TIMEZONE = oh_influxdb_client.oh_influxdb_client.WINDOW_TIMEZONE
+
+    def __init__(self, logger, client=None) -> None:
+        if logger == None:
+            # Configure Logger
+            logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._logger.info('OH InfluxDB Async Client object init')
+        if client == None:
+            client = oh_influxdb_client.oh_influxdb_client(self._logger)
+        # Synchronous client: conf, query builder and result helpers (and the cached measurement catalog)
+        self._sync_client = client
+        self._connection_conf = client._connection_conf
+        self._flux = client._flux
+        self._client = None
+        self._connect_lock = asyncio.Lock()
+
+    # Connect to the InfluxDB Server. The aiohttp session belongs to the running event loop.
+    async def _connect(self) -> bool:
+        async with self._connect_lock:
+            if self._client == None:
+                try:
+                    self._logger.info('Connecting to InfluxDB Server...')
+                    client = InfluxDBClientAsync(url=self._connection_conf['url'],
+                                                 token=self._connection_conf['token'],
+                                                 org=self._connection_conf['org'])
+                    if not await client.ping():
+                        await client.close()
+                        raise Exception('InfluxDB Server did not answer the ping')
+                    self._client = client
+                    self._logger.info('Connected to InfluxDB Server.')
+                except Exception as e:
+                    self._logger.warning(f'Error connecting to InfluxDB Server: {e}')
+        return (self._client is not None)
+
+    async def _basic_query(self, query, params=None):
+        # (Re-)Connect to OH Database
+        if not await self._connect():
+            return None
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            result = await self._client.query_api().query(query, org=self._connection_conf['org'], params=params)
+            sample.add_result(result)
+        return result
+
+    async def _columnar_query(self, query, params=None) -> oh_columnar.oh_columnar_series:
+        # (Re-)Connect to OH Database
+        if not await self._connect():
+            return None
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            text = await self._client.query_api().query_raw(query, org=self._connection_conf['org'], params=params)
+            series = oh_columnar.from_flux_csv(csv.reader(io.StringIO(text)))
+            sample.add_result(series)
+        return series
+
+    async def _data_frame_query(self, query, params=None):
+        # (Re-)Connect to OH Database
+        if not await self._connect():
+            return None
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            with warnings.catch_warnings():
+                # The query already keeps only _time / _value, so there is nothing to pivot
+                warnings.simplefilter('ignore', MissingPivotFunction)
+                data_frames = await self._client.query_api().query_data_frame(query, org=self._connection_conf['org'], params=params,
+                                                                              data_frame_index=['_time'])
+            frame = oh_columnar.frame_from_flux(data_frames)
+            sample.add_result(frame)
+        return frame
+
+    async def _arrow_query(self, query, params=None):
+        # (Re-)Connect to OH Database
+        if not await self._connect():
+            return None
+        with oh_query_stats.shared().measure('influxdb', self._flux.shape_of(query)) as sample:
+            text = await self._client.query_api().query_raw(query, org=self._connection_conf['org'], params=params,
+                                                            dialect=Dialect(header=True, annotations=[], date_time_format='RFC3339'))
+            table = oh_columnar.arrow_from_flux_csv(io.BytesIO(text.encode('utf-8')))
+            sample.add_result(table)
+        return table
+
+    # Same result modes as oh_influxdb_client._range_query
+    async def _range_query(self, oh_item_name, start, stop, result):
+        if result == oh_columnar.RESULT_RECORDS:
+            return self._sync_client._record_values(await self._basic_query(*self._flux.build('values', start, stop, item=oh_item_name)))
+        query, params = self._flux.build('stream', start, stop, item=oh_item_name)
+        return await self._series_query(query, params, result)
+
+    async def _series_query(self, query, params, result):
+        if result == oh_columnar.RESULT_COLUMNAR:
+            return await self._columnar_query(query, params)
+        if result == oh_columnar.RESULT_DATAFRAME:
+            return await self._data_frame_query(query, params)
+        if result == oh_columnar.RESULT_ARROW:
+            return await self._arrow_query(query, params)
+        raise ValueError(f'Unknown result mode: {result}')
+
+    # The catalog is cached (and refreshed in the background) by the synchronous client
+    async def get_item_list(self) -> dict:
+        return await asyncio.to_thread(self._sync_client.get_item_list)
+
+    async def get_item_catalog(self) -> dict:
+        return await asyncio.to_thread(self._sync_client.get_item_catalog)
+
+    async def get_last_value(self, oh_item_name) -> dict:
+        result = await self._basic_query(*self._flux.build('last', timedelta(days=-30), item=oh_item_name))
+        return self._sync_client._first_record_value(result)
+
+    async def get_last_values(self, oh_item_names=None, pattern=None) -> dict:
+        if oh_item_names != None and len(oh_item_names) == 0:
+            return dict()
+        result = await self._basic_query(*self._sync_client._last_values_query(oh_item_names, pattern))
+        return self._sync_client._last_values(result)
+
+    # Values newer than last_ts (time > last_ts) as dict < time, value > in time order; None if not connected
+    async def get_values_since(self, oh_item_name, last_ts) -> dict:
+        result = await self._basic_query(*self._flux.build('since', last_ts, item=oh_item_name))
+        if result == None:
+            return None
+        return {record.get_time(): record.get_value() for table in result for record in table.records}
+
+    async def get_row_count(self, oh_item_name) -> int:
+        result = await self._basic_query(*self._flux.build('count', self._sync_client.HISTORY_START, item=oh_item_name))
+        return self._sync_client._first_record_value(result)
+
+    async def get_values_for_day(self, oh_item_name, day, result=oh_columnar.RESULT_RECORDS):
+        startDate, endDate = self._sync_client._day_window(day)
+        return await self._range_query(oh_item_name, startDate, endDate, result)
+
+    async def get_first_value_for_day(self, oh_item_name, day) -> dict:
+        startDate, endDate = self._sync_client._day_window(day)
+        result = await self._basic_query(*self._flux.build('first', startDate, endDate, item=oh_item_name))
+        return self._sync_client._first_record_value(result)
+
+    # First (time, value) for start <= time < stop, reduced to that one point on the server; None if not found
+    async def get_first_sample(self, oh_item_name, start, stop) -> tuple:
+        result = await self._basic_query(*self._flux.build('first_sample', start, stop, item=oh_item_name))
+        if result and len(result) > 0 and len(result[0].records) > 0:
+            record = result[0].records[0]
+            return (record.get_time(), record.get_value())
+        return None
+
+    async def get_values_for_month(self, oh_item_name, month, result=oh_columnar.RESULT_RECORDS):
+        startDate, endDate = self._sync_client._month_window(month)
+        return await self._range_query(oh_item_name, startDate, endDate, result)
+
+    async def get_first_value_for_month(self, oh_item_name, month) -> dict:
+        startDate, endDate = self._sync_client._month_window(month)
+        result = await self._basic_query(*self._flux.build('first', startDate, endDate, item=oh_item_name))
+        return self._sync_client._first_record_value(result)
+
+    async def get_all_values(self, oh_item_name, result=oh_columnar.RESULT_RECORDS):
+        return await self._range_query(oh_item_name, self._sync_client.HISTORY_START, None, result)
+
+    async def get_windowed(self, oh_item_name, start, stop, every='1h', fn='mean', result=oh_columnar.RESULT_COLUMNAR):
+        query, params = self._sync_client._windowed_query(oh_item_name, start, stop, every, fn)
+        return await self._series_query(query, params, result)
+
+    # Stream (time, value) tuples for start <= time < stop (stop None = now); with batch_size, lists of up to batch_size
+    # tuples are yielded instead. The response is closed when the caller stops early (aclose() or leaving the async for).
+    async def iter_values(self, oh_item_name, start=oh_influxdb_client.oh_influxdb_client.HISTORY_START, stop=None, batch_size=None):
+        # (Re-)Connect to OH Database
+        if not await self._connect():
+            return
+        query, params = self._flux.build('stream', start, stop, item=oh_item_name)
+        # Recorded as one query timed up to the server's response; rows are counted until the generator finishes
+        with oh_query_stats.shared().measure('influxdb', 'stream') as sample:
+            records = await self._client.query_api().query_stream(query, org=self._connection_conf['org'], params=params)
+            sample.stop_timing()
+            try:
+                if batch_size == None:
+                    async for record in records:
+                        sample.rows += 1
+                        yield (record.get_time(), record.get_value())
+                else:
+                    batch = list()
+                    async for record in records:
+                        batch.append((record.get_time(), record.get_value()))
+                        if len(batch) >= batch_size:
+                            sample.rows += len(batch)
+                            yield batch
+                            batch = list()
+                    if len(batch) > 0:
+                        sample.rows += len(batch)
+                        yield batch
+            finally:
+                await records.aclose()
+
+    async def close(self):
+        if self._client != None:
+            await self._client.close()
+            self._client = None
+
+async def run_tests(logger):
+    osc = oh_influxdb_client_async(logger)
+    item_name = 'Water_Mains_Water_Mains_Count_Scale_Gallons'
+    start = datetime.now()
+    first_of_day, first_of_month, last_value = await asyncio.gather(osc.get_first_value_for_day(item_name, datetime.now()),
+                                                                    osc.get_first_value_for_month(item_name, datetime.now()),
+                                                                    osc.get_last_value(item_name))
+    logger.info(f'TEST #1 - Concurrent First of Day / First of Month / Last Value: {first_of_day} / {first_of_month} / {last_value} in {(datetime.now() - start).total_seconds():.3f} s')
+    days = await asyncio.gather(*[osc.get_values_for_day(item_name, datetime.now() - timedelta(days=offset), oh_columnar.RESULT_COLUMNAR) for offset in range(7)])
+    logger.info(f'TEST #2 - Concurrent Measurements for the last 7 days: ' + str([len(day) for day in days]) + ' measurements')
+    oh_query_stats.shared().log_summary()
+    await osc.close()
+
+def main():
+    # Configure Logger
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    asyncio.run(run_tests(logger))
+
+if __name__ == "__main__":
+    main()
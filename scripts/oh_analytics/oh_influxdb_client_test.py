@@ -0,0 +1,52 @@
+'''
+Tests of oh_influxdb_client against the stand-in InfluxDB server of bench_backends (no InfluxDB server): the
+measurement catalog maps every item to its last write time, is cached, and is retried after the server was down.
+Run with: python -m unittest oh_influxdb_client_test
+'''
+import logging
+import unittest
+from datetime import datetime, timedelta, timezone
+import bench_backends
+
+class oh_influxdb_client_test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        now = datetime.now().replace(microsecond=0)
+        cls._last_time = now - timedelta(minutes=10)
+        cls._server = bench_backends.start_standin_influxdb({'Item_B': [(now - timedelta(hours=1), 1.0), (cls._last_time, 2.0)],
+                                                             'Item_A': [(now - timedelta(hours=2), 3.0)]})
+        cls._url = f'http://127.0.0.1:{cls._server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.shutdown()
+        cls._server.server_close()
+
+    def _client(self, url) -> bench_backends.standin_influxdb_client:
+        client = bench_backends.standin_influxdb_client(logging.getLogger(__name__), url)
+        self.addCleanup(client.close)
+        return client
+
+    def test_catalog_holds_last_write_times(self):
+        client = self._client(self._url)
+        catalog = client.get_item_catalog()
+        self.assertEqual(list(catalog), ['Item_A', 'Item_B'])
+        self.assertEqual(catalog['Item_B'], self._last_time.astimezone(timezone.utc))
+        self.assertEqual(client.get_item_list(), {1: 'Item_A', 2: 'Item_B'})
+
+    def test_catalog_is_cached(self):
+        client = self._client(self._url)
+        catalog = client.get_item_catalog()
+        # Served from the cache, not rebuilt by another query
+        self.assertIs(client.get_item_catalog(), catalog)
+
+    def test_unreachable_server_has_no_catalog(self):
+        client = self._client('http://127.0.0.1:1')
+        self.assertIsNone(client.get_item_catalog())
+        self.assertIsNone(client.get_item_list())
+        # The next attempt waits for the retry delay instead of querying on every call
+        self.assertIsNotNone(client._catalog_retry_time)
+
+if __name__ == "__main__":
+    unittest.main()
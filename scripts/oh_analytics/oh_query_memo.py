@@ -0,0 +1,177 @@
+'''
+Short-TTL memoization with in-flight deduplication ("singleflight") for the history lookups of oh_sql_client,
+oh_influxdb_client, their async twins and the oh_backend adapters. Identical calls made while one is in flight wait
+for that request instead of issuing their own; results are then reused for ttl_secs. Cached results are shared
+between callers and must not be modified. Methods that are not memoized are passed straight through.
+'''
+import asyncio
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic
+
+# A request in flight; callers of the same query wait on it
+class oh_query_flight():
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class oh_query_memo():
+
+    # Memo Defaults
+    TTL_SECS = 5.0
+    MAX_ENTRIES = 1024
+
+    # Memoized methods. Window methods are keyed by the day / month of their second argument, so calls made with
+    # datetime.now() share an entry.
+    MEMO_METHODS = ('get_item_list', 'get_item_names', 'get_last_value', 'get_last_values', 'get_row_count',
+                    'get_values_for_day', 'get_first_value_for_day', 'get_values_for_month', 'get_first_value_for_month',
+                    'get_values_between', 'get_aggregates', 'get_windowed')
+    DAY_METHODS = ('get_values_for_day', 'get_first_value_for_day')
+    MONTH_METHODS = ('get_values_for_month', 'get_first_value_for_month')
+
+    def __init__(self, logger, client, ttl_secs=TTL_SECS, max_entries=MAX_ENTRIES) -> None:
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._client = client
+        self._ttl_secs = ttl_secs
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (value, expiry)
+        self._entries = OrderedDict()
+        self._in_flight = dict()
+        self._async_in_flight = dict()
+        self._counters = {'hits': 0, 'misses': 0, 'coalesced': 0}
+        self._wrappers = dict()
+
+    # Memoized methods are wrapped once; anything else goes to the wrapped client
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in self.MEMO_METHODS:
+            return attribute
+        wrapper = self._wrappers.get(name)
+        if wrapper == None:
+            if inspect.iscoroutinefunction(attribute):
+                async def wrapper(*args, **kwargs):
+                    return await self._call_async(name, args, kwargs)
+            else:
+                def wrapper(*args, **kwargs):
+                    return self._call(name, args, kwargs)
+            self._wrappers[name] = wrapper
+        return wrapper
+
+    # Hashable key for a call
+    def _key(self, name, args, kwargs) -> tuple:
+        args = list(args)
+        if len(args) > 1 and isinstance(args[1], datetime):
+            if name in self.DAY_METHODS:
+                args[1] = args[1].date()
+            elif name in self.MONTH_METHODS:
+                args[1] = (args[1].year, args[1].month)
+        return (name, self._freeze(args), self._freeze(kwargs))
+
+    def _freeze(self, value):
+        if isinstance(value, dict):
+            return tuple(sorted((key, self._freeze(item)) for (key, item) in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(self._freeze(item) for item in value)
+        if isinstance(value, (set, frozenset)):
+            return tuple(sorted(value))
+        return value
+
+    # Cached value of a key (found, value); counts a hit
+    def _cached(self, key) -> tuple:
+        entry = self._entries.get(key)
+        if entry == None:
+            return (False, None)
+        (value, expiry) = entry
+        if monotonic() >= expiry:
+            del self._entries[key]
+            return (False, None)
+        self._entries.move_to_end(key)
+        self._counters['hits'] += 1
+        return (True, value)
+
+    # Keep a successful result for the TTL. Failed queries (None) are shared with waiting callers but not kept.
+    def _remember(self, key, value):
+        if value == None or self._ttl_secs <= 0:
+            return
+        self._entries[key] = (value, monotonic() + self._ttl_secs)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _call(self, name, args, kwargs):
+        key = self._key(name, args, kwargs)
+        with self._lock:
+            found, value = self._cached(key)
+            if found:
+                return value
+            flight = self._in_flight.get(key)
+            leader = flight == None
+            if leader:
+                flight = oh_query_flight()
+                self._in_flight[key] = flight
+                self._counters['misses'] += 1
+            else:
+                self._counters['coalesced'] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error != None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = getattr(self._client, name)(*args, **kwargs)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if flight.error == None:
+                    self._remember(key, flight.value)
+            flight.done.set()
+
+    # Same as _call for coroutine methods; in-flight queries are shared as tasks of the running event loop
+    async def _call_async(self, name, args, kwargs):
+        key = self._key(name, args, kwargs)
+        with self._lock:
+            found, value = self._cached(key)
+            if found:
+                return value
+            task = self._async_in_flight.get(key)
+            if task == None:
+                task = asyncio.ensure_future(getattr(self._client, name)(*args, **kwargs))
+                self._async_in_flight[key] = task
+                task.add_done_callback(lambda done: self._finish_async(key, done))
+                self._counters['misses'] += 1
+            else:
+                self._counters['coalesced'] += 1
+        # A cancelled caller must not cancel the query of the others
+        return await asyncio.shield(task)
+
+    def _finish_async(self, key, task):
+        with self._lock:
+            del self._async_in_flight[key]
+            if not task.cancelled() and task.exception() == None:
+                self._remember(key, task.result())
+
+    # Drop every memoized result (e.g. after a write)
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # Hit / miss / coalesce counters plus current sizes
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters['entries'] = len(self._entries)
+            counters['in_flight'] = len(self._in_flight) + len(self._async_in_flight)
+        return counters
@@ -0,0 +1,95 @@
+'''
+Tests of oh_query_memo around a stand-in client (no database server): results are reused within the TTL and per
+day, failed queries are not kept, and identical calls in flight at the same time share one query.
+Run with: python -m unittest oh_query_memo_test
+'''
+import asyncio
+import logging
+import unittest
+from datetime import datetime
+import oh_query_memo
+
+# Client stand-in that counts its queries; get_last_value returns None while it is unreachable
+class standin_client():
+
+    def __init__(self) -> None:
+        self.queries = list()
+        self.reachable = True
+
+    def get_last_value(self, oh_item_name):
+        self.queries.append(oh_item_name)
+        return (datetime(2024, 1, 1), 1.5) if self.reachable else None
+
+    def get_first_value_for_day(self, oh_item_name, day):
+        self.queries.append(oh_item_name)
+        return {datetime(day.year, day.month, day.day): 1.0}
+
+    def close(self):
+        self.queries.append('close')
+
+# Async client stand-in whose queries wait until the test releases them
+class standin_client_async():
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def get_last_value(self, oh_item_name):
+        self.queries += 1
+        self.started.set()
+        await self.release.wait()
+        return (datetime(2024, 1, 1), 1.5)
+
+class oh_query_memo_test(unittest.TestCase):
+
+    def _memo(self, client, ttl_secs=oh_query_memo.oh_query_memo.TTL_SECS) -> oh_query_memo.oh_query_memo:
+        return oh_query_memo.oh_query_memo(logging.getLogger(__name__), client, ttl_secs)
+
+    def test_results_are_reused(self):
+        client = standin_client()
+        memo = self._memo(client)
+        self.assertEqual(memo.get_last_value('Item'), (datetime(2024, 1, 1), 1.5))
+        self.assertEqual(memo.get_last_value('Item'), (datetime(2024, 1, 1), 1.5))
+        memo.get_last_value('Other')
+        # Window lookups made at different times of one day share an entry
+        memo.get_first_value_for_day('Item', datetime(2024, 1, 1, 8))
+        memo.get_first_value_for_day('Item', datetime(2024, 1, 1, 20))
+        self.assertEqual(client.queries, ['Item', 'Other', 'Item'])
+        self.assertEqual(memo.stats(), {'hits': 2, 'misses': 3, 'coalesced': 0, 'entries': 3, 'in_flight': 0})
+        memo.clear()
+        memo.get_last_value('Item')
+        self.assertEqual(len(client.queries), 4)
+
+    def test_failed_query_is_not_kept(self):
+        client = standin_client()
+        memo = self._memo(client)
+        client.reachable = False
+        self.assertIsNone(memo.get_last_value('Item'))
+        client.reachable = True
+        self.assertEqual(memo.get_last_value('Item'), (datetime(2024, 1, 1), 1.5))
+        self.assertEqual(len(client.queries), 2)
+
+    def test_no_ttl_and_pass_through(self):
+        client = standin_client()
+        memo = self._memo(client, ttl_secs=0)
+        memo.get_last_value('Item')
+        memo.get_last_value('Item')
+        memo.close()
+        self.assertEqual(client.queries, ['Item', 'Item', 'close'])
+
+    def test_calls_in_flight_share_one_query(self):
+        async def run():
+            client = standin_client_async()
+            memo = self._memo(client)
+            calls = [asyncio.create_task(memo.get_last_value('Item')) for n in range(3)]
+            await client.started.wait()
+            client.release.set()
+            return (client, memo, await asyncio.gather(*calls))
+        (client, memo, results) = asyncio.run(run())
+        self.assertEqual(results, [(datetime(2024, 1, 1), 1.5)] * 3)
+        self.assertEqual(client.queries, 1)
+        self.assertEqual(memo.stats(), {'hits': 0, 'misses': 1, 'coalesced': 2, 'entries': 1, 'in_flight': 0})
+
+if __name__ == "__main__":
+    unittest.main()
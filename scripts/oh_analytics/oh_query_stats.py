@@ -0,0 +1,229 @@
+'''
+Per-query instrumentation for the persistence clients. Every query records its wall time, rows, decoded bytes and
+query shape; these roll up into per (backend, shape) latency histograms that can be written as a Prometheus textfile
+(node_exporter textfile collector, see export_textfile) or logged as one summary line per shape. Queries slower than a
+threshold are logged as they happen. A streamed query is timed up to its server round-trip / first batch, not while
+the consumer reads it. Rows are counted as they are fetched. Bytes are exact for columnar results (Arrow, DataFrame,
+oh_columnar_series) and estimated for row results (rows times the size of the first row's values).
+The clients record into the process-wide shared() instance.
+'''
+import atexit
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+# Rows and bytes of one query, filled in while it runs
+class oh_query_sample():
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.nbytes = 0
+        # perf_counter() at which timing stopped (None = at the end of the with-block)
+        self.end = None
+
+    # Stop timing the query here (e.g. when a stream's first batch arrived); rows counted later still add up
+    def stop_timing(self):
+        if self.end == None:
+            self.end = perf_counter()
+
+    # Rows fetched as a list of row tuples; their bytes are estimated from the first row
+    def add_rows(self, rows):
+        self.rows += len(rows)
+        if len(rows) > 0:
+            self.nbytes += len(rows) * _row_nbytes(rows[0])
+
+    # Wrap a DB-API cursor so the rows fetched through it are added to this sample
+    def count_rows(self, cursor):
+        return oh_counting_cursor(cursor, self)
+
+    # Rows / bytes of a decoded query result: Arrow table, DataFrame, oh_columnar_series or FluxTable list
+    def add_result(self, result):
+        if result is None:
+            return
+        if hasattr(result, 'num_rows'):
+            self.rows += result.num_rows
+            self.nbytes += result.nbytes
+        elif hasattr(result, 'memory_usage'):
+            self.rows += len(result)
+            self.nbytes += int(result.memory_usage(index=True).sum())
+        elif hasattr(result, 'nbytes'):
+            self.rows += len(result)
+            self.nbytes += result.nbytes
+        else:
+            for table in result:
+                self.rows += len(table.records)
+                if len(table.records) > 0:
+                    self.nbytes += len(table.records) * _row_nbytes(table.records[0].values.values())
+
+# Size of the decoded values of one row
+def _row_nbytes(row) -> int:
+    return sum(sys.getsizeof(value) for value in row)
+
+# DB-API cursor that adds the rows fetched through it to a sample; execute, description, close, ... go to the wrapped cursor
+class oh_counting_cursor():
+
+    # Rows fetched per round when the cursor is iterated
+    ITER_FETCH_ROWS = 1000
+
+    def __init__(self, cursor, sample) -> None:
+        self._cursor = cursor
+        self._sample = sample
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row != None:
+            self._sample.add_rows([row])
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size != None else self._cursor.fetchmany()
+        self._sample.add_rows(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._sample.add_rows(rows)
+        return rows
+
+    # Iterating fetches ITER_FETCH_ROWS rows at a time, so rows are counted per round rather than per row
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(self.ITER_FETCH_ROWS)
+            if len(rows) == 0:
+                return
+            yield from rows
+
+class oh_query_stats():
+
+    # Histogram bucket upper bounds (seconds) and the slow query threshold
+    LATENCY_BUCKETS_SECS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    SLOW_QUERY_SECS = 1.0
+    # Seconds between two writes of export_textfile
+    TEXTFILE_INTERVAL_SECS = 60
+
+    def __init__(self, logger=None, slow_query_secs=SLOW_QUERY_SECS, buckets=LATENCY_BUCKETS_SECS) -> None:
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._slow_query_secs = slow_query_secs
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # (backend, shape) -> {'buckets': [count per bucket + overflow], 'count', 'secs', 'rows', 'bytes', 'max_secs'}
+        self._series = dict()
+
+    def record(self, backend, shape, secs, rows=0, nbytes=0):
+        with self._lock:
+            series = self._series.get((backend, shape))
+            if series == None:
+                series = {'buckets': [0] * (len(self._buckets) + 1), 'count': 0, 'secs': 0.0, 'rows': 0, 'bytes': 0, 'max_secs': 0.0}
+                self._series[(backend, shape)] = series
+            series['buckets'][bisect_left(self._buckets, secs)] += 1
+            series['count'] += 1
+            series['secs'] += secs
+            series['rows'] += rows
+            series['bytes'] += nbytes
+            series['max_secs'] = max(series['max_secs'], secs)
+        if self._slow_query_secs != None and secs >= self._slow_query_secs:
+            self._logger.warning(f'Slow {backend} query ({shape}): {secs:.3f} s, {rows} rows, {nbytes} bytes')
+
+    # Time the with-block (or up to sample.stop_timing()) as one query; the caller fills in the yielded sample's rows / bytes
+    @contextmanager
+    def measure(self, backend, shape):
+        sample = oh_query_sample()
+        start = perf_counter()
+        try:
+            yield sample
+        finally:
+            end = sample.end if sample.end != None else perf_counter()
+            self.record(backend, shape, end - start, sample.rows, sample.nbytes)
+
+    # Copy of the rolled up series: {(backend, shape): {...}}
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: dict(series, buckets=list(series['buckets'])) for (key, series) in self._series.items()}
+
+    # Prometheus text exposition format
+    def to_prometheus(self) -> str:
+        series = self.snapshot()
+        lines = ['# HELP oh_query_duration_seconds Wall time of persistence queries.',
+                 '# TYPE oh_query_duration_seconds histogram']
+        for ((backend, shape), values) in sorted(series.items()):
+            labels = f'backend="{backend}",shape="{shape}"'
+            cumulative = 0
+            for (bound, count) in zip(self._buckets, values['buckets']):
+                cumulative += count
+                lines.append(f'oh_query_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'oh_query_duration_seconds_bucket{{{labels},le="+Inf"}} {values["count"]}')
+            lines.append(f'oh_query_duration_seconds_sum{{{labels}}} {values["secs"]:.6f}')
+            lines.append(f'oh_query_duration_seconds_count{{{labels}}} {values["count"]}')
+        for (metric, key, help_text) in (('oh_query_rows_total', 'rows', 'Rows returned by persistence queries.'),
+                                         ('oh_query_bytes_total', 'bytes', 'Bytes decoded from persistence query results.')):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for ((backend, shape), values) in sorted(series.items()):
+                lines.append(f'{metric}{{backend="{backend}",shape="{shape}"}} {values[key]}')
+        return '\n'.join(lines) + '\n'
+
+    # Write the Prometheus textfile atomically, so the collector never reads a partial file
+    def write_textfile(self, path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as textfile:
+            textfile.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    # Write the textfile every interval_secs on a daemon thread, and a last time when the interpreter exits
+    def export_textfile(self, path, interval_secs=TEXTFILE_INTERVAL_SECS):
+        stopped = threading.Event()
+        def export():
+            while not stopped.wait(interval_secs):
+                self._export_textfile(path)
+        def export_at_exit():
+            stopped.set()
+            self._export_textfile(path)
+        threading.Thread(target=export, name='oh_query_stats_textfile', daemon=True).start()
+        atexit.register(export_at_exit)
+        self._logger.info(f'Query stats textfile: {path} (every {interval_secs} s)')
+
+    # A failed write is logged; the next one tries again
+    def _export_textfile(self, path):
+        try:
+            self.write_textfile(path)
+        except OSError as e:
+            self._logger.warning(f'Error writing query stats textfile {path}: {e}')
+
+    # One log line per (backend, shape): count, mean / approximate p95 / max latency, rows and bytes
+    def log_summary(self):
+        for ((backend, shape), values) in sorted(self.snapshot().items()):
+            mean_ms = values['secs'] / values['count'] * 1000
+            self._logger.info(f'Query stats {backend}/{shape}: {values["count"]} queries, mean {mean_ms:.1f} ms, '
+                              f'p95 <= {self._quantile_bound(values, 0.95)}, max {values["max_secs"] * 1000:.1f} ms, '
+                              f'{values["rows"]} rows, {values["bytes"]} bytes')
+
+    # Upper bound of the histogram bucket holding the given quantile
+    def _quantile_bound(self, values, quantile) -> str:
+        target = quantile * values['count']
+        cumulative = 0
+        for (bound, count) in zip(self._buckets, values['buckets']):
+            cumulative += count
+            if cumulative >= target:
+                return f'{bound * 1000:g} ms'
+        return f'{self._buckets[-1] * 1000:g}+ ms'
+
+_shared = None
+_shared_lock = threading.Lock()
+
+# Process-wide instance the persistence clients record into
+def shared() -> oh_query_stats:
+    global _shared
+    with _shared_lock:
+        if _shared == None:
+            _shared = oh_query_stats()
+        return _shared
@@ -0,0 +1,74 @@
+'''
+Tests of oh_query_stats: rows are counted as a cursor is read, bytes come from columnar results, queries roll up per
+(backend, shape) into histograms and the Prometheus textfile, and slow queries are logged.
+Run with: python -m unittest oh_query_stats_test
+'''
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import oh_columnar
+import oh_query_stats
+
+class oh_query_stats_test(unittest.TestCase):
+
+    def setUp(self):
+        self._stats = oh_query_stats.oh_query_stats(logging.getLogger(__name__), slow_query_secs=None)
+        self._db = sqlite3.connect(':memory:')
+        self._db.execute('CREATE TABLE item0001 (time TEXT, value DOUBLE)')
+        self._db.executemany('INSERT INTO item0001 VALUES (?, ?)', [(f'2024-01-01 00:{n:02}:00', float(n)) for n in range(50)])
+
+    def tearDown(self):
+        self._db.close()
+
+    def test_rows_are_counted_as_fetched(self):
+        for (shape, read) in (('iterate', lambda cursor: list(cursor)), ('fetchone', lambda cursor: cursor.fetchone()),
+                              ('fetchmany', lambda cursor: cursor.fetchmany(20)), ('fetchall', lambda cursor: cursor.fetchall())):
+            with self._stats.measure('sql', shape) as sample:
+                cursor = sample.count_rows(self._db.cursor())
+                cursor.execute('SELECT time, value FROM item0001')
+                read(cursor)
+        series = self._stats.snapshot()
+        self.assertEqual({shape: values['rows'] for ((backend, shape), values) in series.items()},
+                         {'iterate': 50, 'fetchone': 1, 'fetchmany': 20, 'fetchall': 50})
+        # Row bytes are estimated from the first row
+        self.assertEqual(series[('sql', 'fetchall')]['bytes'], 50 * series[('sql', 'fetchone')]['bytes'])
+        self.assertGreater(series[('sql', 'fetchone')]['bytes'], 0)
+
+    def test_columnar_bytes(self):
+        result = oh_columnar.oh_columnar_series(np.zeros(10, dtype='datetime64[ns]'), np.zeros(10))
+        with self._stats.measure('influxdb', 'stream') as sample:
+            sample.add_result(result)
+        self.assertEqual(self._stats.snapshot()[('influxdb', 'stream')]['rows'], 10)
+        self.assertEqual(self._stats.snapshot()[('influxdb', 'stream')]['bytes'], 160)
+
+    def test_histogram_and_textfile(self):
+        self._stats.record('sql', 'last', 0.002, rows=1)
+        self._stats.record('sql', 'last', 0.3, rows=1)
+        self._stats.record('sql', 'last', 20.0, rows=1)
+        values = self._stats.snapshot()[('sql', 'last')]
+        self.assertEqual((values['count'], values['rows'], values['max_secs']), (3, 3, 20.0))
+        text = self._stats.to_prometheus()
+        self.assertIn('oh_query_duration_seconds_bucket{backend="sql",shape="last",le="0.005"} 1', text)
+        self.assertIn('oh_query_duration_seconds_bucket{backend="sql",shape="last",le="0.5"} 2', text)
+        self.assertIn('oh_query_duration_seconds_bucket{backend="sql",shape="last",le="+Inf"} 3', text)
+        self.assertIn('oh_query_rows_total{backend="sql",shape="last"} 3', text)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'oh_query_stats.prom')
+            self._stats.write_textfile(path)
+            with open(path, 'r') as textfile:
+                self.assertEqual(textfile.read(), text)
+            self.assertEqual(os.listdir(tmp_dir), ['oh_query_stats.prom'])
+
+    def test_slow_query_is_logged(self):
+        stats = oh_query_stats.oh_query_stats(logging.getLogger(__name__), slow_query_secs=1.0)
+        with self.assertLogs(__name__, logging.WARNING) as logs:
+            stats.record('influxdb', 'values', 1.5, rows=7)
+            stats.record('influxdb', 'values', 0.1, rows=7)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Slow influxdb query (values): 1.500 s, 7 rows', logs.output[0])
+
+if __name__ == "__main__":
+    unittest.main()
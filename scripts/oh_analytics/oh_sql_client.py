@@ -1,18 +1,24 @@
-
 import sys
 from datetime import datetime, date, time
 import logging
 from typing import Any
+from time import monotonic, sleep
+from contextlib import contextmanager
+import threading
 import mariadb
 import json
 from os.path import exists
 import os
+import oh_sql_pool
+import oh_columnar
+import oh_query_stats
 
 class oh_sql_client():
 
     # OH SQL Client Globals
     _logger = None
-    _connection = None
+    _pool = None
+    _pool_size = oh_sql_pool.oh_sql_pool.DEFAULT_MAX_SIZE
     _connection_conf = dict()
 
     _user = None
@@ -21,7 +27,59 @@ class oh_sql_client():
     _port = 3306
     _database = None
 
-    def __init__(self, logger) -> None:
+    # Item name -> table name index. Rebuilt on a miss or once the TTL expires (None = never expire).
+    ITEM_INDEX_TTL_SECS = 3600
+    _item_index = None
+    _item_index_time = None
+    _item_index_ttl_secs = ITEM_INDEX_TTL_SECS
+    # Table name -> type of its value column (DOUBLE, VARCHAR(...), ...); loaded by the first multi-item query after
+    # an item index refresh (None = not loaded)
+    _value_types = None
+
+    # Streaming reads: rows fetched per round-trip and the cursor options that keep the result set on the server
+    ITER_CHUNK_SIZE = 5000
+    STREAM_CURSOR_ARGS = {'buffered': False}
+
+    # Server-side aggregation: bucket start expressions and aggregate columns for get_aggregates()
+    AGGREGATE_BUCKETS = {
+        'hour': 'DATE_ADD(CAST(time AS DATE), INTERVAL HOUR(time) HOUR)',
+        'day': 'CAST(time AS DATE)',
+        'month': 'DATE_SUB(CAST(time AS DATE), INTERVAL DAYOFMONTH(time) - 1 DAY)',
+    }
+    AGGREGATE_FUNCTIONS = {
+        'min': 'MIN(value)',
+        'max': 'MAX(value)',
+        'avg': 'AVG(value)',
+        'sum': 'SUM(value)',
+        'count': 'COUNT(*)',
+        'first': 'MIN(first_value)',
+        'last': 'MIN(last_value)',
+    }
+    DEFAULT_AGGREGATES = ('min', 'max', 'avg', 'first', 'last', 'count')
+
+    # Statement cache: one SQL text per (query shape, table) with the time bounds as ? parameters.
+    # Each pooled connection keeps one prepared cursor per statement (PREPARED_CURSOR_ARGS).
+    STATEMENT_SHAPES = {
+        'last': 'SELECT time, value FROM {table} ORDER BY time DESC LIMIT 1',
+        'count': 'SELECT COUNT(*) FROM {table}',
+        'all': 'SELECT time, value FROM {table} ORDER BY time',
+        'from': 'SELECT time, value FROM {table} WHERE time >= ? ORDER BY time',
+        'since': 'SELECT time, value FROM {table} WHERE time > ? ORDER BY time',
+        'to': 'SELECT time, value FROM {table} WHERE time < ? ORDER BY time',
+        'range': 'SELECT time, value FROM {table} WHERE time >= ? AND time < ? ORDER BY time',
+        'first_in_range': 'SELECT time, value FROM {table} WHERE time >= ? AND time < ? ORDER BY time LIMIT 1',
+    }
+    PREPARED_CURSOR_ARGS = {'prepared': True}
+    _statements = None
+
+    # Multi-item queries: item tables per UNION ALL statement
+    UNION_BATCH_SIZE = 200
+
+    # tail(): seconds between polls, and the high-water mark used for items that have no rows yet
+    TAIL_INTERVAL_SECS = 5.0
+    TAIL_EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, logger, item_index_ttl_secs=ITEM_INDEX_TTL_SECS, pool_size=oh_sql_pool.oh_sql_pool.DEFAULT_MAX_SIZE) -> None:
         if logger == None:
             # Configure Logger
             logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
@@ -29,7 +87,15 @@ class oh_sql_client():
         else:
             self._logger = logger
         self._logger.info('OH SQL Client object init')
-        self._connection = None
+        self._pool = None
+        self._pool_size = pool_size
+        self._pool_lock = threading.Lock()
+        self._item_index = dict()
+        self._value_types = None
+        self._item_index_time = None
+        self._item_index_ttl_secs = item_index_ttl_secs
+        self._item_index_lock = threading.Lock()
+        self._statements = dict()
         self._init_server_conf()
         pass
     
@@ -72,120 +138,207 @@ class oh_sql_client():
                 self._logger.info(f'Default conf file written: {json_file_name}\nPlease modify conf file for your system.\nExiting.')
                 sys.exit()
 
-    def _connect(self) -> Any:
-        if self._connection == None:
+    # Open a new connection to the SQL server. Called by the connection pool.
+    def _new_connection(self) -> Any:
+        return mariadb.connect(
+            user=self._connection_conf['user_name'],
+            password=self._connection_conf['user_pwd'],
+            host=self._connection_conf['host'],
+            port=int(self._connection_conf['port']),
+            database=self._connection_conf['database_name'],
+            # Each query must see rows persisted since the connection was opened
+            autocommit=True
+        )
+
+    def _get_pool(self) -> oh_sql_pool.oh_sql_pool:
+        with self._pool_lock:
+            if self._pool == None:
+                self._pool = oh_sql_pool.oh_sql_pool(self._logger, self._new_connection, self._pool_size)
+            return self._pool
+
+    # Check out a pooled connection and yield a cursor owned by the calling thread. Yields None if the server is unreachable.
+    # The with-block is recorded as one query of the given shape in oh_query_stats.
+    @contextmanager
+    def _cursor(self, shape='cursor', **cursor_args):
+        with oh_query_stats.shared().measure('sql', shape) as sample:
+            with self._sampled_cursor(sample, **cursor_args) as cursor:
+                yield cursor
+
+    # Same as _cursor, recording into a sample of the caller's (which can stop its timing early)
+    @contextmanager
+    def _sampled_cursor(self, sample, **cursor_args):
+        with self._get_pool().connection() as pooled:
+            if pooled == None:
+                self._logger.warning("SQL connection failed.")
+                yield None
+                return
+            cursor = pooled.cursor(**cursor_args)
             try:
-                self._logger.info('Connecting to SQL Server...')
-                self._connection = mariadb.connect(
-                    user=self._connection_conf['user_name'],
-                    password=self._connection_conf['user_pwd'],
-                    host=self._connection_conf['host'],
-                    port=int(self._connection_conf['port']),
-                    database=self._connection_conf['database_name']
-                )
-
-            except mariadb.Error as e:
-                self._logger.warn(f"Error connecting to MariaDB Platform: {e}")
+                yield sample.count_rows(cursor)
             finally:
-                self._logger.info('Connected to SQL Server.')
+                cursor.close()
 
-        if (self._connection == None):
-            self._logger.warn("SQL connection failed. Exiting.")
-            return None
-        else:
-            return self._connection.cursor()
+    # Get the cached SQL text for a query shape on a given item table
+    def _statement(self, shape, oh_table_name) -> str:
+        key = (shape, oh_table_name)
+        query = self._statements.get(key)
+        if query == None:
+            query = self.STATEMENT_SHAPES[shape].format(table=oh_table_name)
+            self._statements[key] = query
+        return query
+
+    # Execute a cached statement on the checked out connection's prepared cursor and yield the cursor.
+    # Yields None if the server is unreachable. The with-block is recorded as one query of the shape in oh_query_stats.
+    @contextmanager
+    def _execute(self, shape, oh_table_name, params=tuple()):
+        query = self._statement(shape, oh_table_name)
+        with oh_query_stats.shared().measure('sql', shape) as sample:
+            with self._get_pool().connection() as pooled:
+                if pooled == None:
+                    self._logger.warning("SQL connection failed.")
+                    yield None
+                    return
+                cursor = pooled.prepared(query, **self.PREPARED_CURSOR_ARGS)
+                cursor.execute(query, params)
+                yield sample.count_rows(cursor)
+
+    # Close all pooled connections
+    def close(self):
+        with self._pool_lock:
+            if self._pool != None:
+                self._pool.close()
+                self._pool = None
 
     def get_item_list(self) -> dict:
-        # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
         # Build SQL Query    
         query = "SELECT * FROM items;"
-        result = None
-        cursor.execute(query, result)
-        # Building dict < item #, item name >
-        item_list = dict()
-        for (item_num, item_name) in cursor:
-            item_list[item_num] = item_name
-        return item_list
+        # Connect to OH Database
+        with self._cursor('items') as cursor:
+            if cursor == None:
+                return None
+            cursor.execute(query)
+            # Building dict < item #, item name >
+            item_list = dict()
+            for (item_num, item_name) in cursor:
+                item_list[item_num] = item_name
+            return item_list
 
-    def _get_table_name_from_OH_name(self, oh_item_name) -> str:
+    # Get the type of the value column of every item table as dict < table name, column type >. Return None if not connected.
+    def get_value_types(self) -> dict:
+        # Build SQL Query - the items table does not record the item type; the column definitions do
+        query = "SELECT TABLE_NAME, COLUMN_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME = 'value';"
+        # Connect to OH Database
+        with self._cursor('value_types') as cursor:
+            if cursor == None:
+                return None
+            cursor.execute(query)
+            value_types = dict()
+            for (table_name, column_type) in cursor:
+                value_types[table_name.lower()] = column_type.upper()
+            return value_types
+
+    # Rebuild the item name -> table name index from the items table. Return False if the DB is unreachable.
+    def _refresh_item_index(self) -> bool:
         item_list = self.get_item_list()
-        item_table_index = list(item_list.keys())[list(item_list.values()).index(oh_item_name)]
-        oh_table_name = f'item{item_table_index:04}'
-        return oh_table_name
+        if item_list == None:
+            return False
+        self._item_index = {item_name: f'item{item_num:04}' for (item_num, item_name) in item_list.items()}
+        self._value_types = None
+        self._item_index_time = monotonic()
+        return True
+
+    def _item_index_expired(self) -> bool:
+        if self._item_index_time == None:
+            return True
+        if self._item_index_ttl_secs == None:
+            return False
+        return (monotonic() - self._item_index_time) >= self._item_index_ttl_secs
+
+    # Resolve several OpenHab item names to table names (itemXXXX) at once. Unknown names are left out of the result.
+    def resolve_tables(self, oh_item_names) -> dict:
+        with self._item_index_lock:
+            return self._resolve_tables(oh_item_names)
+
+    def _resolve_tables(self, oh_item_names) -> dict:
+        refreshed = False
+        if self._item_index_expired():
+            refreshed = self._refresh_item_index()
+        tables = dict()
+        missing = list()
+        for oh_item_name in oh_item_names:
+            if oh_item_name in self._item_index:
+                tables[oh_item_name] = self._item_index[oh_item_name]
+            else:
+                missing.append(oh_item_name)
+        # A miss may be an item created since the last refresh
+        if len(missing) > 0 and not refreshed and self._refresh_item_index():
+            for oh_item_name in missing:
+                if oh_item_name in self._item_index:
+                    tables[oh_item_name] = self._item_index[oh_item_name]
+        return tables
+
+    def _get_table_name_from_OH_name(self, oh_item_name) -> str:
+        tables = self.resolve_tables([oh_item_name])
+        if oh_item_name not in tables:
+            raise ValueError(f'Unknown OpenHab item: {oh_item_name}')
+        return tables[oh_item_name]
 
     # Get the last value for a given OpenHab item name. Return None if not found.
     def get_last_value(self, oh_item_name) -> dict:
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        colName = 'time'
-        query = f'SELECT * FROM {oh_table_name} ORDER BY {colName} DESC LIMIT 1'
-        # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Build SQL Query  
-        cursor.execute(query)
-        return cursor.fetchone()
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('last', oh_table_name) as cursor:
+            if cursor == None:
+                return None
+            return cursor.fetchone()
     
     # Get the number of rows (measurement points) for a given OpenHab item name. Return None if not found.
     def get_row_count(self, oh_item_name) -> int:
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        colName = 'time'
-        query = f'SELECT COUNT(*) FROM {oh_table_name}'
-        # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Execute SQL Query  
-        cursor.execute(query)
-        return cursor.fetchone()
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('count', oh_table_name) as cursor:
+            if cursor == None:
+                return None
+            return cursor.fetchone()
     
-    def get_values_for_day(self, oh_item_name, day) -> dict:
+    # result: oh_columnar.RESULT_RECORDS for dict < time, value >, oh_columnar.RESULT_COLUMNAR for an oh_columnar_series
+    def get_values_for_day(self, oh_item_name, day, result=oh_columnar.RESULT_RECORDS) -> dict:
         # Build SQL Query
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        colName = 'time'
         startDate = day
         startDate = datetime(day.year, day.month, day.day, 0, 0, 0)
         endDate = datetime(day.year, day.month, day.day, 23, 59, 59)
-        query = f"SELECT * FROM {oh_table_name} WHERE time >= '{startDate}' AND time < '{endDate}'";
-        # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Execute SQL Query  
-        cursor.execute(query)
-        # Building dict < item #, item name >
-        measurement_list = dict()
-        for (time, value) in cursor:
-            measurement_list[time] = value
-        return measurement_list
+        if result == oh_columnar.RESULT_COLUMNAR:
+            return self._get_columnar(oh_item_name, startDate, endDate)
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('range', oh_table_name, (startDate, endDate)) as cursor:
+            if cursor == None:
+                return None
+            # Building dict < item #, item name >
+            measurement_list = dict()
+            for (time, value) in cursor:
+                measurement_list[time] = value
+            return measurement_list
 
     def get_first_value_for_day(self, oh_item_name, day) -> dict:
         # Build SQL Query
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        colName = 'time'
         startDate = day
         startDate = datetime(day.year, day.month, day.day, 0, 0, 0)
         endDate = datetime(day.year, day.month, day.day, 23, 59, 59)
-        query = f"SELECT * FROM {oh_table_name} WHERE time >= '{startDate}' AND time < '{endDate}' LIMIT 1";
-        # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Execute SQL Query  
-        cursor.execute(query)
-        # Building dict < item #, item name >
-        measurement_list = dict()
-        for (time, value) in cursor:
-            measurement_list[time] = value
-        return measurement_list
-
-    def get_values_for_month(self, oh_item_name, month) -> dict:
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('first_in_range', oh_table_name, (startDate, endDate)) as cursor:
+            if cursor == None:
+                return None
+            # Building dict < item #, item name >
+            measurement_list = dict()
+            for (time, value) in cursor:
+                measurement_list[time] = value
+            return measurement_list
+
+    def get_values_for_month(self, oh_item_name, month, result=oh_columnar.RESULT_RECORDS) -> dict:
         # Build SQL Query
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        colName = 'time'
         startDate = month
         startDate = datetime(month.year, month.month, 1, 0, 0, 0)
         if (month.month == 12):
@@ -193,23 +346,21 @@ class oh_sql_client():
             endDate = datetime(month.year+1, 1, 1, 0, 0, 0)
         else:
             endDate = datetime(month.year, month.month+1, 1, 0, 0, 0)
-        query = f"SELECT * FROM {oh_table_name} WHERE time >= '{startDate}' AND time < '{endDate}'";
-        # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Execute SQL Query  
-        cursor.execute(query)
-        # Building dict < item #, item name >
-        measurement_list = dict()
-        for (time, value) in cursor:
-            measurement_list[time] = value
-        return measurement_list
+        if result == oh_columnar.RESULT_COLUMNAR:
+            return self._get_columnar(oh_item_name, startDate, endDate)
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('range', oh_table_name, (startDate, endDate)) as cursor:
+            if cursor == None:
+                return None
+            # Building dict < item #, item name >
+            measurement_list = dict()
+            for (time, value) in cursor:
+                measurement_list[time] = value
+            return measurement_list
 
     def get_first_value_for_month(self, oh_item_name, month) -> dict:
         # Build SQL Query
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        colName = 'time'
         startDate = month
         startDate = datetime(month.year, month.month, 1, 0, 0, 0)
         if (month.month == 12):
@@ -217,34 +368,250 @@ class oh_sql_client():
             endDate = datetime(month.year+1, 1, 1, 0, 0, 0)
         else:
             endDate = datetime(month.year, month.month+1, 1, 0, 0, 0)
-        query = f"SELECT * FROM {oh_table_name} WHERE time >= '{startDate}' AND time < '{endDate}' LIMIT 1";
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('first_in_range', oh_table_name, (startDate, endDate)) as cursor:
+            if cursor == None:
+                return None
+            # Building dict < item #, item name >
+            measurement_list = dict()
+            for (time, value) in cursor:
+                measurement_list[time] = value
+            return measurement_list
+
+    def get_all_values(self, oh_item_name, result=oh_columnar.RESULT_RECORDS) -> dict:
+        if result == oh_columnar.RESULT_COLUMNAR:
+            return self._get_columnar(oh_item_name, None, None)
+        # Build SQL Query
+        oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('all', oh_table_name) as cursor:
+            if cursor == None:
+                return None
+            # Building dict < item #, item name >
+            measurement_list = dict()
+            for (time, value) in cursor:
+                measurement_list[time] = value
+            return measurement_list
+
+    # Build the WHERE clause (and its parameters) for start <= time < end. Either bound may be None.
+    def _time_range_condition(self, start, end) -> tuple:
+        conditions = list()
+        params = list()
+        if start != None:
+            conditions.append('time >= ?')
+            params.append(start)
+        if end != None:
+            conditions.append('time < ?')
+            params.append(end)
+        if len(conditions) == 0:
+            return ('', tuple())
+        return (' WHERE ' + ' AND '.join(conditions), tuple(params))
+
+    # Build the time ordered (time, value) query for start <= time < end
+    def _range_query(self, oh_item_name, start, end) -> tuple:
+        oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
+        if start != None and end != None:
+            return (self._statement('range', oh_table_name), (start, end))
+        if start != None:
+            return (self._statement('from', oh_table_name), (start,))
+        if end != None:
+            return (self._statement('to', oh_table_name), (end,))
+        return (self._statement('all', oh_table_name), tuple())
+
+    # Fill a columnar series straight from a streaming cursor (start <= time < end)
+    def _get_columnar(self, oh_item_name, start, end) -> oh_columnar.oh_columnar_series:
+        # Build SQL Query
+        query, params = self._range_query(oh_item_name, start, end)
+        # Connect to OH Database
+        with oh_query_stats.shared().measure('sql', 'columnar') as sample:
+            with self._sampled_cursor(sample, **self.STREAM_CURSOR_ARGS) as cursor:
+                if cursor == None:
+                    return None
+                # Execute SQL Query  
+                cursor.execute(query, params)
+                series = oh_columnar.from_cursor(cursor, self.ITER_CHUNK_SIZE)
+                # The rows were decoded into the series: record its size instead of the rows' estimate
+                sample.nbytes = series.nbytes
+                return series
+
+    # Stream the (time, value) rows of an OpenHab item in time order, optionally limited to start <= time < end.
+    # Rows are fetched chunk_size at a time from an unbuffered cursor, so memory stays bounded for any table size.
+    # The generator holds one pooled connection until it is exhausted or closed.
+    def iter_values(self, oh_item_name, start=None, end=None, chunk_size=ITER_CHUNK_SIZE):
+        # Build SQL Query
+        query, params = self._range_query(oh_item_name, start, end)
+        # Connect to OH Database; the query is timed up to its first chunk, not while the caller reads the rows
+        with oh_query_stats.shared().measure('sql', 'iter') as sample:
+            with self._sampled_cursor(sample, **self.STREAM_CURSOR_ARGS) as cursor:
+                if cursor == None:
+                    return
+                # Execute SQL Query and fetch one chunk per round-trip
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    sample.stop_timing()
+                    if len(rows) == 0:
+                        break
+                    for row in rows:
+                        yield (row[0], row[1])
+
+    # Table name -> value column type, loaded once per item index refresh; empty if it cannot be read
+    def _value_type_index(self) -> dict:
+        value_types = self._value_types
+        if value_types == None:
+            value_types = self.get_value_types()
+            self._value_types = value_types
+        return value_types if value_types != None else dict()
+
+    # Resolve item names for a multi-item query and split them into UNION ALL batches. Unknown items are logged and skipped.
+    # Each batch only holds tables whose value column has the same type: a UNION ALL over DOUBLE and VARCHAR tables
+    # would return every value of the batch as a string.
+    def _typed_batches(self, oh_item_names) -> list:
+        tables = self.resolve_tables(oh_item_names)
+        value_types = self._value_type_index()
+        groups = dict()
+        for oh_item_name in oh_item_names:
+            if oh_item_name not in tables:
+                self._logger.warning(f'Unknown OpenHab item skipped: {oh_item_name}')
+                continue
+            oh_table_name = tables[oh_item_name]
+            # A table of unknown type (created since the last refresh) gets a batch of its own
+            group_key = value_types.get(oh_table_name, oh_table_name)
+            groups.setdefault(group_key, list()).append((oh_item_name, oh_table_name))
+        return [items[n:n + self.UNION_BATCH_SIZE] for items in groups.values() for n in range(0, len(items), self.UNION_BATCH_SIZE)]
+
+    # Get the values of several OpenHab items for start <= time < end in one round-trip per value type (and per
+    # UNION_BATCH_SIZE items). Returns dict < item name, dict < time, value > > in time order; unknown items are left out.
+    # Return None if not connected.
+    def get_values_between(self, oh_item_names, start, end) -> dict:
+        where, range_params = self._time_range_condition(start, end)
+        batches = self._typed_batches(oh_item_names)
+        values = {oh_item_name: dict() for batch in batches for (oh_item_name, oh_table_name) in batch}
+        # Connect to OH Database
+        with self._cursor('values_between') as cursor:
+            if cursor == None:
+                return None
+            for batch in batches:
+                # Build SQL Query - each SELECT is tagged with the item's position in the batch
+                selects = [f'SELECT {index} AS item_index, time, value FROM {oh_table_name}{where}' for index, (oh_item_name, oh_table_name) in enumerate(batch)]
+                query = ' UNION ALL '.join(selects) + ' ORDER BY item_index, time'
+                # Execute SQL Query  
+                cursor.execute(query, range_params * len(batch))
+                for (item_index, time, value) in cursor:
+                    values[batch[item_index][0]][time] = value
+        return values
+
+    # Get the last (time, value) of several OpenHab items in one round-trip per value type (and per UNION_BATCH_SIZE items).
+    # Returns dict < item name, (time, value) >; items without rows are left out. Return None if not connected.
+    def get_last_values(self, oh_item_names) -> dict:
+        last_values = dict()
+        batches = self._typed_batches(oh_item_names)
         # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Execute SQL Query  
-        cursor.execute(query)
-        # Building dict < item #, item name >
-        measurement_list = dict()
-        for (time, value) in cursor:
-            measurement_list[time] = value
-        return measurement_list
-
-    def get_all_values(self, oh_item_name) -> dict:
+        with self._cursor('last_values') as cursor:
+            if cursor == None:
+                return None
+            for batch in batches:
+                # Build SQL Query
+                selects = [f'(SELECT {index} AS item_index, time, value FROM {oh_table_name} ORDER BY time DESC LIMIT 1)' for index, (oh_item_name, oh_table_name) in enumerate(batch)]
+                query = ' UNION ALL '.join(selects)
+                # Execute SQL Query  
+                cursor.execute(query)
+                for (item_index, time, value) in cursor:
+                    last_values[batch[item_index][0]] = (time, value)
+        return last_values
+
+    # Get the rows of an OpenHab item newer than last_ts (time > last_ts) as dict < time, value > in time order.
+    # Return None if not connected.
+    def get_values_since(self, oh_item_name, last_ts) -> dict:
+        oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
+        # Connect to OH Database and execute the prepared SQL Query
+        with self._execute('since', oh_table_name, (last_ts,)) as cursor:
+            if cursor == None:
+                return None
+            measurement_list = dict()
+            for (time, value) in cursor:
+                measurement_list[time] = value
+            return measurement_list
+
+    # Get the rows newer than each item's high-water mark in one round-trip per value type (and per UNION_BATCH_SIZE items).
+    # high_water_marks: dict < item name, last seen time >. Returns dict < item name, dict < time, value > >.
+    def get_values_since_many(self, high_water_marks) -> dict:
+        batches = self._typed_batches(list(high_water_marks.keys()))
+        values = {oh_item_name: dict() for batch in batches for (oh_item_name, oh_table_name) in batch}
+        # Connect to OH Database
+        with self._cursor('since_many') as cursor:
+            if cursor == None:
+                return None
+            for batch in batches:
+                # Build SQL Query - one time > ? bound per item, served by the time index
+                selects = [f'SELECT {index} AS item_index, time, value FROM {oh_table_name} WHERE time > ?' for index, (oh_item_name, oh_table_name) in enumerate(batch)]
+                query = ' UNION ALL '.join(selects) + ' ORDER BY item_index, time'
+                # Execute SQL Query  
+                cursor.execute(query, tuple(high_water_marks[oh_item_name] for (oh_item_name, oh_table_name) in batch))
+                for (item_index, time, value) in cursor:
+                    values[batch[item_index][0]][time] = value
+        return values
+
+    # Poll several OpenHab items and yield (item name, time, value) for every new row, in time order per item.
+    # Tailing starts after each item's current last row unless since (dict < item name, time >) is given.
+    # Each poll is one query for all items; the generator runs until the caller stops iterating.
+    def tail(self, oh_item_names, interval_secs=TAIL_INTERVAL_SECS, since=None):
+        if since == None:
+            # Retried until it succeeds: starting from TAIL_EPOCH would replay every item's history as new rows
+            last_values = self.get_last_values(oh_item_names)
+            while last_values == None:
+                self._logger.warning('Tail start (last values) failed. Retrying.')
+                sleep(interval_secs)
+                last_values = self.get_last_values(oh_item_names)
+            since = {oh_item_name: last_values[oh_item_name][0] for oh_item_name in last_values}
+        high_water_marks = {oh_item_name: since.get(oh_item_name, self.TAIL_EPOCH) for oh_item_name in oh_item_names}
+        while True:
+            new_values = self.get_values_since_many(high_water_marks)
+            if new_values == None:
+                self._logger.warning('Tail poll failed. Retrying.')
+                new_values = dict()
+            for oh_item_name, measurement_list in new_values.items():
+                for time, value in measurement_list.items():
+                    high_water_marks[oh_item_name] = time
+                    yield (oh_item_name, time, value)
+            sleep(interval_secs)
+
+    # Aggregate an OpenHab item per hour / day / month on the SQL server (start <= time < end, either bound may be None).
+    # Returns an ordered dict < bucket start datetime, dict < fn, value > > with one entry per non-empty bucket.
+    def get_aggregates(self, oh_item_name, start, end, bucket='day', fns=DEFAULT_AGGREGATES) -> dict:
+        if bucket not in self.AGGREGATE_BUCKETS:
+            raise ValueError(f'Unknown aggregate bucket: {bucket}')
+        for fn in fns:
+            if fn not in self.AGGREGATE_FUNCTIONS:
+                raise ValueError(f'Unknown aggregate function: {fn}')
         # Build SQL Query
         oh_table_name = self._get_table_name_from_OH_name(oh_item_name) # In the format itemXXXX
-        query = f"SELECT * FROM {oh_table_name}"
+        bucket_expr = self.AGGREGATE_BUCKETS[bucket]
+        where, params = self._time_range_condition(start, end)
+        columns = ', '.join(self.AGGREGATE_FUNCTIONS[fn] for fn in fns)
+        # first / last come from window functions over each bucket, evaluated in the same pass
+        window_columns = ''
+        if 'first' in fns:
+            window_columns += f', FIRST_VALUE(value) OVER (PARTITION BY {bucket_expr} ORDER BY time ASC) AS first_value'
+        if 'last' in fns:
+            window_columns += f', FIRST_VALUE(value) OVER (PARTITION BY {bucket_expr} ORDER BY time DESC) AS last_value'
+        query = (f'SELECT bucket, {columns} FROM '
+                 f'(SELECT {bucket_expr} AS bucket, time, value{window_columns} FROM {oh_table_name}{where}) AS samples '
+                 f'GROUP BY bucket ORDER BY bucket')
         # Connect to OH Database
-        cursor = self._connect()
-        if cursor == None:
-            return None
-        # Execute SQL Query  
-        cursor.execute(query)
-        # Building dict < item #, item name >
-        measurement_list = dict()
-        for (time, value) in cursor:
-            measurement_list[time] = value
-        return measurement_list
+        with self._cursor('aggregates') as cursor:
+            if cursor == None:
+                return None
+            # Execute SQL Query  
+            cursor.execute(query, params)
+            # Building dict < bucket start, dict < fn, value > >
+            aggregates = dict()
+            for row in cursor:
+                bucket_start = row[0]
+                if not isinstance(bucket_start, datetime):
+                    bucket_start = datetime(bucket_start.year, bucket_start.month, bucket_start.day)
+                aggregates[bucket_start] = dict(zip(fns, row[1:]))
+            return aggregates
 
 def main():
     # Configure Logger
@@ -272,6 +639,12 @@ def main():
     logger.info(f'TEST #6 - Get First Measurements of WS_Temperature for a given day: ' + str(osc.get_first_value_for_day('WS_Temperature', datetime.now())))
     logger.info(f'TEST #7 - Get First Measurements of WS_Temperature for a given month: ' + str(osc.get_first_value_for_month('WS_Temperature', datetime.now())))
     logger.info(f'TEST #8 - Get All Measurements of WS_Temperature: ' + str(len(osc.get_all_values('WS_Temperature'))) + ' measurements')
+    logger.info(f'TEST #9 - Resolve table names: ' + str(osc.resolve_tables(['WS_Temperature', 'Water_Mains_Water_Mains_Count_Scale_Gallons'])))
+    logger.info(f'TEST #10 - Stream Measurements of WS_Temperature for a given day: ' + str(sum(1 for row in osc.iter_values('WS_Temperature', datetime.combine(date.today(), time.min)))) + ' measurements')
+    logger.info(f'TEST #11 - Daily Aggregates of WS_Temperature for this month: ' + str(osc.get_aggregates('WS_Temperature', datetime(date.today().year, date.today().month, 1), None, bucket='day')))
+    logger.info(f'TEST #12 - Get Last Values of several items: ' + str(osc.get_last_values(['WS_Temperature', 'Water_Mains_Water_Mains_Count_Scale_Gallons'])))
+    logger.info(f'TEST #13 - Columnar Measurements of WS_Temperature for a given month: ' + str(osc.get_values_for_month('WS_Temperature', datetime.now(), result=oh_columnar.RESULT_COLUMNAR)))
+    oh_query_stats.shared().log_summary()
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+import oh_sql_client
+import oh_sql_pool
+import oh_columnar
+
+# asyncio front end for oh_sql_client. Queries run on a dedicated executor sized to the connection pool,
+# so a slow historical query never blocks the event loop and dozens of queries can be awaited with asyncio.gather.
+class oh_sql_client_async():
+
+    def __init__(self, logger, pool_size=oh_sql_pool.oh_sql_pool.DEFAULT_MAX_SIZE, client=None) -> None:
+        if logger == None:
+            # Configure Logger
+            logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._logger.info('OH SQL Async Client object init')
+        if client == None:
+            client = oh_sql_client.oh_sql_client(self._logger, pool_size=pool_size)
+        self._client = client
+        # One worker per pooled connection; extra queries queue here instead of holding a thread
+        self._executor = ThreadPoolExecutor(max_workers=self._client._pool_size, thread_name_prefix='oh_sql')
+        # An open stream holds a pooled connection; at most pool size - 1 are open, so other queries always find one
+        self._stream_slots = asyncio.Semaphore(max(1, self._client._pool_size - 1))
+
+    # Run a blocking client call on the executor
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def get_item_list(self) -> dict:
+        return await self._run(self._client.get_item_list)
+
+    async def resolve_tables(self, oh_item_names) -> dict:
+        return await self._run(self._client.resolve_tables, oh_item_names)
+
+    async def get_last_value(self, oh_item_name) -> dict:
+        return await self._run(self._client.get_last_value, oh_item_name)
+
+    async def get_row_count(self, oh_item_name) -> int:
+        return await self._run(self._client.get_row_count, oh_item_name)
+
+    async def get_values_for_day(self, oh_item_name, day, result=oh_columnar.RESULT_RECORDS) -> dict:
+        return await self._run(self._client.get_values_for_day, oh_item_name, day, result)
+
+    async def get_first_value_for_day(self, oh_item_name, day) -> dict:
+        return await self._run(self._client.get_first_value_for_day, oh_item_name, day)
+
+    async def get_values_for_month(self, oh_item_name, month, result=oh_columnar.RESULT_RECORDS) -> dict:
+        return await self._run(self._client.get_values_for_month, oh_item_name, month, result)
+
+    async def get_first_value_for_month(self, oh_item_name, month) -> dict:
+        return await self._run(self._client.get_first_value_for_month, oh_item_name, month)
+
+    async def get_all_values(self, oh_item_name, result=oh_columnar.RESULT_RECORDS) -> dict:
+        return await self._run(self._client.get_all_values, oh_item_name, result)
+
+    async def get_aggregates(self, oh_item_name, start, end, bucket='day', fns=oh_sql_client.oh_sql_client.DEFAULT_AGGREGATES) -> dict:
+        return await self._run(self._client.get_aggregates, oh_item_name, start, end, bucket, fns)
+
+    async def get_values_between(self, oh_item_names, start, end) -> dict:
+        return await self._run(self._client.get_values_between, oh_item_names, start, end)
+
+    async def get_last_values(self, oh_item_names) -> dict:
+        return await self._run(self._client.get_last_values, oh_item_names)
+
+    async def get_values_since(self, oh_item_name, last_ts) -> dict:
+        return await self._run(self._client.get_values_since, oh_item_name, last_ts)
+
+    async def get_values_since_many(self, high_water_marks) -> dict:
+        return await self._run(self._client.get_values_since_many, high_water_marks)
+
+    # Stream (time, value) rows. Each stream fetches its chunks on a thread of its own (the pooled connection it holds
+    # must stay on one thread) and waits for a stream slot before it opens.
+    async def iter_values(self, oh_item_name, start=None, end=None, chunk_size=oh_sql_client.oh_sql_client.ITER_CHUNK_SIZE):
+        loop = asyncio.get_running_loop()
+        async with self._stream_slots:
+            stream_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='oh_sql_stream')
+            rows = self._client.iter_values(oh_item_name, start, end, chunk_size)
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(stream_executor, self._next_chunk, rows, chunk_size)
+                    if len(chunk) == 0:
+                        break
+                    for row in chunk:
+                        yield row
+            finally:
+                # Release the pooled connection held by the generator
+                await loop.run_in_executor(stream_executor, rows.close)
+                stream_executor.shutdown(wait=False)
+
+    def _next_chunk(self, rows, chunk_size) -> list:
+        chunk = list()
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                break
+        return chunk
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._client.close()
+
+async def run_tests(logger):
+    osc = oh_sql_client_async(logger)
+    item_names = ['WS_Temperature', 'Water_Mains_Water_Mains_Count_Scale_Gallons']
+    start = datetime.now()
+    last_values = await asyncio.gather(*[osc.get_last_value(name) for name in item_names])
+    logger.info(f'TEST #1 - Concurrent Last Values: {dict(zip(item_names, last_values))} in {(datetime.now() - start).total_seconds():.3f} s')
+    days = await asyncio.gather(*[osc.get_values_for_day(name, datetime.now()) for name in item_names])
+    logger.info(f'TEST #2 - Concurrent Measurements for today: ' + str([len(day) for day in days]) + ' measurements')
+    osc.close()
+
+def main():
+    # Configure Logger
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s:%(levelname)s:%(message)s")
+    logger = logging.getLogger(__name__)
+    asyncio.run(run_tests(logger))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+'''
+Tests of oh_sql_client against the SQLite stand-in of the OpenHab JDBC schema from bench_sql_client (no MariaDB
+server): the item name -> table index is read once and refreshed when an unknown item is asked for.
+Run with: python -m unittest oh_sql_client_test
+'''
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+import bench_sql_client
+
+# Stand-in client that counts how often the items table is read
+class counting_sql_client(bench_sql_client.sqlite_sql_client):
+
+    def __init__(self, logger, db_path) -> None:
+        self.item_list_reads = 0
+        super().__init__(logger, db_path)
+
+    def get_item_list(self) -> dict:
+        self.item_list_reads += 1
+        return super().get_item_list()
+
+class oh_sql_client_test(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._db_path = os.path.join(self._tmp_dir.name, 'oh_test.db')
+        self._item_names = bench_sql_client.create_stand_in_db(self._db_path, item_count=3, rows_per_item=5)
+        self._client = counting_sql_client(logging.getLogger(__name__), self._db_path)
+
+    def tearDown(self):
+        self._client.close()
+        self._tmp_dir.cleanup()
+
+    def test_item_index_is_read_once(self):
+        self.assertEqual(self._client.resolve_tables(self._item_names), {'Bench_Item_1': 'item0001', 'Bench_Item_2': 'item0002', 'Bench_Item_3': 'item0003'})
+        for item_name in self._item_names:
+            self.assertEqual(self._client.get_row_count(item_name), (5,))
+        self.assertEqual(self._client.item_list_reads, 1)
+
+    def test_unknown_item_refreshes_index(self):
+        self._client.resolve_tables(self._item_names)
+        connection = sqlite3.connect(self._db_path)
+        connection.execute("INSERT INTO items VALUES (4, 'New_Item')")
+        connection.execute('CREATE TABLE item0004 (time DATETIME PRIMARY KEY, value DOUBLE)')
+        connection.commit()
+        connection.close()
+        self.assertEqual(self._client.resolve_tables(['New_Item', 'Bench_Item_1']), {'New_Item': 'item0004', 'Bench_Item_1': 'item0001'})
+        self.assertEqual(self._client.item_list_reads, 2)
+        with self.assertRaises(ValueError):
+            self._client.get_last_value('No_Such_Item')
+        self.assertEqual(self._client.item_list_reads, 3)
+
+if __name__ == "__main__":
+    unittest.main()
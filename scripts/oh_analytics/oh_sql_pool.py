@@ -0,0 +1,159 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Any
+
+# A connection handed out by oh_sql_pool. Only the thread that checked it out may use it.
+class oh_sql_pooled_connection():
+
+    # Prepared cursors kept per connection; the least recently used is closed when the limit is reached
+    MAX_PREPARED_STATEMENTS = 256
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.created = monotonic()
+        self.statements = OrderedDict()
+
+    def cursor(self, **kwargs) -> Any:
+        return self.connection.cursor(**kwargs)
+
+    # Get the cursor that holds the server-side prepared statement for a query, creating it on first use
+    def prepared(self, query, **kwargs) -> Any:
+        cursor = self.statements.get(query)
+        if cursor != None:
+            self.statements.move_to_end(query)
+            return cursor
+        if len(self.statements) >= self.MAX_PREPARED_STATEMENTS:
+            (least_used_query, least_used_cursor) = self.statements.popitem(last=False)
+            least_used_cursor.close()
+        cursor = self.connection.cursor(**kwargs)
+        self.statements[query] = cursor
+        return cursor
+
+    # Liveness check; any error means the server dropped the connection
+    def is_alive(self) -> bool:
+        try:
+            self.connection.ping()
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self.statements.clear()
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+# Bounded, thread-safe pool of SQL connections. Connections are pinged on every checkout and
+# transparently re-opened (with exponential backoff) when the server has dropped them.
+class oh_sql_pool():
+
+    # Pool Defaults
+    DEFAULT_MAX_SIZE = 4
+    CHECKOUT_TIMEOUT_SECS = 30.0
+    CONNECT_ATTEMPTS = 4
+    BACKOFF_INITIAL_SECS = 0.5
+    BACKOFF_MAX_SECS = 8.0
+
+    def __init__(self, logger, connect_fn, max_size=DEFAULT_MAX_SIZE, checkout_timeout_secs=CHECKOUT_TIMEOUT_SECS,
+                 connect_attempts=CONNECT_ATTEMPTS) -> None:
+        if logger == None:
+            self._logger = logging.getLogger(__name__)
+        else:
+            self._logger = logger
+        self._connect_fn = connect_fn
+        self._max_size = max(1, int(max_size))
+        self._checkout_timeout_secs = checkout_timeout_secs
+        self._connect_attempts = max(1, int(connect_attempts))
+        self._idle = list()
+        self._open_count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    # Open a new connection, retrying with exponential backoff. Return None if every attempt failed.
+    def _open(self) -> oh_sql_pooled_connection:
+        backoff_secs = self.BACKOFF_INITIAL_SECS
+        for attempt in range(1, self._connect_attempts + 1):
+            try:
+                self._logger.info('Connecting to SQL Server...')
+                connection = self._connect_fn()
+                self._logger.info('Connected to SQL Server.')
+                return oh_sql_pooled_connection(connection)
+            except Exception as e:
+                self._logger.warning(f'Error connecting to SQL Server (attempt {attempt}/{self._connect_attempts}): {e}')
+                if attempt < self._connect_attempts:
+                    sleep(backoff_secs)
+                    backoff_secs = min(backoff_secs * 2, self.BACKOFF_MAX_SECS)
+        return None
+
+    # Check out a live connection. Return None if the pool is exhausted past the timeout or the server is unreachable.
+    def acquire(self) -> oh_sql_pooled_connection:
+        pooled = None
+        deadline = monotonic() + self._checkout_timeout_secs
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                if len(self._idle) > 0:
+                    pooled = self._idle.pop()
+                    break
+                if self._open_count < self._max_size:
+                    # Reserve a slot; the connection is opened outside the lock
+                    self._open_count += 1
+                    break
+                remaining_secs = deadline - monotonic()
+                if remaining_secs <= 0:
+                    self._logger.warning(f'Timed out waiting for a free SQL connection ({self._max_size} in use)')
+                    return None
+                self._condition.wait(remaining_secs)
+
+        # Replace connections the server has dropped
+        if pooled != None and not pooled.is_alive():
+            self._logger.info('Pooled SQL connection is dead. Reconnecting.')
+            pooled.close()
+            pooled = None
+        if pooled == None:
+            pooled = self._open()
+            if pooled == None:
+                with self._condition:
+                    self._open_count -= 1
+                    self._condition.notify()
+        return pooled
+
+    # Return a connection to the pool. Broken connections are discarded so their slot can be re-opened.
+    def release(self, pooled, discard=False):
+        if pooled == None:
+            return
+        with self._condition:
+            if discard or self._closed:
+                pooled.close()
+                self._open_count -= 1
+            else:
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    # Context manager around acquire / release. Yields None if no connection could be obtained.
+    @contextmanager
+    def connection(self):
+        pooled = self.acquire()
+        discard = False
+        try:
+            yield pooled
+        except Exception:
+            # Query errors leave the connection usable; dropped connections are not
+            discard = pooled != None and not pooled.is_alive()
+            raise
+        finally:
+            self.release(pooled, discard)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            for pooled in self._idle:
+                pooled.close()
+                self._open_count -= 1
+            self._idle.clear()
+            self._condition.notify_all()
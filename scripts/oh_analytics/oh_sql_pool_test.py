@@ -0,0 +1,92 @@
+'''
+Tests of oh_sql_pool with stand-in connections (no SQL server): connections are reused, the pool size is a bound,
+dropped connections are replaced on checkout and a failed connect gives its slot back.
+Run with: python -m unittest oh_sql_pool_test
+'''
+import logging
+import unittest
+import oh_sql_pool
+
+# Connection stand-in whose ping fails once the test marks it dropped
+class standin_connection():
+
+    def __init__(self, number) -> None:
+        self.number = number
+        self.alive = True
+        self.closed = False
+
+    def ping(self):
+        if not self.alive:
+            raise ConnectionError('Server has gone away')
+
+    def close(self):
+        self.closed = True
+
+# connect_fn that hands out numbered connections, or raises while failing is set
+class standin_server():
+
+    def __init__(self) -> None:
+        self.connections = list()
+        self.failing = False
+
+    def connect(self) -> standin_connection:
+        if self.failing:
+            raise ConnectionError('Connection refused')
+        connection = standin_connection(len(self.connections) + 1)
+        self.connections.append(connection)
+        return connection
+
+class oh_sql_pool_test(unittest.TestCase):
+
+    def _pool(self, server, max_size=2) -> oh_sql_pool.oh_sql_pool:
+        return oh_sql_pool.oh_sql_pool(logging.getLogger(__name__), server.connect, max_size, checkout_timeout_secs=0, connect_attempts=1)
+
+    def test_connections_are_reused(self):
+        server = standin_server()
+        pool = self._pool(server)
+        for n in range(5):
+            with pool.connection() as pooled:
+                self.assertEqual(pooled.connection.number, 1)
+        self.assertEqual(len(server.connections), 1)
+
+    def test_size_is_bounded(self):
+        server = standin_server()
+        pool = self._pool(server)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertIsNone(pool.acquire())
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        pool.release(second)
+        self.assertEqual(len(server.connections), 2)
+
+    def test_dropped_connection_is_replaced(self):
+        server = standin_server()
+        pool = self._pool(server)
+        with pool.connection() as pooled:
+            pooled.connection.alive = False
+        with pool.connection() as pooled:
+            self.assertEqual(pooled.connection.number, 2)
+        self.assertTrue(server.connections[0].closed)
+
+    def test_failed_connect_frees_its_slot(self):
+        server = standin_server()
+        pool = self._pool(server, max_size=1)
+        server.failing = True
+        with pool.connection() as pooled:
+            self.assertIsNone(pooled)
+        server.failing = False
+        with pool.connection() as pooled:
+            self.assertEqual(pooled.connection.number, 1)
+
+    def test_closed_pool_hands_out_nothing(self):
+        server = standin_server()
+        pool = self._pool(server)
+        with pool.connection():
+            pass
+        pool.close()
+        self.assertTrue(server.connections[0].closed)
+        self.assertIsNone(pool.acquire())
+
+if __name__ == "__main__":
+    unittest.main()
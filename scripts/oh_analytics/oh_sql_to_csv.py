@@ -1,10 +1,10 @@
 from os import times
+import sys
 import oh_sql_client
 import datetime
 
 # Create a CSV for a OH uid
 # TODO
-#   - specify timespan
 #   - multiple uids w/ harmonized timestamps
 
 def print_ln(line):
@@ -37,16 +37,38 @@ def all_values_to_csv():
 
     oh_client = oh_sql_client.oh_sql_client(None)
     csv_file_all_values = open(f'{item_values_file_prefix}_{oh_uid}_values_{timestamp()}.csv', 'w')
-    all_values = oh_client.get_all_values(oh_uid)
-    # Print / write to disk
-    for ts, value in all_values.items():
+    # Stream rows straight to disk; the table is never held in memory
+    for ts, value in oh_client.iter_values(oh_uid):
         line = f'{ts},{value}'
         print_ln(line)
         csv_file_all_values.write(line+'\n')
     csv_file_all_values.close()   
 
 
-def main():
+# Print the values of several OH uids between start and end to one csv file (item,timestamp,value)
+def values_between_to_csv(oh_uids, start, end):
+    oh_client = oh_sql_client.oh_sql_client(None)
+    csv_file_values = open(f'{item_values_file_prefix}s_values_{timestamp()}.csv', 'w')
+    # One query for all uids
+    values = oh_client.get_values_between(oh_uids, start, end)
+    if values == None:
+        values = dict()
+    # Print / write to disk
+    for oh_uid, item_values in values.items():
+        for ts, value in item_values.items():
+            line = f'{oh_uid},{ts},{value}'
+            print_ln(line)
+            csv_file_values.write(line+'\n')
+    csv_file_values.close()
+
+# oh_sql_to_csv.py                             - item list and all values of one uid
+# oh_sql_to_csv.py <start> <end> <uid> [<uid> ...] - values of the uids for start <= time < end (ISO dates / times)
+def main(args=None):
+    if args == None:
+        args = sys.argv[1:]
+    if len(args) >= 3:
+        values_between_to_csv(args[2:], datetime.datetime.fromisoformat(args[0]), datetime.datetime.fromisoformat(args[1]))
+        return
     items_to_csv()
     all_values_to_csv()
 
@@ -0,0 +1,135 @@
+'''
+Incremental Server-Sent Events parser for the OpenHab event stream (/rest/events). Lines are fed as they arrive;
+each blank line completes a message (event:, data: - possibly over several lines - id: and retry: fields). The
+message data is the OpenHab event JSON whose payload is itself a JSON string, so it is decoded with a second
+json.loads into typed event objects.
+'''
+import json
+import re
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+# OpenHab event types
+ITEM_STATE_CHANGED_EVENT = 'ItemStateChangedEvent'
+
+# json.loads minus its per-call wrappers, which cost as much as the decoding of these short documents
+_raw_decode = json.JSONDecoder().raw_decode
+
+# One SSE message
+class oh_sse_message(NamedTuple):
+    event: str
+    data: str
+    id: Optional[str]
+    retry: Optional[int]
+
+# Any OpenHab event; the payload is decoded when it is JSON
+class oh_event(NamedTuple):
+    topic: str
+    type: str
+    payload: object
+    id: Optional[str]
+
+# openhab/items/<item>/statechanged. time is the persisted time of a change replayed from the database
+# (None for live events).
+class oh_item_state_changed(NamedTuple):
+    item: str
+    value: str
+    value_type: str
+    old_value: str
+    old_type: str
+    id: Optional[str]
+    time: Optional[datetime] = None
+
+class oh_sse_parser():
+
+    # SSE line ends. str.splitlines would also split on characters like U+2028 that may occur inside event data.
+    LINE_END = re.compile(r'\r\n|\r|\n')
+
+    def __init__(self) -> None:
+        self._event = ''
+        self._data = list()
+        # The last event id carries over to the following messages (SSE spec)
+        self._last_id = None
+        self._retry = None
+        self._partial = ''
+
+    # Feed one line without its line terminator; returns the message a blank line completes, else None
+    def feed_line(self, line) -> Optional[oh_sse_message]:
+        if line.startswith('data: '):
+            self._data.append(line[6:])
+            return None
+        if line == '':
+            return self._dispatch()
+        if line.startswith(':'):
+            # Comment / keep-alive
+            return None
+        field, colon, value = line.partition(':')
+        if colon and value.startswith(' '):
+            value = value[1:]
+        if field == 'data':
+            self._data.append(value)
+        elif field == 'event':
+            self._event = value
+        elif field == 'id':
+            if '\0' not in value:
+                self._last_id = value
+        elif field == 'retry':
+            if value.isdigit():
+                self._retry = int(value)
+        return None
+
+    # Feed a chunk of the stream (any split, \n, \r\n or \r line ends); returns the messages it completes
+    def feed(self, chunk) -> list:
+        messages = list()
+        text = self._partial + chunk
+        # A trailing \r may be the first half of \r\n; keep it for the next chunk
+        held = '\r' if text.endswith('\r') else ''
+        lines = self.LINE_END.split(text[:len(text) - len(held)])
+        # The last piece has no line end yet
+        self._partial = lines.pop() + held
+        feed_line = self.feed_line
+        for line in lines:
+            message = feed_line(line)
+            if message != None:
+                messages.append(message)
+        return messages
+
+    def _dispatch(self) -> Optional[oh_sse_message]:
+        if len(self._data) == 0:
+            self._event = ''
+            return None
+        message = oh_sse_message(self._event or 'message', '\n'.join(self._data), self._last_id, self._retry)
+        self._event = ''
+        self._data = list()
+        return message
+
+def _loads(text):
+    text = text.strip()
+    (value, end) = _raw_decode(text)
+    if end != len(text):
+        raise ValueError(f'Extra data after JSON: {text[end:end + 20]}')
+    return value
+
+# Typed event of a message: oh_item_state_changed for item state changes, oh_event for anything else.
+# Raises ValueError for data that is not an OpenHab event.
+def parse_event(message):
+    event = _loads(message.data)
+    if not isinstance(event, dict) or 'topic' not in event:
+        raise ValueError(f'Not an OpenHab event: {message.data[:80]}')
+    payload = event.get('payload')
+    if isinstance(payload, str):
+        try:
+            payload = _loads(payload)
+        except ValueError:
+            pass
+    if event.get('type') == ITEM_STATE_CHANGED_EVENT and isinstance(payload, dict):
+        return oh_item_state_changed(event['topic'].split('/')[2], payload.get('value'), payload.get('type'),
+                                     payload.get('oldValue'), payload.get('oldType'), message.id)
+    return oh_event(event['topic'], event.get('type'), payload, message.id)
+
+# Typed events of a stream of text chunks (e.g. requests' iter_content(chunk_size=None, decode_unicode=True))
+def iter_events(chunks):
+    parser = oh_sse_parser()
+    for chunk in chunks:
+        for message in parser.feed(chunk):
+            yield parse_event(message)
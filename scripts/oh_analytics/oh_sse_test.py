@@ -0,0 +1,64 @@
+'''
+Tests of oh_sse: messages come out the same however the stream is split into chunks and whichever line ends it
+uses, SSE fields follow the spec, and OpenHab events decode to typed events with their values intact.
+Run with: python -m unittest oh_sse_test
+'''
+import json
+import unittest
+import oh_sse
+
+# SSE data line of an OpenHab state change whose payload is a JSON string
+def state_changed_data(item, value, old_value='UNDEF') -> str:
+    payload = json.dumps({'type': 'String', 'value': value, 'oldType': 'String', 'oldValue': old_value})
+    return json.dumps({'topic': f'openhab/items/{item}/statechanged', 'payload': payload, 'type': 'ItemStateChangedEvent'})
+
+STREAM = ': keepalive\n\nevent: message\nid: 7\ndata: ' + state_changed_data('Front_Door', 'OPEN') + '\n\n' \
+         'retry: 3000\ndata: ' + state_changed_data('Song', 'Now playing "Blue" {live}', 'C:\\temp') + '\n\n'
+
+class oh_sse_test(unittest.TestCase):
+
+    def _messages(self, chunks) -> list:
+        parser = oh_sse.oh_sse_parser()
+        return [message for chunk in chunks for message in parser.feed(chunk)]
+
+    def test_any_chunk_split(self):
+        expected = self._messages([STREAM])
+        self.assertEqual(len(expected), 2)
+        for split in range(1, len(STREAM)):
+            self.assertEqual(self._messages([STREAM[:split], STREAM[split:]]), expected)
+        self.assertEqual(self._messages(list(STREAM)), expected)
+
+    def test_line_ends(self):
+        expected = self._messages([STREAM])
+        for line_end in ('\r\n', '\r'):
+            # A final \r may be the first half of \r\n: the parser waits for the next chunk (here a keep-alive)
+            stream = (STREAM + ': keepalive\n').replace('\n', line_end)
+            self.assertEqual(self._messages([stream]), expected)
+        # A \r\n split between two chunks is one line end
+        stream = STREAM.replace('\n', '\r\n')
+        for split in [n + 1 for n in range(len(stream)) if stream.startswith('\r\n', n)]:
+            self.assertEqual(self._messages([stream[:split], stream[split:]]), expected)
+
+    def test_fields(self):
+        messages = self._messages(['data: first\ndata: second\nid: 1\n\n', 'event: alert\ndata: third\n\n', 'data\n\n', 'id: 2\n\n'])
+        self.assertEqual(messages, [oh_sse.oh_sse_message('message', 'first\nsecond', '1', None),
+                                    oh_sse.oh_sse_message('alert', 'third', '1', None),
+                                    oh_sse.oh_sse_message('message', '', '1', None)])
+        # The id of a message without data carries over to the next one
+        self.assertEqual(self._messages(['id: 3\n\n', 'retry: 500\ndata: x\n\n']), [oh_sse.oh_sse_message('message', 'x', '3', 500)])
+
+    def test_item_state_changes(self):
+        events = list(oh_sse.iter_events([STREAM[:100], STREAM[100:]]))
+        self.assertEqual(events, [oh_sse.oh_item_state_changed('Front_Door', 'OPEN', 'String', 'UNDEF', 'String', '7'),
+                                  oh_sse.oh_item_state_changed('Song', 'Now playing "Blue" {live}', 'String', 'C:\\temp', 'String', '7')])
+
+    def test_other_events_and_errors(self):
+        data = json.dumps({'topic': 'openhab/things/zwave/status', 'payload': '{"status":"ONLINE"}', 'type': 'ThingStatusInfoEvent'})
+        event = oh_sse.parse_event(oh_sse.oh_sse_message('message', data, None, None))
+        self.assertEqual(event, oh_sse.oh_event('openhab/things/zwave/status', 'ThingStatusInfoEvent', {'status': 'ONLINE'}, None))
+        for data in ('not json', '[1, 2]', '{"topic": "a"} trailing'):
+            with self.assertRaises(ValueError):
+                oh_sse.parse_event(oh_sse.oh_sse_message('message', data, None, None))
+
+if __name__ == "__main__":
+    unittest.main()
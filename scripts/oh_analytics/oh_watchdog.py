@@ -22,24 +22,23 @@ class OpenHabWatchDog:
         items_list = osc.get_item_list()
         print(f"Checking {len(items_list)} OpenHab items.")
 
+        # Get the last data point of every monitored item in one round-trip
+        monitored_items = [name for name in items_list.values() if not self._in_ignore_list(name)]
+        last_values = osc.get_last_values(monitored_items)
+        if last_values == None:
+            last_values = dict()
+
         # Iterate through all items and check last
-        for name in items_list.values():
+        for name, last_data in last_values.items():
             try:
-                # Check if item is to be ignored
-                if self._in_ignore_list(name):
-                    pass
-                else:
-                    # Get last data point
-                    last_data = osc.get_last_value(name)
-                    timestamp = last_data[0]
-                    time_span = datetime.now() - last_data[0]
-                    #print(f"{name} last reported at {time_span.total_seconds()} seconds ago")
-                    timeout = self._config.default_timeout_seconds
-                    if self._in_per_item_list(name):
-                        # Over-write timeout if in the per-item list. E.g. Enphase Battery charge reports every 45 mintues.
-                        timeout = self._config.per_item_timeout[name]
-                    if time_span.total_seconds() > timeout:
-                        stale_items[name] = int(time_span.total_seconds())
+                time_span = datetime.now() - last_data[0]
+                #print(f"{name} last reported at {time_span.total_seconds()} seconds ago")
+                timeout = self._config.default_timeout_seconds
+                if self._in_per_item_list(name):
+                    # Over-write timeout if in the per-item list. E.g. Enphase Battery charge reports every 45 mintues.
+                    timeout = self._config.per_item_timeout[name]
+                if time_span.total_seconds() > timeout:
+                    stale_items[name] = int(time_span.total_seconds())
             except:
                 pass
         